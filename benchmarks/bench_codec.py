@@ -0,0 +1,106 @@
+"""Microbenchmark del codec de metrics_server contra el camino Pydantic/json.
+
+Uso:  python -m benchmarks.bench_codec [--videos 500] [--cuentas 20000]
+
+Mide decode de payloads de /metrics/ingest y encode de respuestas de
+/users/active y /scrape/schedule con datos parecidos a los reales.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from metrics_server import codec
+from metrics_server.metrics_server import MetricsPayload, POST_SCHEDULE_FIELDS
+
+
+def payload_ingest(n_videos):
+    videos = []
+    for i in range(n_videos):
+        video_id = f"{7300000000000000000 + random.randrange(10**15)}"
+        videos.append({
+            "video_id": video_id,
+            "views": random.randrange(0, 5_000_000),
+            "likes": random.randrange(0, 200_000),
+            "shares": random.randrange(0, 20_000),
+            "url": f"https://www.tiktok.com/@clipper_{i % 50}/video/{video_id}",
+        })
+    body = {"discord_id": "412345678901234567", "platform": "tiktok", "videos": videos, "lease_id": None}
+    return json.dumps(body).encode()
+
+
+def cuentas_activas(n):
+    # Tuplas con el orden del SELECT (discord_id, username, platform, id), como un Record
+    return [(str(400000000000000000 + i), f"clipper_{i}", "tiktok", i) for i in range(n)]
+
+
+def posts_schedule(n):
+    ahora = datetime(2025, 1, 1)
+    return [
+        (str(400000000000000000 + i), f"https://www.tiktok.com/@c/video/{i}", str(i),
+         random.randrange(10**6), i % 7 == 0, round(random.random() * 500, 2), ahora + timedelta(minutes=i))
+        for i in range(n)
+    ]
+
+
+def medir(nombre, fn, bytes_por_op, minimo=1.0):
+    fn()  # calentamiento
+    ops, inicio = 0, time.perf_counter()
+    while True:
+        fn()
+        ops += 1
+        transcurrido = time.perf_counter() - inicio
+        if transcurrido >= minimo:
+            break
+    por_seg = ops / transcurrido
+    print(f"  {nombre:<38} {por_seg:>10,.1f} ops/s  {por_seg * bytes_por_op / 1e6:>8,.1f} MB/s")
+    return por_seg
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=500)
+    parser.add_argument("--cuentas", type=int, default=20000)
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--segundos", type=float, default=1.0)
+    args = parser.parse_args()
+    random.seed(42)
+
+    print(f"codec: orjson={'sí' if codec.orjson else 'no'}  msgspec={'sí' if codec.msgspec else 'no'}\n")
+
+    body = payload_ingest(args.videos)
+    print(f"📩 Decode /metrics/ingest ({args.videos} videos, {len(body) / 1024:.0f} KiB)")
+    base = medir("pydantic (json.loads + validate)", lambda: MetricsPayload(**json.loads(body)), len(body), args.segundos)
+    rapido = medir("codec.decodificar_metricas", lambda: codec.decodificar_metricas(body, MetricsPayload), len(body), args.segundos)
+    print(f"  → x{rapido / base:.1f}\n")
+
+    cuentas = cuentas_activas(args.cuentas)
+    campos = ("discord_id", "username", "platform")
+    dicts = [dict(zip(campos, c)) for c in cuentas]
+    filas = codec.filas_json(cuentas, campos)
+    tam = len(codec.array_json(filas))
+    print(f"👥 Encode /users/active ({args.cuentas} cuentas, {tam / 1024:.0f} KiB)")
+    base = medir("dict por fila + json.dumps", lambda: json.dumps([dict(zip(campos, c)) for c in cuentas], separators=(",", ":")).encode(), tam, args.segundos)
+    medir("codec.filas_json (carga de cache)", lambda: codec.array_json(codec.filas_json(cuentas, campos)), tam, args.segundos)
+    rapido = medir("página desde cache (join de bytes)", lambda: codec.array_json(filas), tam, args.segundos)
+    medir("json.dumps de dicts ya armados", lambda: json.dumps(dicts, separators=(",", ":")).encode(), tam, args.segundos)
+    print(f"  → x{rapido / base:.1f} por request\n")
+
+    posts = posts_schedule(args.posts)
+    tam = len(codec.array_json(codec.filas_json(posts, POST_SCHEDULE_FIELDS)))
+    print(f"🗓️ Encode /scrape/schedule ({args.posts} posts, {tam / 1024:.0f} KiB)")
+
+    def fastapi_default():
+        rows = [dict(zip(POST_SCHEDULE_FIELDS, p)) for p in posts]
+        return json.dumps(jsonable_encoder({"posts": rows})).encode()
+
+    base = medir("dicts + jsonable_encoder + json", fastapi_default, tam, args.segundos)
+    rapido = medir("codec.filas_json", lambda: codec.array_json(codec.filas_json(posts, POST_SCHEDULE_FIELDS)), tam, args.segundos)
+    print(f"  → x{rapido / base:.1f}")
+
+
+if __name__ == "__main__":
+    main()
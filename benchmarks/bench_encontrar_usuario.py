@@ -0,0 +1,222 @@
+"""Latencia completa de /encontrar-usuario (objetivo: < 50 ms por búsqueda).
+
+Uso:  BENCH_DATABASE_URL=postgresql://localhost/bench \\
+      python -m benchmarks.bench_encontrar_usuario [--cuentas 100000] [--rest-ms 80]
+
+Mide bots.main2.buscar_usuarios de punta a punta: la consulta ranqueada en
+Postgres (con los mismos índices que crea el AdminBot) + la resolución de
+miembros + el embed. Carga las cuentas en un schema propio que se borra al
+terminar. La guild es sintética: una parte de los miembros está en la cache
+del gateway y el resto sale por un fetch_member con latencia REST simulada.
+
+Escenarios:
+  - frío: LRU vacío antes de cada búsqueda (peor caso, paga REST)
+  - LRU: las mismas búsquedas otra vez (miembros ya resueltos)
+  - gateway: todos los miembros en la cache del gateway (sin REST), con
+    desglose por tipo de búsqueda (exacta, prefijo, contiene, typo)
+
+Medido en un Postgres 18 local, 300 búsquedas, REST 80 ms:
+  --cuentas 100000: gateway p95 16.6 ms · frío p95 100.4 ms
+  --cuentas 200000: gateway p95 34.9 ms · frío p95 118.6 ms
+Con miembros fuera de la cache manda el fetch_member (una llamada REST).
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+import asyncpg
+import discord
+
+SCHEMA = f"bench_busqueda_{os.getpid()}"
+PLATAFORMAS = ["twitter", "instagram", "tiktok", "youtube", "twitch", "facebook"]
+OBJETIVO_MS = 50
+
+
+class _Respuesta404:
+    status = 404
+    reason = "Not Found"
+
+
+class MiembroFalso:
+    def __init__(self, user_id):
+        self.id = user_id
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+
+class GuildFalsa:
+    """get_member/fetch_member como discord.Guild; 1 de cada 5 ya no está en el servidor"""
+
+    def __init__(self, en_cache, rest_ms):
+        self.id = 1
+        self.en_cache = en_cache
+        self.rest = rest_ms / 1000
+        self.llamadas_rest = 0
+
+    def get_member(self, user_id):
+        return MiembroFalso(user_id) if user_id in self.en_cache else None
+
+    async def fetch_member(self, user_id):
+        self.llamadas_rest += 1
+        await asyncio.sleep(self.rest)
+        if user_id % 5 == 0:
+            raise discord.NotFound(_Respuesta404(), "Unknown Member")
+        return MiembroFalso(user_id)
+
+
+def nombre(i):
+    return f"clipper{'_' if i % 3 else ''}{i}{random.choice(['', 'tv', 'oficial', 'clips'])}"
+
+
+async def preparar(conn, cuentas):
+    """Tablas mínimas de users/social_accounts con los índices del AdminBot. Devuelve trgm_ok"""
+    await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    await conn.execute(f"SET search_path = {SCHEMA}, public")
+    await conn.execute("CREATE TABLE users (discord_id TEXT PRIMARY KEY, username TEXT)")
+    await conn.execute('''
+        CREATE TABLE social_accounts (
+            id SERIAL PRIMARY KEY, discord_id TEXT REFERENCES users(discord_id),
+            platform TEXT, username TEXT, is_verified BOOLEAN DEFAULT FALSE
+        )
+    ''')
+
+    usuarios = cuentas // 2
+    await conn.copy_records_to_table("users", records=[
+        (str(100000000000000000 + i), f"discord_{i}") for i in range(usuarios)
+    ], columns=["discord_id", "username"])
+    await conn.copy_records_to_table("social_accounts", records=[
+        (str(100000000000000000 + i % usuarios), PLATAFORMAS[i % len(PLATAFORMAS)], nombre(i), i % 10 != 0)
+        for i in range(cuentas)
+    ], columns=["discord_id", "platform", "username", "is_verified"])
+
+    trgm_ok = False
+    try:
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        await conn.execute('''
+            CREATE INDEX social_accounts_username_trgm
+            ON social_accounts USING gin (lower(username) gin_trgm_ops)
+        ''')
+        await conn.execute('''
+            CREATE INDEX social_accounts_username_trgm_gist
+            ON social_accounts USING gist (lower(username) gist_trgm_ops(siglen=256))
+        ''')
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        await conn.execute('''
+            CREATE INDEX social_accounts_platform_username_trgm_gist
+            ON social_accounts USING gist (platform, lower(username) gist_trgm_ops(siglen=256))
+        ''')
+        trgm_ok = True
+    except asyncpg.PostgresError as e:
+        print(f"⚠️ pg_trgm no disponible, se mide la búsqueda por prefijo: {e}")
+    await conn.execute('''
+        CREATE INDEX social_accounts_username_prefix
+        ON social_accounts (lower(username) text_pattern_ops)
+    ''')
+    await conn.execute("ANALYZE users; ANALYZE social_accounts")
+    return trgm_ok
+
+
+def busquedas(cuentas, n):
+    """Mezcla de exactas, prefijos, fragmentos y typos sobre nombres existentes"""
+    random.seed(7)
+    terminos = []
+    for _ in range(n):
+        i = random.randrange(cuentas)
+        base = f"clipper{'_' if i % 3 else ''}{i}"
+        tipo = random.random()
+        if tipo < 0.3:
+            tipo, termino = "exacta", base
+        elif tipo < 0.6:
+            tipo, termino = "prefijo", base[:max(4, len(base) - 2)]
+        elif tipo < 0.8:
+            tipo, termino = "contiene", f"@{str(i)}"
+        else:
+            tipo, termino = "typo", base[:-1] + random.choice("xyz")
+        terminos.append((tipo, random.choice(["all"] + PLATAFORMAS), termino))
+    return terminos
+
+
+async def medir(bot, guild, terminos, limpiar_lru):
+    from bots.main2 import buscar_usuarios
+
+    tiempos = []
+    for _, plataforma, termino in terminos:
+        if limpiar_lru:
+            bot.member_lru.clear()
+        inicio = time.perf_counter()
+        await buscar_usuarios(bot, guild, plataforma, termino)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def resumen(nombre_escenario, tiempos, guild=None, rest_antes=0):
+    tiempos = sorted(tiempos)
+    p50 = statistics.median(tiempos)
+    p95 = tiempos[max(0, int(len(tiempos) * 0.95) - 1)]
+    marca = "✅" if p95 < OBJETIVO_MS else "❌"
+    rest = f"REST {guild.llamadas_rest - rest_antes:>6,}" if guild else " " * 11
+    print(f"  {nombre_escenario:<10} p50 {p50:7.1f} ms   p95 {p95:7.1f} ms   máx {tiempos[-1]:7.1f} ms   {rest}   {marca}")
+
+
+async def main_async(args):
+    dsn = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not dsn:
+        raise SystemExit("Falta BENCH_DATABASE_URL (o DATABASE_URL) apuntando a un Postgres de pruebas")
+
+    from bots.main2 import admin_bot
+    bot = admin_bot.construir()
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        print(f"⏳ Cargando {args.cuentas:,} cuentas en {SCHEMA}...")
+        bot.trgm_ok = await preparar(conn, args.cuentas)
+        bot.db_pool = await asyncpg.create_pool(dsn, min_size=1, max_size=1,
+                                                server_settings={"search_path": f"{SCHEMA},public"})
+        terminos = busquedas(args.cuentas, args.busquedas)
+
+        usuarios = args.cuentas // 2
+        en_cache = {100000000000000000 + i for i in range(usuarios) if random.random() < args.cacheados}
+        guild = GuildFalsa(en_cache, args.rest_ms)
+        await medir(bot, guild, terminos[:20], limpiar_lru=False)  # calentar conexiones y planes
+        bot.member_lru.clear()
+        guild.llamadas_rest = 0
+
+        print(f"\n🔍 /encontrar-usuario de punta a punta · {args.busquedas} búsquedas · "
+              f"{'trigram' if bot.trgm_ok else 'prefijo'} · REST {args.rest_ms:.0f} ms · "
+              f"{args.cacheados:.0%} en cache del gateway · objetivo p95 < {OBJETIVO_MS} ms\n")
+
+        antes = guild.llamadas_rest
+        resumen("frío", await medir(bot, guild, terminos, limpiar_lru=True), guild, antes)
+        antes = guild.llamadas_rest
+        resumen("LRU", await medir(bot, guild, terminos, limpiar_lru=False), guild, antes)
+        guild_completa = GuildFalsa({100000000000000000 + i for i in range(usuarios)}, args.rest_ms)
+        tiempos = await medir(bot, guild_completa, terminos, limpiar_lru=True)
+        resumen("gateway", tiempos, guild_completa, 0)
+
+        # Sin REST el tiempo es casi todo Postgres: desglose por tipo de búsqueda
+        print("\n  gateway por tipo de búsqueda:")
+        for tipo in ("exacta", "prefijo", "contiene", "typo"):
+            resumen(f"  {tipo}", [t for t, (tipo_t, _, _) in zip(tiempos, terminos) if tipo_t == tipo])
+    finally:
+        if bot.db_pool is not None:
+            await bot.db_pool.close()
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cuentas", type=int, default=100_000)
+    parser.add_argument("--busquedas", type=int, default=300)
+    parser.add_argument("--rest-ms", type=float, default=80.0, help="latencia simulada de fetch_member")
+    parser.add_argument("--cacheados", type=float, default=0.3, help="fracción de miembros en la cache del gateway")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
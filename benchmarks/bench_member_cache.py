@@ -0,0 +1,121 @@
+"""Memoria residente de cada bot con una guild sintética grande.
+
+Uso:  python -m benchmarks.bench_member_cache [--miembros 100000]
+
+Cada escenario corre en un proceso nuevo: construye el bot con su política
+de intents/cache (bots/gateway.py), carga una guild con N miembros a través
+del ConnectionState de discord.py y cachea los miembros solo si la política
+lo haría (chunk al arrancar, o chunk a pedido tras /backup-servidor).
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# escenario -> (módulo, atributo del bot, forzar política legacy, simular chunk a pedido)
+ESCENARIOS = {
+    "main": ("bots.main", "main_bot", False, False),
+    "admin (idle)": ("bots.main2", "admin_bot", False, False),
+    "admin (tras backup)": ("bots.main2", "admin_bot", False, True),
+    "equipos": ("bots.main3", "bot", False, False),
+    "legacy (por bot)": ("bots.main2", "admin_bot", True, False),
+}
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def datos_guild(guild_id, miembros):
+    return {
+        "id": str(guild_id), "name": "Guild sintética", "member_count": miembros,
+        "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0,
+                   "color": 0, "hoist": False, "managed": False, "mentionable": False, "flags": 0}],
+        "emojis": [], "stickers": [], "channels": [], "threads": [], "features": [],
+        "owner_id": "1", "verification_level": 0, "default_message_notifications": 0,
+        "explicit_content_filter": 0, "mfa_level": 0, "premium_tier": 0, "nsfw_level": 0,
+        "preferred_locale": "es-ES", "large": True, "unavailable": False,
+    }
+
+
+def datos_miembro(i):
+    return {
+        "user": {"id": str(100000000000000000 + i), "username": f"clipper_{i}", "discriminator": "0",
+                 "global_name": f"Clipper {i}", "avatar": None},
+        "roles": [], "joined_at": "2024-05-01T12:00:00+00:00", "deaf": False, "mute": False, "flags": 0,
+    }
+
+
+def correr_escenario(nombre, miembros):
+    import discord
+    modulo, atributo, legacy, chunk_a_pedido = ESCENARIOS[nombre]
+    bot = getattr(__import__(modulo, fromlist=[atributo]), atributo).construir()
+    state = bot._connection
+
+    if legacy:
+        # Lo que tenían los 3 bots antes: default + members + message_content, chunk al arrancar
+        intents = discord.Intents.default()
+        intents.members = intents.message_content = True
+        state._intents = intents
+        state.member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+        state._chunk_guilds = True
+
+    gc.collect()
+    base = rss_mb()
+
+    guild = state._add_guild_from_data(datos_guild(1, miembros))
+    # chunk_guild(cache=None) de discord.py cachea si member_cache_flags.joined
+    cachea = state.member_cache_flags.joined and (state._chunk_guilds or chunk_a_pedido)
+    for i in range(miembros):
+        miembro = discord.Member(data=datos_miembro(i), guild=guild, state=state)
+        if cachea:
+            guild._add_member(miembro)
+    del miembro
+    gc.collect()
+
+    return {"escenario": nombre, "cacheados": len(guild._members), "base_mb": base, "rss_mb": rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--miembros", type=int, default=100_000)
+    parser.add_argument("--escenario", choices=list(ESCENARIOS))
+    args = parser.parse_args()
+
+    if args.escenario:
+        print(json.dumps(correr_escenario(args.escenario, args.miembros)))
+        return
+
+    env = dict(os.environ)
+    env.setdefault("DISCORD_GUILD_ID", "1")
+    print(f"🧠 RSS por bot con una guild de {args.miembros:,} miembros\n")
+    print(f"  {'escenario':<22} {'cacheados':>10} {'base MB':>9} {'RSS MB':>9} {'Δ MB':>8}")
+    resultados = {}
+    for nombre in ESCENARIOS:
+        salida = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_member_cache", "--escenario", nombre, "--miembros", str(args.miembros)],
+            cwd=RAIZ, env=env, check=True, capture_output=True, text=True,
+        ).stdout.strip().splitlines()[-1]
+        r = json.loads(salida)
+        resultados[nombre] = r["rss_mb"] - r["base_mb"]
+        print(f"  {nombre:<22} {r['cacheados']:>10,} {r['base_mb']:>9.1f} {r['rss_mb']:>9.1f} {resultados[nombre]:>8.1f}")
+
+    antes = 3 * resultados["legacy (por bot)"]
+    ahora = resultados["main"] + resultados["admin (tras backup)"] + resultados["equipos"]
+    print(f"\n  Cache de miembros, 3 bots: antes ≈ {antes:.0f} MB · ahora ≈ {ahora:.0f} MB (peor caso, admin tras backup)")
+
+
+if __name__ == "__main__":
+    main()
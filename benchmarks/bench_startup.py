@@ -0,0 +1,92 @@
+"""Benchmark de arranque: imports y cold start hasta el primer request.
+
+Uso:  python -m benchmarks.bench_startup [--repeticiones 5]
+
+1. Tiempo de import (proceso nuevo cada vez) del metrics_server solo vs. el
+   camino de start_all (los 3 bots + metrics_server).
+2. Cold start de `python -m metrics_server` hasta el primer 200 de /healthz.
+   Necesita DATABASE_URL (el startup conecta el pool); sin ella se omite.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTS = {
+    "metrics_server solo": "import metrics_server.metrics_server",
+    "start_all (3 bots + metrics)": "import start_all, bots.main, bots.main2, bots.main3, metrics_server.metrics_server",
+}
+
+
+def entorno():
+    env = dict(os.environ)
+    env.setdefault("DISCORD_GUILD_ID", "0")  # main3 lo lee al importarse
+    return env
+
+
+def tiempo_import(codigo, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, env=entorno(), check=True)
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cold_start(timeout=60):
+    puerto = puerto_libre()
+    env = entorno()
+    env.update(PORT=str(puerto), HOST="127.0.0.1", LOG_LEVEL="warning")
+    inicio = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "metrics_server"], cwd=RAIZ, env=env)
+    try:
+        while time.perf_counter() - inicio < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"metrics_server terminó con código {proc.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{puerto}/healthz", timeout=1) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - inicio
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError("metrics_server no respondió a tiempo")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def resumen(tiempos):
+    return f"mediana {statistics.median(tiempos) * 1000:7.0f} ms  (min {min(tiempos) * 1000:.0f} ms)"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    print("📦 Tiempo de import (proceso nuevo)")
+    for nombre, codigo in IMPORTS.items():
+        print(f"  {nombre:<30} {resumen(tiempo_import(codigo, args.repeticiones))}")
+
+    print("\n🚀 Cold start → primer /healthz")
+    if not os.getenv("DATABASE_URL"):
+        print("  (omitido: falta DATABASE_URL)")
+        return
+    tiempos = [cold_start() for _ in range(args.repeticiones)]
+    print(f"  {'python -m metrics_server':<30} {resumen(tiempos)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+import hashlib
+import json
+import os
+import zlib
+
+# ====================================================
+#   BACKUPS DIRECCIONADOS POR CONTENIDO
+# ====================================================
+# Cada backup es una lista ordenada de chunks (server_backup_chunks) que apuntan
+# a su contenido comprimido en backup_chunk_store por hash SHA-256. Los cortes
+# entre chunks dependen del discord_id (no de la posición), así que un miembro
+# que cambia solo reescribe su chunk y el resto se comparte entre snapshots.
+
+# Un miembro cierra chunk si crc32(id) % CHUNK_TARGET == 0 (~64 miembros por chunk)
+CHUNK_TARGET = int(os.getenv("BACKUP_CHUNK_TARGET", "64"))
+CHUNK_MAX = 512
+# Backups que conservamos por servidor antes de recortar la cadena
+BACKUP_RETENTION = int(os.getenv("BACKUP_RETENTION", "30"))
+
+# Un escritor puede reusar un hash del store antes de insertar su referencia:
+# mientras tanto el chunk parece huérfano. Los escritores toman este advisory
+# lock compartido y el GC lo pide exclusivo, así nunca se cruzan.
+LOCK_CHUNKS = "hashtext('backup_chunk_store')"
+
+
+def es_frontera(discord_id: str) -> bool:
+    return zlib.crc32(discord_id.encode()) % CHUNK_TARGET == 0
+
+
+def empaquetar(registros):
+    """Devuelve (hash, datos comprimidos) de un chunk de registros"""
+    canonico = json.dumps(registros, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+    return hashlib.sha256(canonico).hexdigest(), zlib.compress(canonico, 6)
+
+
+def desempaquetar(data: bytes):
+    return json.loads(zlib.decompress(data))
+
+
+async def crear_tablas(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS backup_chunk_store (
+            hash TEXT PRIMARY KEY,
+            data BYTEA,
+            member_count INTEGER,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    ''')
+    await conn.execute("ALTER TABLE server_backup_chunks ADD COLUMN IF NOT EXISTS chunk_hash TEXT")
+    await conn.execute("CREATE INDEX IF NOT EXISTS server_backup_chunks_hash_idx ON server_backup_chunks (chunk_hash)")
+    await conn.execute("ALTER TABLE server_backups ADD COLUMN IF NOT EXISTS parent_id INTEGER REFERENCES server_backups(id) ON DELETE SET NULL")
+
+
+async def bloquear_gc(conn):
+    """Dentro de una transacción: el GC no borra chunks del store hasta el commit.
+    Hay que llamarlo antes de leer los hashes que se van a reusar."""
+    await conn.execute(f"SELECT pg_advisory_xact_lock_shared({LOCK_CHUNKS})")
+
+
+class EscritorBackup:
+    """Recibe registros ordenados por discord_id y los guarda como chunks deduplicados"""
+
+    def __init__(self, conn, backup_id, hashes_conocidos=(), seq_inicial=0):
+        self.conn = conn
+        self.backup_id = backup_id
+        self.seq_inicial = seq_inicial
+        self.conocidos = set(hashes_conocidos)
+        self.buffer = []
+        self.refs = []
+        self.chunks_nuevos = 0
+        self.bytes_nuevos = 0
+
+    async def agregar(self, registro):
+        self.buffer.append(registro)
+        if es_frontera(registro["discord_id"]) or len(self.buffer) >= CHUNK_MAX:
+            await self._volcar()
+
+    async def _volcar(self):
+        if not self.buffer:
+            return
+        digest, data = empaquetar(self.buffer)
+        if digest not in self.conocidos:
+            # Solo escribimos el contenido que no existía en el snapshot anterior
+            await self.conn.execute('''
+                INSERT INTO backup_chunk_store (hash, data, member_count)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (hash) DO NOTHING
+            ''', digest, data, len(self.buffer))
+            self.conocidos.add(digest)
+            self.chunks_nuevos += 1
+            self.bytes_nuevos += len(data)
+        self.refs.append((self.backup_id, self.seq_inicial + len(self.refs), len(self.buffer), digest))
+        self.buffer = []
+
+    async def cerrar(self):
+        await self._volcar()
+        await self.conn.copy_records_to_table(
+            "server_backup_chunks",
+            records=self.refs,
+            columns=["backup_id", "seq", "member_count", "chunk_hash"]
+        )
+        return {"chunks": len(self.refs), "chunks_nuevos": self.chunks_nuevos, "bytes_nuevos": self.bytes_nuevos}
+
+
+async def hashes_de_backup(conn, backup_id):
+    if backup_id is None:
+        return set()
+    rows = await conn.fetch("SELECT chunk_hash FROM server_backup_chunks WHERE backup_id = $1 AND chunk_hash IS NOT NULL", backup_id)
+    return {r["chunk_hash"] for r in rows}
+
+
+async def iterar_chunks(conn, backup_id, lote=32):
+    """Genera (hash, registros) en orden. Soporta los tres formatos guardados:
+    backup_data JSONB (antiguo), chunks con JSON en línea y chunks por hash."""
+    refs = await conn.fetch('''
+        SELECT seq, chunk_hash FROM server_backup_chunks
+        WHERE backup_id = $1 ORDER BY seq
+    ''', backup_id)
+
+    if not refs:
+        # JSON completo: Postgres lo desarma y ordena, y llega por cursor (hace falta una transacción)
+        registros = []
+        async for fila in conn.cursor('''
+            SELECT e FROM server_backups b, jsonb_array_elements(b.backup_data) e
+            WHERE b.id = $1 ORDER BY e->>'discord_id' COLLATE "C"
+        ''', backup_id):
+            registros.append(json.loads(fila["e"]))
+            if len(registros) >= CHUNK_MAX:
+                yield None, registros
+                registros = []
+        if registros:
+            yield None, registros
+        return
+
+    for i in range(0, len(refs), lote):
+        grupo = refs[i:i + lote]
+        hashes = [r["chunk_hash"] for r in grupo if r["chunk_hash"]]
+        store = {}
+        if hashes:
+            store = {
+                r["hash"]: r["data"]
+                for r in await conn.fetch("SELECT hash, data FROM backup_chunk_store WHERE hash = ANY($1::text[])", hashes)
+            }
+        for ref in grupo:
+            if ref["chunk_hash"]:
+                yield ref["chunk_hash"], desempaquetar(store[ref["chunk_hash"]])
+            else:
+                data = await conn.fetchval(
+                    "SELECT data FROM server_backup_chunks WHERE backup_id = $1 AND seq = $2",
+                    backup_id, ref["seq"]
+                )
+                yield None, json.loads(data)
+
+
+async def iterar_registros(conn, backup_id):
+    async for _, registros in iterar_chunks(conn, backup_id):
+        for registro in registros:
+            yield registro
+
+
+async def compactar_backup(conn, backup_id):
+    """Pasa un backup en formato antiguo (JSON completo o en bloques) a chunks por hash.
+
+    Los registros ya salen ordenados por discord_id, así que se reescriben de a
+    uno sin cargar el backup entero. Las refs nuevas van después de las viejas
+    (seq mayores) y al final se borran las viejas: el orden por seq se mantiene.
+    """
+    async with conn.transaction():
+        await bloquear_gc(conn)
+        base = await conn.fetchval(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM server_backup_chunks WHERE backup_id = $1", backup_id
+        )
+        escritor = EscritorBackup(conn, backup_id, seq_inicial=base)
+        async for registro in iterar_registros(conn, backup_id):
+            await escritor.agregar(registro)
+        await escritor.cerrar()
+        await conn.execute("DELETE FROM server_backup_chunks WHERE backup_id = $1 AND seq < $2", backup_id, base)
+        await conn.execute("UPDATE server_backups SET backup_data = NULL WHERE id = $1", backup_id)
+
+
+async def aplicar_retencion(conn, guild_id=None, conservar=BACKUP_RETENTION):
+    """Recorta las cadenas viejas, compacta lo que queda en formato antiguo y
+    borra los chunks que ya no referencia ningún backup"""
+    borrados = await conn.fetch('''
+        DELETE FROM server_backups
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY guild_id ORDER BY id DESC) AS pos
+                FROM server_backups
+                WHERE $1::bigint IS NULL OR guild_id = $1
+            ) ranked
+            WHERE pos > $2
+        )
+        RETURNING id
+    ''', guild_id, conservar)
+
+    antiguos = await conn.fetch('''
+        SELECT b.id FROM server_backups b
+        WHERE ($1::bigint IS NULL OR b.guild_id = $1)
+          AND (b.backup_data IS NOT NULL
+               OR EXISTS (SELECT 1 FROM server_backup_chunks c WHERE c.backup_id = b.id AND c.chunk_hash IS NULL))
+    ''', guild_id)
+    for row in antiguos:
+        await compactar_backup(conn, row["id"])
+
+    # Con un backup en curso no se recolecta: sus chunks reusados todavía no tienen referencia.
+    # No esperamos al lock (un backup tarda minutos); lo huérfano se libera en la próxima pasada.
+    liberados = 0
+    async with conn.transaction():
+        if await conn.fetchval(f"SELECT pg_try_advisory_xact_lock({LOCK_CHUNKS})"):
+            resultado = await conn.execute('''
+                DELETE FROM backup_chunk_store s
+                WHERE NOT EXISTS (SELECT 1 FROM server_backup_chunks c WHERE c.chunk_hash = s.hash)
+            ''')
+            liberados = int(resultado.split()[-1])
+    return {
+        "backups_borrados": len(borrados),
+        "backups_compactados": len(antiguos),
+        "chunks_liberados": liberados,
+    }
+
+
+# ====================================================
+#   RESTAURAR Y COMPARAR
+# ====================================================
+
+async def restaurar_backup(conn, backup_id, reemplazar=False, lote=5000):
+    """Recarga users y social_accounts desde un backup con COPY en una transacción.
+
+    Sin `reemplazar` solo agrega/actualiza; con `reemplazar` además borra las
+    cuentas de los miembros respaldados que no estaban en el backup.
+    """
+    async with conn.transaction():
+        await conn.execute('''
+            CREATE TEMP TABLE restore_members (discord_id TEXT, username TEXT, has_accounts BOOLEAN) ON COMMIT DROP;
+            CREATE TEMP TABLE restore_accounts (discord_id TEXT, platform TEXT, username TEXT, is_verified BOOLEAN) ON COMMIT DROP;
+        ''')
+
+        miembros, cuentas = [], []
+
+        async def volcar():
+            if miembros:
+                await conn.copy_records_to_table("restore_members", records=miembros)
+                miembros.clear()
+            if cuentas:
+                await conn.copy_records_to_table("restore_accounts", records=cuentas)
+                cuentas.clear()
+
+        async for registro in iterar_registros(conn, backup_id):
+            sociales = registro.get("cuentas_sociales") or []
+            miembros.append((registro["discord_id"], registro.get("username"), bool(sociales)))
+            for c in sociales:
+                cuentas.append((registro["discord_id"], c["platform"], c["username"], bool(c.get("verified"))))
+            if len(miembros) >= lote:
+                await volcar()
+        await volcar()
+
+        # Solo existen en users los miembros que tenían cuentas vinculadas
+        usuarios = await conn.execute('''
+            INSERT INTO users (discord_id, username)
+            SELECT discord_id, username FROM restore_members WHERE has_accounts
+            ON CONFLICT (discord_id) DO UPDATE SET username = EXCLUDED.username
+        ''')
+
+        borradas = "DELETE 0"
+        if reemplazar:
+            borradas = await conn.execute('''
+                DELETE FROM social_accounts sa
+                USING restore_members rm
+                WHERE sa.discord_id = rm.discord_id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM restore_accounts ra
+                      WHERE ra.discord_id = sa.discord_id AND ra.platform = sa.platform AND ra.username = sa.username
+                  )
+            ''')
+
+        restauradas = await conn.execute('''
+            INSERT INTO social_accounts (discord_id, platform, username, verification_code, is_verified, verified_at)
+            SELECT DISTINCT ON (discord_id, platform, username)
+                   discord_id, platform, username,
+                   'CLIP' || discord_id || UPPER(LEFT(platform, 3)),
+                   is_verified, CASE WHEN is_verified THEN NOW() END
+            FROM restore_accounts
+            ON CONFLICT (discord_id, platform, username) DO UPDATE SET
+                is_verified = EXCLUDED.is_verified,
+                verified_at = CASE WHEN EXCLUDED.is_verified THEN COALESCE(social_accounts.verified_at, NOW()) END
+        ''')
+
+        await conn.execute("SELECT pg_notify('social_accounts_changed', '')")
+
+    return {
+        "usuarios": int(usuarios.split()[-1]),
+        "cuentas": int(restauradas.split()[-1]),
+        "cuentas_borradas": int(borradas.split()[-1]),
+    }
+
+
+def _normalizar(registro):
+    cuentas = sorted(
+        (c["platform"], c["username"], bool(c.get("verified"))) for c in registro.get("cuentas_sociales") or []
+    )
+    return registro.get("username"), cuentas
+
+
+class _Lector:
+    """Recorre un backup registro a registro. Los chunks se leen de
+    backup_chunk_store recién cuando hay que compararlos"""
+
+    def __init__(self, conn, backup_id, lote=32):
+        self.conn = conn
+        self.backup_id = backup_id
+        self.lote = lote
+        self.refs = []
+        self.sig = 0            # próximo chunk de refs por leer
+        self.omitibles = set()  # hashes que también tiene el otro backup: no se precargan
+        self.datos = {}         # hash -> datos comprimidos ya traídos
+        self.registros = []
+        self.pos = 0
+
+    async def abrir(self):
+        self.refs = await self.conn.fetch('''
+            SELECT seq, chunk_hash FROM server_backup_chunks
+            WHERE backup_id = $1 ORDER BY seq
+        ''', self.backup_id)
+        if not self.refs:
+            legacy = await self.conn.fetchval("SELECT backup_data FROM server_backups WHERE id = $1", self.backup_id)
+            if legacy:
+                self.registros = sorted(json.loads(legacy), key=lambda r: r["discord_id"])
+
+    def hashes(self):
+        return {r["chunk_hash"] for r in self.refs if r["chunk_hash"]}
+
+    def proximo_hash(self):
+        """Hash del próximo chunk si estamos justo en un borde (sin leerlo)"""
+        if self.pos < len(self.registros) or self.sig >= len(self.refs):
+            return None
+        return self.refs[self.sig]["chunk_hash"]
+
+    def saltar_chunk(self):
+        self.sig += 1
+
+    async def _traer(self, actual):
+        # Un solo SELECT para este chunk y los próximos que difieren del otro backup
+        faltan = [
+            r["chunk_hash"] for r in self.refs[self.sig:self.sig + self.lote]
+            if r["chunk_hash"] and r["chunk_hash"] not in self.omitibles and r["chunk_hash"] not in self.datos
+        ]
+        if actual not in faltan:
+            faltan.append(actual)
+        for r in await self.conn.fetch("SELECT hash, data FROM backup_chunk_store WHERE hash = ANY($1::text[])", faltan):
+            self.datos[r["hash"]] = r["data"]
+
+    async def _leer_chunk(self):
+        ref = self.refs[self.sig]
+        self.sig += 1
+        self.pos = 0
+        if not ref["chunk_hash"]:
+            data = await self.conn.fetchval(
+                "SELECT data FROM server_backup_chunks WHERE backup_id = $1 AND seq = $2",
+                self.backup_id, ref["seq"]
+            )
+            self.registros = json.loads(data)
+        else:
+            if ref["chunk_hash"] not in self.datos:
+                await self._traer(ref["chunk_hash"])
+            self.registros = desempaquetar(self.datos.pop(ref["chunk_hash"]))
+
+    async def actual(self):
+        while self.pos >= len(self.registros):
+            if self.sig >= len(self.refs):
+                return None
+            await self._leer_chunk()
+        return self.registros[self.pos]
+
+
+async def diferencias(conn, backup_a, backup_b):
+    """Genera (tipo, discord_id, antes, despues) entre dos backups sin cargarlos
+    enteros. Los hashes se comparan antes de leer el store: los chunks
+    idénticos en los dos lados no se traen ni se descomprimen"""
+    a, b = _Lector(conn, backup_a), _Lector(conn, backup_b)
+    await a.abrir()
+    await b.abrir()
+    a.omitibles = b.omitibles = a.hashes() & b.hashes()
+
+    while True:
+        ha, hb = a.proximo_hash(), b.proximo_hash()
+        if ha is not None and ha == hb:
+            # Chunk idéntico en los dos snapshots: nada que comparar
+            a.saltar_chunk()
+            b.saltar_chunk()
+            continue
+        ra, rb = await a.actual(), await b.actual()
+        if ra is None and rb is None:
+            break
+        if rb is None or (ra is not None and ra["discord_id"] < rb["discord_id"]):
+            yield "removed", ra["discord_id"], ra, None
+            a.pos += 1
+        elif ra is None or rb["discord_id"] < ra["discord_id"]:
+            yield "added", rb["discord_id"], None, rb
+            b.pos += 1
+        else:
+            if _normalizar(ra) != _normalizar(rb):
+                yield "changed", ra["discord_id"], ra, rb
+            a.pos += 1
+            b.pos += 1
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+
+import discord
+
+from bots import outbound
+
+# ====================================================
+#   RENDER DE CAMPAÑAS PUBLICADAS
+# ====================================================
+# El embed de una campaña se arma desde la fila de `campaigns` + la tarifa
+# vigente de su tag en payment_rates. Guardamos un hash del contenido que se
+# publicó (campaigns.render_hash): cuando cambian tarifas o campos, se
+# recalcula el contenido de cada campaña y solo se editan los mensajes cuyo
+# hash cambió, pasando por la cola de salida del bot.
+
+
+async def crear_tablas(conn):
+    await conn.execute("ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS rate_key TEXT")
+    await conn.execute("ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS render_hash TEXT")
+    await conn.execute("ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS rendered_at TIMESTAMP")
+    await conn.execute("CREATE INDEX IF NOT EXISTS campaigns_rate_key_idx ON campaigns (rate_key)")
+    # Campañas viejas: /publicar-campaña dejaba la tarifa con descripción 'Campaña: <nombre>'
+    await conn.execute('''
+        UPDATE campaigns c SET rate_key = r.rate_key
+        FROM payment_rates r
+        WHERE c.rate_key IS NULL AND r.description = 'Campaña: ' || c.name
+    ''')
+
+
+def contenido_campana(camp, precio=None):
+    """Todo lo que se ve en el mensaje de la campaña, como dict serializable"""
+    tag = camp['rate_key'] or "REVISA-EL-TAG"
+    base = f" (Base: ${precio:g}/1k)" if precio is not None else ""
+    texto = f"""
+**{camp['description']}** 🔥
+
+## 🚀 Cómo participar
+**TAG PARA SUBIR:** `{tag}` 👈 (Selecciona este tag en `/upload`)
+
+## Detalles de campaña
+**Categoría:** {camp['category']}
+**Plataformas:** {camp['platforms'] or 'TikTok, Instagram, Youtube'}
+**Audiencia:** Global 🌎
+
+## Detalles de pago 💸
+**Sistema de pago:** {camp['payrate']}{base}
+**Minimo de Views para Pago:** 10,000 views
+**Método de Pago:** PayPal
+
+## Únete al servidor ➡️
+Click en el boton debajo para Empezar!
+"""
+    return {
+        "title": f"✨ {camp['name']} x Latin Clipping",
+        "description": texto,
+        "thumbnail": camp['thumbnail_url'],
+        "footer": f"ID: {camp['id']} | TAG ACTIVO: {tag} | 🚨 Violacion de reglas = Ban",
+        "invite_link": camp['invite_link'],
+    }
+
+
+def huella(contenido) -> str:
+    canonico = json.dumps(contenido, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonico.encode()).hexdigest()
+
+
+class JoinButton(discord.ui.View):
+    def __init__(self, link):
+        super().__init__()
+        self.add_item(discord.ui.Button(label="Join Server", style=discord.ButtonStyle.link, url=link, emoji="➡️"))
+
+
+def mensaje_campana(contenido):
+    """kwargs para send()/edit() a partir del contenido"""
+    embed = discord.Embed(title=contenido["title"], description=contenido["description"], color=0x00ff00)
+    if contenido["thumbnail"]:
+        embed.set_thumbnail(url=contenido["thumbnail"])
+    embed.set_footer(text=contenido["footer"])
+    return {"embed": embed, "view": JoinButton(contenido["invite_link"])}
+
+
+async def campanas_publicadas(conn, ids=None, rate_key=None):
+    """Campañas con mensaje publicado + su tarifa vigente (filtrables por id o tag)"""
+    return await conn.fetch('''
+        SELECT c.*, r.amount_per_1k
+        FROM campaigns c
+        LEFT JOIN payment_rates r ON r.rate_key = c.rate_key
+        WHERE c.message_id IS NOT NULL AND c.channel_id IS NOT NULL
+          AND ($1::int[] IS NULL OR c.id = ANY($1))
+          AND ($2::text IS NULL OR c.rate_key = $2)
+        ORDER BY c.id
+    ''', list(ids) if ids is not None else None, rate_key)
+
+
+async def marcar_renderizadas(conn, ids, hashes):
+    if ids:
+        await conn.execute('''
+            UPDATE campaigns c SET render_hash = r.hash, rendered_at = NOW()
+            FROM unnest($1::int[], $2::text[]) AS r(id, hash)
+            WHERE c.id = r.id
+        ''', ids, hashes)
+
+
+async def rerenderizar(bot, ids=None, rate_key=None, forzar=False, prioridad=outbound.MASIVA):
+    """Edita los mensajes de campaña cuyo contenido cambió. Devuelve un reporte"""
+    async with bot.db_pool.acquire() as conn:
+        filas = await campanas_publicadas(conn, ids, rate_key)
+
+    reporte = {"revisadas": len(filas), "sin_cambios": 0, "editadas": 0, "sin_mensaje": [], "errores": []}
+    cambios = []
+    for camp in filas:
+        precio = float(camp['amount_per_1k']) if camp['amount_per_1k'] is not None else None
+        contenido = contenido_campana(camp, precio)
+        nuevo = huella(contenido)
+        if nuevo == camp['render_hash'] and not forzar:
+            reporte["sin_cambios"] += 1
+            continue
+        canal = bot.get_channel(int(camp['channel_id'])) or bot.get_partial_messageable(int(camp['channel_id']))
+        mensaje = canal.get_partial_message(int(camp['message_id']))
+        cambios.append((camp['id'], nuevo, bot.salida.editar(mensaje, prioridad=prioridad, **mensaje_campana(contenido))))
+
+    resultados = await asyncio.gather(*(f for _, _, f in cambios), return_exceptions=True)
+    ok_ids, ok_hashes = [], []
+    for (camp_id, nuevo, _), resultado in zip(cambios, resultados):
+        if isinstance(resultado, discord.NotFound):
+            reporte["sin_mensaje"].append(camp_id)
+        elif isinstance(resultado, Exception):
+            reporte["errores"].append((camp_id, str(resultado)[:100]))
+        else:
+            ok_ids.append(camp_id)
+            ok_hashes.append(nuevo)
+    reporte["editadas"] = len(ok_ids)
+
+    async with bot.db_pool.acquire() as conn:
+        await marcar_renderizadas(conn, ok_ids, ok_hashes)
+    return reporte
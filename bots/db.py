@@ -1,17 +1,165 @@
+import asyncio
 import asyncpg
 import os
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# ====================================================
+#   RÉPLICA DE LECTURA (opcional)
+# ====================================================
+# Con DATABASE_REPLICA_URL las lecturas marcadas (acquire_lectura) van a la
+# réplica mientras su atraso sea <= DATABASE_REPLICA_MAX_LAG segundos. Si la
+# réplica está atrasada o caída, se lee del primario. Todo lo demás (acquire,
+# fetch, execute...) sigue yendo al primario como siempre.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REPLICA_MAX_LAG = float(os.getenv("DATABASE_REPLICA_MAX_LAG", "5"))
+REPLICA_POOL_MAX = int(os.getenv("DATABASE_REPLICA_POOL_MAX", "5"))
+REPLICA_CHECK_EVERY = 2.0    # cada cuánto se vuelve a medir el atraso
+REPLICA_RETRY_AFTER = 30.0   # tras una caída, cuánto esperamos para reintentar
+
+# El atraso se mide contra el WAL actual del primario: se lee primero
+# pg_current_wal_lsn() en el primario y después se mira si la réplica ya lo
+# reprodujo. Comparar receive_lsn con replay_lsn no sirve: una réplica que
+# perdió al primario reprodujo todo lo que recibió y daría 0 con datos viejos.
+LSN_PRIMARIO_SQL = "SELECT pg_current_wal_lsn()::text"
+
+# Segundos de atraso; NULL = en recovery pero sin WAL receiver (desconectada).
+# Fuera de recovery (ej. una base de pruebas) no hay WAL que esperar: 0.
+LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN NULL
+        WHEN pg_last_wal_replay_lsn() >= $1::text::pg_lsn THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 'Infinity')
+    END::float8
+'''
+
+ERRORES_CONEXION = (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError)
+
+
+class RouterDB:
+    """Se usa como un pool de asyncpg (todo al primario) + acquire_lectura() para lecturas"""
+
+    def __init__(self, primario, replica_dsn=None, max_lag=REPLICA_MAX_LAG, **opciones):
+        self.primario = primario
+        self.replica = None
+        self.replica_dsn = replica_dsn
+        self.max_lag = max_lag
+        self._opciones = opciones
+        self.lag = None
+        self._medido = 0.0
+        self._caida_hasta = 0.0
+        self._lock = asyncio.Lock()
+        self.contadores = {"replica": 0, "primario_por_lag": 0, "primario_por_caida": 0}
+
+    def __getattr__(self, nombre):
+        # fetch, execute, release, close... van al primario
+        return getattr(self.primario, nombre)
+
+    def acquire(self, **kwargs):
+        return self.primario.acquire(**kwargs)
+
+    def _marcar_caida(self, error):
+        if time.monotonic() >= self._caida_hasta:
+            print(f"⚠️ Réplica de lectura no disponible, leo del primario por {REPLICA_RETRY_AFTER:.0f}s: {error}")
+        self._caida_hasta = time.monotonic() + REPLICA_RETRY_AFTER
+        self.lag = None
+
+    async def _lag_replica(self):
+        """Atraso de la réplica (cacheado unos segundos) o None si no se puede usar"""
+        if time.monotonic() < self._caida_hasta:
+            return None
+        if self.replica is not None and time.monotonic() - self._medido < REPLICA_CHECK_EVERY:
+            return self.lag
+
+        async with self._lock:
+            if time.monotonic() - self._medido < REPLICA_CHECK_EVERY and self.replica is not None:
+                return self.lag
+            try:
+                if self.replica is None:
+                    # Conexiones de solo lectura: si alguien escribe por error, falla
+                    self.replica = await asyncpg.create_pool(
+                        self.replica_dsn, **{**self._opciones, "min_size": 1, "max_size": REPLICA_POOL_MAX},
+                        server_settings={"default_transaction_read_only": "on"}
+                    )
+                lsn = await asyncio.wait_for(self.primario.fetchval(LSN_PRIMARIO_SQL), timeout=2)
+                lag = await asyncio.wait_for(self.replica.fetchval(LAG_SQL, lsn), timeout=2)
+            except ERRORES_CONEXION as e:
+                self._marcar_caida(e)
+                return None
+            if lag is None:
+                self._marcar_caida("sin WAL receiver (no recibe del primario)")
+                return None
+            self.lag = lag
+            self._medido = time.monotonic()
+        return self.lag
+
+    @asynccontextmanager
+    async def acquire_lectura(self, max_lag=None):
+        """Conexión para consultas de solo lectura (réplica si está al día)"""
+        limite = self.max_lag if max_lag is None else max_lag
+        if self.replica_dsn:
+            lag = await self._lag_replica()
+            if lag is None:
+                self.contadores["primario_por_caida"] += 1
+            elif lag > limite:
+                self.contadores["primario_por_lag"] += 1
+            else:
+                try:
+                    conn = await self.replica.acquire(timeout=2)
+                except ERRORES_CONEXION as e:
+                    self._marcar_caida(e)
+                    self.contadores["primario_por_caida"] += 1
+                else:
+                    self.contadores["replica"] += 1
+                    try:
+                        yield conn
+                    finally:
+                        await self.replica.release(conn)
+                    return
+
+        async with self.primario.acquire() as conn:
+            yield conn
+
+    def estado(self):
+        """Resumen para /info"""
+        if not self.replica_dsn:
+            return "sin réplica"
+        total = sum(self.contadores.values()) or 1
+        if time.monotonic() < self._caida_hasta:
+            salud = "🔴 caída"
+        elif self.lag is None:
+            salud = "⚪ sin medir"
+        else:
+            salud = f"{'🟢' if self.lag <= self.max_lag else '🟡'} atraso {self.lag:.1f}s"
+        return f"{salud} · {self.contadores['replica'] * 100 // total}% de lecturas en réplica"
+
+    async def close(self):
+        if self.replica is not None:
+            await self.replica.close()
+        await self.primario.close()
+
+
+async def crear_router(dsn=None, replica_dsn=None, max_lag=REPLICA_MAX_LAG, **opciones):
+    """Pool primario + réplica opcional (DATABASE_REPLICA_URL si no se pasa replica_dsn)"""
+    primario = await asyncpg.create_pool(dsn or DATABASE_URL, **opciones)
+    replica_dsn = replica_dsn if replica_dsn is not None else DATABASE_REPLICA_URL
+    opciones.pop("min_size", None)
+    opciones.pop("max_size", None)
+    return RouterDB(primario, replica_dsn, max_lag, **opciones)
+
+
 _pool = None
 
 async def get_pool():
     global _pool
     if _pool is None:
-        _pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=5)
+        _pool = await crear_router(DATABASE_URL, min_size=1, max_size=5)
     return _pool
 
 async def register_user(discord_id, username):
@@ -26,7 +174,7 @@ async def register_user(discord_id, username):
 
 async def get_user(discord_id):
     pool = await get_pool()
-    async with pool.acquire() as conn:
+    async with pool.acquire_lectura() as conn:
         row = await conn.fetchrow("""
             SELECT * FROM users WHERE discord_id = $1;
         """, discord_id)
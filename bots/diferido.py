@@ -0,0 +1,56 @@
+from discord import app_commands
+
+# ====================================================
+#   BOT DIFERIDO (la instancia se crea al arrancar)
+# ====================================================
+# Los módulos de bots registran sus comandos con `@xxx_bot.tree.command(...)`
+# al importarse. Con BotDiferido ese decorador solo guarda el comando; el
+# Bot real (intents, tree, estado) se construye la primera vez que se usa,
+# y ahí se le agregan todos los comandos registrados.
+
+
+class ArbolDiferido:
+    def __init__(self, dueno):
+        self._dueno = dueno
+        self.comandos = []
+
+    def command(self, *, guild=None, guilds=None, **kwargs):
+        def decorador(func):
+            cmd = app_commands.command(**kwargs)(func)
+            self.comandos.append((cmd, guild, guilds))
+            return cmd
+        return decorador
+
+    def __getattr__(self, nombre):
+        # sync(), get_commands(), etc. van al tree del bot real
+        return getattr(self._dueno.construir().tree, nombre)
+
+
+class BotDiferido:
+    def __init__(self, fabrica):
+        self._fabrica = fabrica
+        self._bot = None
+        self.tree = ArbolDiferido(self)
+
+    @property
+    def construido(self):
+        return self._bot is not None
+
+    def construir(self):
+        if self._bot is None:
+            bot = self._fabrica()
+            for cmd, guild, guilds in self.tree.comandos:
+                kwargs = {"guild": guild} if guild else {"guilds": guilds} if guilds else {}
+                bot.tree.add_command(cmd, **kwargs)
+            self._bot = bot
+        return self._bot
+
+    def __getattr__(self, nombre):
+        return getattr(self.construir(), nombre)
+
+    async def __aenter__(self):
+        await self.construir().__aenter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        return await self._bot.__aexit__(*exc)
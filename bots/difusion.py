@@ -0,0 +1,237 @@
+import asyncio
+import time
+from datetime import datetime
+
+import discord
+
+from bots import outbound
+
+# ====================================================
+#   DIFUSIÓN DE ANUNCIOS (muchos canales / DMs)
+# ====================================================
+# Una difusión es una fila en announcement_fanouts + una fila por destino en
+# announcement_deliveries (canal o usuario). El estado de cada entrega vive en
+# la DB, así que si el bot se cae a mitad se retoma donde quedó:
+#   pending -> sending (reclamada por páginas con SKIP LOCKED) -> sent / failed
+# Lo que quedó en 'sending' al caerse no se sabe si salió: al reanudar pasa a
+# 'unknown' y NO se reenvía (preferimos perder un aviso a mandarlo dos veces).
+# El envío va por la cola de salida del bot (prioridad MASIVA) con un tope de
+# entregas en vuelo.
+
+CONCURRENCIA = 8
+PAGINA = 200
+
+
+async def crear_tablas(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS announcement_fanouts (
+            id SERIAL PRIMARY KEY,
+            guild_id BIGINT,
+            title TEXT,
+            message TEXT,
+            created_by TEXT,
+            author_name TEXT,
+            status TEXT DEFAULT 'running',
+            total INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT NOW(),
+            finished_at TIMESTAMP
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS announcement_deliveries (
+            fanout_id INTEGER REFERENCES announcement_fanouts(id) ON DELETE CASCADE,
+            target_type TEXT,
+            target_id BIGINT,
+            status TEXT DEFAULT 'pending',
+            message_id BIGINT,
+            error TEXT,
+            attempts INTEGER DEFAULT 0,
+            delivered_at TIMESTAMP,
+            PRIMARY KEY (fanout_id, target_type, target_id)
+        )
+    ''')
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS announcement_deliveries_pending_idx
+        ON announcement_deliveries (fanout_id) WHERE status IN ('pending', 'sending')
+    ''')
+
+
+def embed_anuncio(titulo, mensaje, autor, fecha=None):
+    """Embed oficial de anuncio (mismo formato en /crear-anuncio y en difusiones)"""
+    embed = discord.Embed(
+        title=f"📢 {titulo}",
+        description=mensaje,
+        color=0xffd700,
+        timestamp=fecha or datetime.now()
+    )
+    embed.add_field(
+        name="ℹ️ Información",
+        value="Este es un anuncio oficial del servidor",
+        inline=False
+    )
+    embed.set_footer(text=f"Anuncio por {autor}")
+    return embed
+
+
+async def crear_difusion(conn, guild_id, titulo, mensaje, creado_por, autor,
+                         canales=(), usuarios=(), creadores_verificados=False):
+    """Registra la difusión y todos sus destinos; devuelve (fanout_id, total)"""
+    async with conn.transaction():
+        fanout_id = await conn.fetchval('''
+            INSERT INTO announcement_fanouts (guild_id, title, message, created_by, author_name)
+            VALUES ($1, $2, $3, $4, $5) RETURNING id
+        ''', guild_id, titulo, mensaje, creado_por, autor)
+
+        await conn.execute('''
+            INSERT INTO announcement_deliveries (fanout_id, target_type, target_id)
+            SELECT $1, 'channel', unnest($2::bigint[])
+            ON CONFLICT DO NOTHING
+        ''', fanout_id, list(canales))
+        await conn.execute('''
+            INSERT INTO announcement_deliveries (fanout_id, target_type, target_id)
+            SELECT $1, 'user', unnest($2::bigint[])
+            ON CONFLICT DO NOTHING
+        ''', fanout_id, list(usuarios))
+        if creadores_verificados:
+            # Creadores con al menos una cuenta verificada, directo desde la DB
+            await conn.execute(r'''
+                INSERT INTO announcement_deliveries (fanout_id, target_type, target_id)
+                SELECT DISTINCT $1, 'user', discord_id::bigint
+                FROM social_accounts
+                WHERE is_verified = TRUE AND discord_id ~ '^\d{15,21}$'
+                ON CONFLICT DO NOTHING
+            ''', fanout_id)
+
+        total = await conn.fetchval(
+            "UPDATE announcement_fanouts SET total = (SELECT COUNT(*) FROM announcement_deliveries WHERE fanout_id = $1) WHERE id = $1 RETURNING total",
+            fanout_id
+        )
+    return fanout_id, total
+
+
+async def resumen(conn, fanout_id):
+    filas = await conn.fetch(
+        "SELECT status, COUNT(*) AS n FROM announcement_deliveries WHERE fanout_id = $1 GROUP BY status",
+        fanout_id
+    )
+    return {f['status']: f['n'] for f in filas}
+
+
+async def _entregar(bot, destino_tipo, destino_id, embed):
+    """Una entrega; devuelve (status, message_id, error)"""
+    try:
+        if destino_tipo == "channel":
+            canal = bot.get_channel(destino_id) or bot.get_partial_messageable(destino_id)
+            msg = await bot.salida.enviar(canal, embed=embed, prioridad=outbound.MASIVA)
+        else:
+            # create_dm con un Object: sin fetch_user previo
+            canal_dm = await bot.create_dm(discord.Object(id=destino_id))
+            msg = await bot.salida.dm(canal_dm, embed=embed, prioridad=outbound.MASIVA)
+        return "sent", msg.id, None
+    except discord.Forbidden:
+        return "failed", None, "forbidden"
+    except discord.NotFound:
+        return "failed", None, "not_found"
+    except Exception as e:
+        return "failed", None, str(e)[:200]
+
+
+async def ejecutar_difusion(bot, fanout_id, concurrencia=CONCURRENCIA, al_progreso=None):
+    """Entrega todo lo pendiente de una difusión. Devuelve el reporte final"""
+    async with bot.db_pool.acquire() as conn:
+        fanout = await conn.fetchrow("SELECT * FROM announcement_fanouts WHERE id = $1", fanout_id)
+        # Lo que quedó a medio enviar en una corrida anterior no se repite
+        await conn.execute(
+            "UPDATE announcement_deliveries SET status = 'unknown' WHERE fanout_id = $1 AND status = 'sending'",
+            fanout_id
+        )
+    if not fanout:
+        return None
+
+    embed = embed_anuncio(fanout['title'], fanout['message'], fanout['author_name'] or fanout['created_by'], fanout['created_at'])
+    semaforo = asyncio.Semaphore(concurrencia)
+    inicio = time.monotonic()
+    procesados = 0
+
+    async def limitada(tipo, destino_id):
+        async with semaforo:
+            return await _entregar(bot, tipo, destino_id, embed)
+
+    while True:
+        async with bot.db_pool.acquire() as conn:
+            pagina = await conn.fetch('''
+                UPDATE announcement_deliveries d
+                SET status = 'sending', attempts = attempts + 1
+                FROM (
+                    SELECT target_type, target_id FROM announcement_deliveries
+                    WHERE fanout_id = $1 AND status = 'pending'
+                    ORDER BY target_type, target_id
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                ) p
+                WHERE d.fanout_id = $1 AND d.target_type = p.target_type AND d.target_id = p.target_id
+                RETURNING d.target_type, d.target_id
+            ''', fanout_id, PAGINA)
+        if not pagina:
+            break
+
+        resultados = await asyncio.gather(*(limitada(f['target_type'], f['target_id']) for f in pagina))
+
+        async with bot.db_pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute('''
+                    UPDATE announcement_deliveries d
+                    SET status = r.status, message_id = r.message_id, error = r.error,
+                        delivered_at = CASE WHEN r.status = 'sent' THEN NOW() END
+                    FROM unnest($2::text[], $3::bigint[], $4::text[], $5::bigint[], $6::text[])
+                        AS r(target_type, target_id, status, message_id, error)
+                    WHERE d.fanout_id = $1 AND d.target_type = r.target_type AND d.target_id = r.target_id
+                ''', fanout_id,
+                    [f['target_type'] for f in pagina], [f['target_id'] for f in pagina],
+                    [r[0] for r in resultados], [r[1] for r in resultados], [r[2] for r in resultados])
+
+                # Historial de anuncios: una fila por canal publicado (como /crear-anuncio)
+                canales = [f['target_id'] for f, r in zip(pagina, resultados) if f['target_type'] == 'channel' and r[0] == 'sent']
+                if canales:
+                    await conn.execute('''
+                        INSERT INTO announcements (guild_id, title, message, channel_id, created_by)
+                        SELECT $1, $2, $3, unnest($4::bigint[]), $5
+                    ''', fanout['guild_id'], fanout['title'], fanout['message'], canales, fanout['created_by'])
+
+        procesados += len(pagina)
+        if al_progreso:
+            await al_progreso(procesados, fanout['total'])
+
+    async with bot.db_pool.acquire() as conn:
+        await conn.execute(
+            "UPDATE announcement_fanouts SET status = 'done', finished_at = NOW() WHERE id = $1",
+            fanout_id
+        )
+        estados = await resumen(conn, fanout_id)
+
+    segundos = time.monotonic() - inicio
+    reporte = {
+        "fanout_id": fanout_id,
+        "total": fanout['total'],
+        "enviados": estados.get("sent", 0),
+        "fallidos": estados.get("failed", 0),
+        "desconocidos": estados.get("unknown", 0),
+        "procesados": procesados,
+        "segundos": round(segundos, 1),
+        "por_segundo": round(procesados / segundos, 2) if segundos else 0.0,
+    }
+    print(f"📢 Difusión #{fanout_id}: {reporte['enviados']}/{reporte['total']} entregados, "
+          f"{reporte['fallidos']} fallidos, {reporte['por_segundo']}/s")
+    return reporte
+
+
+async def difusiones_pendientes(conn):
+    return [f['id'] for f in await conn.fetch("SELECT id FROM announcement_fanouts WHERE status = 'running' ORDER BY id")]
+
+
+async def errores_frecuentes(conn, fanout_id, limite=5):
+    return await conn.fetch('''
+        SELECT error, COUNT(*) AS n FROM announcement_deliveries
+        WHERE fanout_id = $1 AND status = 'failed'
+        GROUP BY error ORDER BY n DESC LIMIT $2
+    ''', fanout_id, limite)
@@ -0,0 +1,35 @@
+import os
+import discord
+
+# ====================================================
+#   INTENTS Y CACHE DE MIEMBROS POR BOT
+# ====================================================
+# Cada bot declara lo que realmente usa. Los tres corren en la misma guild,
+# así que una cache completa de miembros en cada uno los guarda tres veces.
+#
+# Políticas de cache de miembros (se pueden forzar con <PREFIJO>_MEMBER_CACHE):
+#   none -> sin intent de miembros ni cache; se resuelven por REST al usarlos
+#   lazy -> intent de miembros, se cachean los vistos y se hace chunk a pedido
+#   full -> chunk completo de la guild al arrancar
+POLITICAS = ("none", "lazy", "full")
+
+
+def opciones_gateway(prefijo, miembros="none", bans=False):
+    """kwargs de intents/cache para commands.Bot según la política del bot"""
+    politica = os.getenv(f"{prefijo}_MEMBER_CACHE", miembros).lower()
+    if politica not in POLITICAS:
+        print(f"⚠️ {prefijo}_MEMBER_CACHE='{politica}' no es válida, uso '{miembros}'")
+        politica = miembros
+
+    # Solo slash commands y botones: no leemos mensajes, presencias ni typing
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.bans = bans
+    intents.members = politica != "none"
+
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags.from_intents(intents) if intents.members else discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": politica == "full",
+        "max_messages": None,
+    }
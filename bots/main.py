@@ -9,13 +9,25 @@ import asyncio
 import aiohttp
 import json
 import re
+import tempfile
 from dotenv import load_dotenv
+from common import pagos, verificaciones
+from bots.diferido import BotDiferido
+from bots.gateway import opciones_gateway
+from bots.sincronizar import sincronizar_comandos
+from bots import outbound, campanas, db
+from bots.outbound import ColaSalida
 
 load_dotenv()
 
 # Variable global para el canal de campañas
 CAMPAIGNS_CHANNEL_ID = int(os.getenv("CAMPAIGNS_CHANNEL_ID", "0"))
 
+# Cola de verificaciones: cuántos workers llaman a n8n a la vez y cuánto
+# esperamos el callback de /users/confirm-verification antes de rendirnos
+VERIFY_WORKERS = int(os.getenv("VERIFY_WORKERS", "4"))
+VERIFY_TIMEOUT_MIN = int(os.getenv("VERIFY_TIMEOUT_MIN", "15"))
+
 # ====================================================
 # HELPER: DETECTOR DE PLATAFORMAS (Pon esto al inicio)
 # ====================================================
@@ -116,20 +128,26 @@ async def calculate_bounty_earnings(conn, table, discord_id, post_url, bounty_ta
 
 class MainBot(commands.Bot):
     def __init__(self):
-        intents = discord.Intents.default()
-        intents.message_content = True
-        intents.members = True
-        
+        # Sin cache de miembros: el leaderboard usa menciones y el resto va por REST
         super().__init__(
             command_prefix='!',
-            intents=intents,
-            help_command=None
+            help_command=None,
+            **opciones_gateway("MAIN_BOT", miembros="none")
         )
         self.db_pool = None
         self.start_time = datetime.now()
+        # Jobs de verificación: cola en memoria (ids de verification_jobs) e
+        # interacciones abiertas para responder por followup si siguen vivas
+        self.verify_queue = asyncio.Queue()
+        self.verify_interactions = {}
+        # Avisos lanzados desde el listener: asyncio solo guarda referencias débiles a las tareas
+        self.verify_notify_tasks = set()
+        # Publicaciones, ediciones y DMs salen pausados por bucket (bots/outbound.py)
+        self.salida = ColaSalida("main")
 
     async def setup_hook(self):
-        self.db_pool = await asyncpg.create_pool(
+        # Pool primario + réplica opcional para lecturas (DATABASE_REPLICA_URL)
+        self.db_pool = await db.crear_router(
             os.getenv('DATABASE_URL'),
             ssl='require',
             min_size=1,
@@ -141,6 +159,21 @@ class MainBot(commands.Bot):
         self.add_view(RegistrationView())
         print("👀 Vista de Registro cargada y persistente.")
 
+        # Pool acotado de workers de verificación + escucha de resultados
+        await self.recargar_verificaciones_pendientes()
+        self.verify_tasks = [asyncio.create_task(self.verification_worker()) for _ in range(VERIFY_WORKERS)]
+        self.verify_listener_task = asyncio.create_task(self.verification_listener())
+        self.verify_expiry_task = asyncio.create_task(self.verification_expiry_loop())
+        print(f"🕵️ Cola de verificación activa ({VERIFY_WORKERS} workers)")
+
+        # Sync global una vez por arranque (no en cada reconexión) y solo si cambió el árbol
+        try:
+            synced = await sincronizar_comandos(self)
+            if synced is not None:
+                print(f"🌍 Comandos globales sincronizados: {len(synced)}")
+        except Exception as e:
+            print(f"❌ Error sync: {e}")
+
     async def create_tables(self):
         async with self.db_pool.acquire() as conn:
             # --- 1. USUARIOS Y CUENTAS ---
@@ -218,6 +251,10 @@ class MainBot(commands.Bot):
                 )
             ''')
 
+            # Índice por usuario: /stats, auditoría y rollup de equipos filtran por discord_id
+            for table in ("tracked_posts", "tracked_posts_tiktok", "tracked_posts_instagram"):
+                await conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_discord_idx ON {table} (discord_id)")
+
             # --- 3. CONFIGURACIÓN Y CAMPAÑAS ---
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS server_settings (
@@ -268,16 +305,38 @@ class MainBot(commands.Bot):
                     per_views INT
                 )
             ''')
-            
+
+            # Campañas: tag de tarifa + hash del último render publicado
+            await campanas.crear_tablas(conn)
+
+            # --- 5. COLA DE VERIFICACIÓN (compartida con metrics_server) ---
+            await verificaciones.crear_tablas(conn)
+
+            # --- 6. LEDGER DE PAGOS (marcas por video + historial) ---
+            await pagos.crear_tablas(conn)
+
             print("✅ Tablas verificadas y actualizadas (Estructura Completa)")
             
     async def on_ready(self):
         print(f"🔵 {self.user} conectado (ID: {self.user.id})")
-        try:
-            synced = await self.tree.sync()
-            print(f"🌍 Comandos globales sincronizados: {len(synced)}")
-        except Exception as e:
-            print(f"❌ Error sync: {e}")
+
+    def programar_rerender(self, **filtro):
+        """Re-render en segundo plano de las campañas afectadas (ver bots/campanas.py)"""
+        async def correr():
+            try:
+                reporte = await campanas.rerenderizar(self, **filtro)
+                if reporte["editadas"] or reporte["errores"]:
+                    print(f"🖼️ Re-render de campañas {filtro or ''}: {reporte['editadas']} editadas, "
+                          f"{reporte['sin_cambios']} sin cambios, {len(reporte['errores'])} errores")
+            except Exception as e:
+                print(f"❌ Error en re-render de campañas: {e}")
+        return asyncio.create_task(correr())
+
+    async def close(self):
+        await self.salida.cerrar()
+        await super().close()
+        if self.db_pool:
+            await self.db_pool.close()
 
     async def bounty_loop(self):
             await self.wait_until_ready()
@@ -308,7 +367,194 @@ class MainBot(commands.Bot):
                     print(f"❌ Error en bounty_loop: {e}")
                 await asyncio.sleep(300)
 
-main_bot = MainBot()
+    # ====================================================
+    #   COLA DE VERIFICACIÓN (Workers + Resultados)
+    # ====================================================
+
+    async def recargar_verificaciones_pendientes(self):
+        """Al arrancar, vuelve a encolar los jobs que quedaron a medias"""
+        async with self.db_pool.acquire() as conn:
+            jobs = await conn.fetch('''
+                UPDATE verification_jobs SET status = 'pending', updated_at = NOW()
+                WHERE status IN ('pending', 'running')
+                RETURNING id
+            ''')
+        for job in jobs:
+            self.verify_queue.put_nowait(job['id'])
+
+    async def finalizar_verificacion(self, conn, discord_id, platform, verified, reason):
+        """Cierra el job activo y avisa por NOTIFY (mismo camino que usa metrics_server)"""
+        await conn.execute('''
+            WITH fin AS (
+                UPDATE verification_jobs
+                SET status = CASE WHEN $3 THEN 'verified' ELSE 'failed' END,
+                    result = $4, finished_at = NOW(), updated_at = NOW()
+                WHERE discord_id = $1 AND platform = $2 AND status IN ('pending', 'running', 'waiting')
+                RETURNING id
+            )
+            SELECT pg_notify('verification_jobs', id::text) FROM fin
+        ''', discord_id, platform, verified, reason)
+
+    async def verification_worker(self):
+        await self.wait_until_ready()
+        while not self.is_closed():
+            try:
+                job_id = await asyncio.wait_for(self.verify_queue.get(), timeout=60)
+            except asyncio.TimeoutError:
+                continue
+
+            try:
+                await self.procesar_verificacion(job_id)
+            except Exception as e:
+                print(f"❌ Error procesando verificación #{job_id}: {e}")
+            finally:
+                self.verify_queue.task_done()
+
+    async def procesar_verificacion(self, job_id):
+        async with self.db_pool.acquire() as conn:
+            job = await conn.fetchrow('''
+                UPDATE verification_jobs SET status = 'running', attempts = attempts + 1, updated_at = NOW()
+                WHERE id = $1 AND status = 'pending'
+                RETURNING discord_id, platform, username
+            ''', job_id)
+            if not job:
+                return  # Ya lo cerró el callback de n8n o se canceló
+            cuenta = await conn.fetchrow(
+                'SELECT username, verification_code FROM social_accounts WHERE discord_id = $1 AND platform = $2',
+                job['discord_id'], job['platform']
+            )
+
+        discord_id, plataforma = job['discord_id'], job['platform']
+        webhook_url = os.getenv(f"N8N_VERIFY_WEBHOOK_{plataforma.upper()}")
+        if not cuenta or not webhook_url:
+            async with self.db_pool.acquire() as conn:
+                await self.finalizar_verificacion(conn, discord_id, plataforma, False, "config_error" if cuenta else "not_registered")
+            return
+
+        payload = {"discord_id": discord_id, "username": cuenta['username'], "platform": plataforma, "verification_code": cuenta['verification_code']}
+
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120)) as session:
+                async with session.post(webhook_url, json=payload) as resp:
+                    if resp.status != 200:
+                        raise RuntimeError(f"HTTP {resp.status}")
+                    body = await resp.text()
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None  # "Workflow started" y similares: el resultado llegará por callback
+        except Exception as e:
+            print(f"⚠️ Verificador n8n falló para {discord_id}/{plataforma}: {e}")
+            async with self.db_pool.acquire() as conn:
+                await self.finalizar_verificacion(conn, discord_id, plataforma, False, "webhook_error")
+            return
+
+        async with self.db_pool.acquire() as conn:
+            if isinstance(data, dict) and "verified" in data:
+                # n8n respondió en línea: cerramos ya (idempotente con el callback)
+                await self.finalizar_verificacion(conn, discord_id, plataforma, bool(data["verified"]), None if data["verified"] else "code_not_found")
+            else:
+                # n8n nos devolverá el resultado por /users/confirm-verification
+                await conn.execute(
+                    "UPDATE verification_jobs SET status = 'waiting', updated_at = NOW() WHERE id = $1 AND status = 'running'",
+                    job_id
+                )
+
+    async def expirar_verificaciones(self):
+        """Marca como fallidos los jobs cuyo callback nunca llegó"""
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute('''
+                    WITH fin AS (
+                        UPDATE verification_jobs
+                        SET status = 'failed', result = 'timeout', finished_at = NOW(), updated_at = NOW()
+                        WHERE status = 'waiting' AND updated_at < NOW() - make_interval(mins => $1)
+                        RETURNING id
+                    )
+                    SELECT pg_notify('verification_jobs', id::text) FROM fin
+                ''', VERIFY_TIMEOUT_MIN)
+        except Exception as e:
+            print(f"❌ Error expirando verificaciones: {e}")
+
+    async def verification_expiry_loop(self):
+        # Timer propio: con la cola siempre ocupada los workers nunca quedan ociosos
+        await self.wait_until_ready()
+        while not self.is_closed():
+            await self.expirar_verificaciones()
+            await asyncio.sleep(60)
+
+    async def verification_listener(self):
+        """LISTEN verification_jobs en una conexión dedicada (el pool no sirve para LISTEN)"""
+        await self.wait_until_ready()
+        while not self.is_closed():
+            conn = None
+            try:
+                conn = await asyncpg.connect(os.getenv('DATABASE_URL'), ssl='require')
+                await conn.add_listener(
+                    'verification_jobs',
+                    lambda _conn, _pid, _channel, payload: self.lanzar_aviso_verificacion(int(payload))
+                )
+                # Recuperar avisos perdidos mientras no escuchábamos
+                async with self.db_pool.acquire() as pool_conn:
+                    pendientes = await pool_conn.fetch('''
+                        SELECT id FROM verification_jobs
+                        WHERE finished_at IS NOT NULL AND notified_at IS NULL
+                          AND finished_at > NOW() - INTERVAL '1 day'
+                    ''')
+                for job in pendientes:
+                    await self.notificar_verificacion(job['id'])
+
+                while not conn.is_closed() and not self.is_closed():
+                    await asyncio.sleep(30)
+            except Exception as e:
+                print(f"❌ Error en verification_listener: {e}")
+            finally:
+                if conn and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(5)
+
+    def lanzar_aviso_verificacion(self, job_id):
+        tarea = asyncio.create_task(self.notificar_verificacion(job_id))
+        self.verify_notify_tasks.add(tarea)
+        tarea.add_done_callback(self.verify_notify_tasks.discard)
+
+    async def notificar_verificacion(self, job_id):
+        # notified_at garantiza un único aviso aunque lleguen NOTIFY repetidos
+        async with self.db_pool.acquire() as conn:
+            job = await conn.fetchrow('''
+                UPDATE verification_jobs SET notified_at = NOW()
+                WHERE id = $1 AND finished_at IS NOT NULL AND notified_at IS NULL
+                RETURNING discord_id, platform, status, result
+            ''', job_id)
+        if not job:
+            return
+
+        if job['status'] == 'verified':
+            texto = f"✅ ¡Tu cuenta de **{job['platform']}** fue verificada exitosamente!"
+        elif job['result'] == 'code_not_found':
+            texto = f"❌ No encontramos el código en tu bio de **{job['platform']}**. Revísalo y vuelve a usar `/verificar`."
+        elif job['result'] == 'timeout':
+            texto = f"⌛ La verificación de **{job['platform']}** tardó demasiado. Vuelve a intentarlo con `/verificar`."
+        else:
+            texto = "❌ Error al contactar verificador."
+
+        # 1. Si la interacción original sigue viva (<15 min), respondemos ahí
+        interaction = self.verify_interactions.pop((job['discord_id'], job['platform']), None)
+        if interaction and (discord.utils.utcnow() - interaction.created_at).total_seconds() < 14 * 60:
+            try:
+                await interaction.followup.send(texto, ephemeral=True)
+                return
+            except discord.HTTPException:
+                pass
+
+        # 2. Si no, por DM
+        try:
+            user = self.get_user(int(job['discord_id'])) or await self.fetch_user(int(job['discord_id']))
+            self.salida.dm(user, content=texto, etiqueta=f"aviso de verificación a {job['discord_id']}")
+        except discord.HTTPException as e:
+            print(f"⚠️ No pude avisar a {job['discord_id']} de su verificación: {e}")
+
+main_bot = BotDiferido(MainBot)  # Se construye al arrancar (ver bots/diferido.py)
 
 # =============================================
 # COMANDOS DE CAMPAÑAS (MEJORADO - VISUAL + LÓGICA)
@@ -338,6 +584,9 @@ async def publish_campaign(interaction: discord.Interaction,
                            invite_link: str, 
                            thumbnail_url: str = None):
     
+    # DB + envío pueden pasar los 3s de la interacción
+    await interaction.response.defer(ephemeral=True)
+
     # 1. Preparar datos
     tag_limpio = tag_interno.upper().strip()
     channel = interaction.channel
@@ -354,68 +603,38 @@ async def publish_campaign(interaction: discord.Interaction,
             ''', tag_limpio, precio_numerico, f"Campaña: {nombre}")
 
             # --- B. CAMPAÑA VISUAL (Tu código original) ---
-            campaign_id = await conn.fetchval('''
-                INSERT INTO campaigns (name, description, category, platforms, payrate, invite_link, thumbnail_url, created_by) 
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                RETURNING id
-            ''', nombre, descripcion, categoria, plataformas, payrate, invite_link, thumbnail_url, str(interaction.user.id))
+            camp = await conn.fetchrow('''
+                INSERT INTO campaigns (name, description, category, platforms, payrate, invite_link, thumbnail_url, created_by, rate_key) 
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                RETURNING *
+            ''', nombre, descripcion, categoria, plataformas, payrate, invite_link, thumbnail_url, str(interaction.user.id), tag_limpio)
+            campaign_id = camp['id']
             
     except Exception as e:
-        return await interaction.response.send_message(f"❌ Error guardando en DB: {e}", ephemeral=True)
+        return await interaction.followup.send(f"❌ Error guardando en DB: {e}", ephemeral=True)
     
-    # 3. Construir el contenido (Mejorado con info del Tag)
-    texto_contenido = f"""
-**{descripcion}** 🔥
-
-## 🚀 Cómo participar
-**TAG PARA SUBIR:** `{tag_limpio}` 👈 (Selecciona este tag en `/upload`)
-
-## Detalles de campaña
-**Categoría:** {categoria}
-**Plataformas:** {plataformas}
-**Audiencia:** Global 🌎
-
-## Detalles de pago 💸
-**Sistema de pago:** {payrate} (Base: ${precio_numerico}/1k)
-**Minimo de Views para Pago:** 10,000 views
-**Método de Pago:** PayPal
-
-## Únete al servidor ➡️
-Click en el boton debajo para Empezar!
-"""
-
-    # 4. Crear Embed
-    embed = discord.Embed(
-        title=f"✨ {nombre} x Latin Clipping", 
-        description=texto_contenido, 
-        color=0x00ff00 # Verde Clipping
-    )
+    # 3. Contenido del mensaje (embed + botón) y su hash de render
+    contenido = campanas.contenido_campana(camp, precio_numerico)
 
-    if thumbnail_url:
-        embed.set_thumbnail(url=thumbnail_url)
-
-    # Footer con ID y TAG para referencia
-    embed.set_footer(text=f"ID: {campaign_id} | TAG ACTIVO: {tag_limpio} | 🚨 Violacion de reglas = Ban")
-
-    # 5. Botón
-    class JoinButton(View):
-        def __init__(self, link): 
-            super().__init__()
-            self.add_item(Button(label="Join Server", style=discord.ButtonStyle.link, url=link, emoji="➡️"))
-    
-    # 6. ENVIAR MENSAJE
-    msg = await channel.send(embed=embed, view=JoinButton(invite_link))
+    # 4. ENVIAR MENSAJE (crítico: la respuesta necesita el message_id)
+    try:
+        msg = await main_bot.salida.enviar(channel, prioridad=outbound.CRITICA, **campanas.mensaje_campana(contenido))
+    except (discord.HTTPException, outbound.ColaCerrada) as e:
+        return await interaction.followup.send(f"⚠️ Campaña **#{campaign_id}** guardada, pero no pude publicarla: {e}", ephemeral=True)
     
-    # 7. Actualizar DB con message_id
+    # 5. Actualizar DB con message_id y el hash de lo publicado
     async with main_bot.db_pool.acquire() as conn:
         await conn.execute('''
             UPDATE campaigns 
-            SET message_id = $1, channel_id = $2 
-            WHERE id = $3
-        ''', str(msg.id), str(channel.id), campaign_id)
+            SET message_id = $1, channel_id = $2, render_hash = $3, rendered_at = NOW()
+            WHERE id = $4
+        ''', str(msg.id), str(channel.id), campanas.huella(contenido), campaign_id)
+
+    # Si el tag ya lo usaba otra campaña, su precio también cambió
+    main_bot.programar_rerender(rate_key=tag_limpio)
 
-    # 8. Confirmación invisible
-    await interaction.response.send_message(f"✅ Campaña **#{campaign_id}** ({tag_limpio}) publicada y tarifa de **${precio_numerico}** configurada.", ephemeral=True)
+    # 6. Confirmación invisible
+    await interaction.followup.send(f"✅ Campaña **#{campaign_id}** ({tag_limpio}) publicada y tarifa de **${precio_numerico}** configurada.", ephemeral=True)
 
 
 # ====================================================
@@ -451,6 +670,7 @@ async def edit_campaign(interaction: discord.Interaction,
     await interaction.response.defer(ephemeral=True)
 
     reporte_acciones = []
+    tag_limpio = None
 
     async with main_bot.db_pool.acquire() as conn:
         
@@ -478,79 +698,32 @@ async def edit_campaign(interaction: discord.Interaction,
         if not camp['message_id'] or not camp['channel_id']:
             return await interaction.followup.send("⚠️ Esta campaña es antigua o no se guardó bien el mensaje original. No puedo editarla visualmente.")
 
-        # --- 3. MEZCLAR DATOS NUEVOS CON VIEJOS ---
-        new_name = nombre or camp['name']
-        new_desc = descripcion or camp['description']
-        new_cat = categoria or camp['category']
-        new_plat = plataformas or camp.get('platforms', 'TikTok, Instagram, Youtube') 
-        new_rate = payrate or camp['payrate']
-        new_link = invite_link or camp['invite_link']
-        new_thumb = thumbnail_url or camp['thumbnail_url']
-
-        # --- 4. ACTUALIZAR BASE DE DATOS VISUAL ---
+        # --- 3. ACTUALIZAR BASE DE DATOS VISUAL (lo que no venga se conserva) ---
         await conn.execute('''
             UPDATE campaigns 
-            SET name=$1, description=$2, category=$3, platforms=$4, payrate=$5, invite_link=$6, thumbnail_url=$7 
-            WHERE id=$8
-        ''', new_name, new_desc, new_cat, new_plat, new_rate, new_link, new_thumb, id_campana)
-
-    # --- 5. ACTUALIZAR EL MENSAJE EN DISCORD ---
-    try:
-        channel = interaction.client.get_channel(int(camp['channel_id']))
-        if not channel:
-            return await interaction.followup.send("❌ El canal original ya no existe.")
-            
-        message = await channel.fetch_message(int(camp['message_id']))
-        
-        # Ojo: Recuperamos el TAG para mostrarlo en el embed, o usamos uno genérico si no lo pasó ahora
-        tag_mostrar = tag_interno.upper().strip() if tag_interno else "REVISA-EL-TAG"
-
-        # Reconstruir el Embed (Estilo Gigante adaptado al nuevo modelo)
-        texto_contenido = f"""
-**{new_desc}** 🔥
+            SET name = COALESCE($1, name), description = COALESCE($2, description), category = COALESCE($3, category),
+                platforms = COALESCE($4, platforms), payrate = COALESCE($5, payrate), invite_link = COALESCE($6, invite_link),
+                thumbnail_url = COALESCE($7, thumbnail_url), rate_key = COALESCE($8, rate_key)
+            WHERE id = $9
+        ''', nombre, descripcion, categoria, plataformas, payrate, invite_link, thumbnail_url, tag_limpio, id_campana)
 
-## 🚀 Cómo participar
-**TAG PARA SUBIR:** `{tag_mostrar}` 👈 (Selecciona este tag en `/upload`)
+    # --- 4. RE-RENDER: solo se edita el mensaje si el contenido cambió ---
+    reporte = await campanas.rerenderizar(main_bot, ids=[id_campana], prioridad=outbound.CRITICA)
 
-## Detalles de campaña
-**Categoría:** {new_cat}
-**Plataformas:** {new_plat}
-**Audiencia:** Global 🌎
+    # Otras campañas con el mismo tag muestran la tarifa: se actualizan en segundo plano
+    if tag_limpio:
+        main_bot.programar_rerender(rate_key=tag_limpio)
 
-## Detalles de pago 💸
-**Sistema de pago:** {new_rate}
-**Minimo de Views para Pago:** 10,000 views
-**Método de Pago:** PayPal
+    if reporte["sin_mensaje"]:
+        return await interaction.followup.send("⚠️ Datos guardados en DB, pero no encontré el mensaje original (quizás fue borrado).")
+    if reporte["errores"]:
+        return await interaction.followup.send(f"❌ Error técnico al editar: {reporte['errores'][0][1]}")
 
-## Únete al servidor ➡️
-Click en el boton debajo para Empezar!
-"""
-        new_embed = discord.Embed(
-            title=f"✨ {new_name} x Latin Clipping", 
-            description=texto_contenido, 
-            color=0x00ff00
-        )
-        
-        if new_thumb:
-            new_embed.set_thumbnail(url=new_thumb)
-            
-        new_embed.set_footer(text=f"ID: {id_campana} | TAG ACTIVO: {tag_mostrar} | 🚨 Violacion de reglas = Ban")
-
-        class JoinButton(discord.ui.View):
-            def __init__(self, link): 
-                super().__init__()
-                self.add_item(discord.ui.Button(label="Join Server", style=discord.ButtonStyle.link, url=link, emoji="➡️"))
-
-        # Edición Mágica
-        await message.edit(embed=new_embed, view=JoinButton(new_link))
+    if reporte["editadas"]:
         reporte_acciones.append(f"✅ Anuncio visual **#{id_campana}** actualizado en el canal.")
-        
-        await interaction.followup.send("\n".join(reporte_acciones), ephemeral=True)
-
-    except discord.NotFound:
-        await interaction.followup.send("⚠️ Datos guardados en DB, pero no encontré el mensaje original (quizás fue borrado).")
-    except Exception as e:
-        await interaction.followup.send(f"❌ Error técnico al editar: {e}")
+    else:
+        reporte_acciones.append(f"ℹ️ El anuncio **#{id_campana}** ya mostraba estos datos (no se editó).")
+    await interaction.followup.send("\n".join(reporte_acciones), ephemeral=True)
 
 # ====================================================
 # COMANDO: AJUSTAR TARIFA (Silencioso / Tarifa Base)
@@ -573,12 +746,15 @@ async def adjust_rate(interaction: discord.Interaction, tag: str, nuevo_precio:
             ON CONFLICT (rate_key) 
             DO UPDATE SET amount_per_1k = $2, is_active = TRUE
         ''', tag_limpio, nuevo_precio)
+
+    # Los anuncios que muestran esta tarifa se re-renderizan (solo los que cambian)
+    main_bot.programar_rerender(rate_key=tag_limpio)
         
     await interaction.response.send_message(f"✅ Tarifa matemática actualizada: **{tag_limpio}** ahora calcula **${nuevo_precio}** por cada 1,000 vistas.", ephemeral=True)
 
 @main_bot.tree.command(name="list-campaigns", description="Muestra campañas activas")
 async def list_campaigns(interaction: discord.Interaction):
-    async with main_bot.db_pool.acquire() as conn:
+    async with main_bot.db_pool.acquire_lectura() as conn:
         campaigns = await conn.fetch("SELECT id, name, category, payrate FROM campaigns ORDER BY created_at DESC")
 
     if not campaigns:
@@ -635,8 +811,13 @@ Aquí tienes los comandos esenciales para gestionar tu cuenta y empezar a ganar
     
     embed.set_footer(text="¿Tienes dudas? Abre un ticket en #soporte 🎫")
 
-    await interaction.channel.send(embed=embed)
-    await interaction.response.send_message("✅ Guía publicada en este canal.", ephemeral=True)
+    # Esperamos el envío: si falla (permisos, 403...) el admin se entera
+    await interaction.response.defer(ephemeral=True)
+    try:
+        await main_bot.salida.enviar(interaction.channel, embed=embed, prioridad=outbound.CRITICA)
+    except (discord.HTTPException, outbound.ColaCerrada) as e:
+        return await interaction.followup.send(f"❌ No pude publicar la guía: {e}", ephemeral=True)
+    await interaction.followup.send("✅ Guía publicada en este canal.", ephemeral=True)
 
 @main_bot.tree.command(name="publicar-reglas", description="Publica las reglas con formato GIGANTE")
 @app_commands.default_permissions(administrator=True)
@@ -688,8 +869,13 @@ async def post_campaign_rules(interaction: discord.Interaction):
     
     embed.set_footer(text="⚠️ Violación de reglas = Ban Permanente")
 
-    await interaction.channel.send(embed=embed)
-    await interaction.response.send_message("✅ Reglas publicadas con formato grande.", ephemeral=True)
+    # Esperamos el envío: si falla (permisos, 403...) el admin se entera
+    await interaction.response.defer(ephemeral=True)
+    try:
+        await main_bot.salida.enviar(interaction.channel, embed=embed, prioridad=outbound.CRITICA)
+    except (discord.HTTPException, outbound.ColaCerrada) as e:
+        return await interaction.followup.send(f"❌ No pude publicar las reglas: {e}", ephemeral=True)
+    await interaction.followup.send("✅ Reglas publicadas con formato grande.", ephemeral=True)
 
 @main_bot.tree.command(name="publicar-info", description="Publica la información detallada de pagos y funcionamiento")
 @app_commands.default_permissions(administrator=True)
@@ -743,8 +929,13 @@ Existen dos sistemas para calcular recompensas:
     
     embed.set_thumbnail(url="https://cdn-icons-png.flaticon.com/512/189/189665.png") # Icono de Info
 
-    await interaction.channel.send(embed=embed)
-    await interaction.response.send_message("✅ Información publicada correctamente.", ephemeral=True)
+    # Esperamos el envío: si falla (permisos, 403...) el admin se entera
+    await interaction.response.defer(ephemeral=True)
+    try:
+        await main_bot.salida.enviar(interaction.channel, embed=embed, prioridad=outbound.CRITICA)
+    except (discord.HTTPException, outbound.ColaCerrada) as e:
+        return await interaction.followup.send(f"❌ No pude publicar la información: {e}", ephemeral=True)
+    await interaction.followup.send("✅ Información publicada correctamente.", ephemeral=True)
 
 # ==========================================
 # COMANDO: SETUP REGISTRO (Admin)
@@ -773,10 +964,14 @@ Si aún no lo has hecho, por favor configura el método de pago requerido para e
     )
     embed.set_footer(text="Latin Clipping 2025")
 
-    # Enviamos el embed con la Vista (el botón)
-    await interaction.channel.send(embed=embed, view=RegistrationView())
+    # Enviamos el embed con la Vista (el botón) y esperamos el resultado
+    await interaction.response.defer(ephemeral=True)
+    try:
+        await main_bot.salida.enviar(interaction.channel, embed=embed, view=RegistrationView(), prioridad=outbound.CRITICA)
+    except (discord.HTTPException, outbound.ColaCerrada) as e:
+        return await interaction.followup.send(f"❌ No pude publicar el panel de registro: {e}", ephemeral=True)
     
-    await interaction.response.send_message("✅ Panel de registro publicado.", ephemeral=True)
+    await interaction.followup.send("✅ Panel de registro publicado.", ephemeral=True)
 
 
 # =============================================
@@ -784,7 +979,7 @@ Si aún no lo has hecho, por favor configura el método de pago requerido para e
 # =============================================
 @main_bot.tree.command(name="info", description="Muestra estadísticas detalladas")
 async def about(interaction: discord.Interaction):
-    async with main_bot.db_pool.acquire() as conn:
+    async with main_bot.db_pool.acquire_lectura() as conn:
         total_users = await conn.fetchval('SELECT COUNT(*) FROM users')
         total_verified = await conn.fetchval('SELECT COUNT(*) FROM social_accounts WHERE is_verified = true')
         total_accounts = await conn.fetchval('SELECT COUNT(*) FROM social_accounts')
@@ -813,7 +1008,7 @@ async def about(interaction: discord.Interaction):
     embed = discord.Embed(title="🤖 Acerca de Clipping Bot", description="Plataforma líder para creadores de contenido y gestión de campañas", color=0x9146FF, timestamp=datetime.now())
     embed.add_field(name="📊 Estadísticas Globales", value=f"**👥 Usuarios Registrados:** {total_users}\n**📱 Cuentas Vinculadas:** {total_accounts}\n**✅ Cuentas Verificadas:** {total_verified}\n**🎬 Posts Trackeados:** {total_posts}\n**⏱️ Tiempo Activo:** {hours}h {minutes}m", inline=False)
     embed.add_field(name="📈 Métricas de Contenido", value=f"**👁️ Vistas Totales:** {total_views:,}\n**❤️ Likes Totales:** {total_likes:,}\n**🔄 Shares Totales:** {total_shares:,}", inline=False)
-    embed.add_field(name="🔧 Información Técnica", value=f"**🟢 Estado:** Operativo\n**📡 Latencia:** {round(main_bot.latency * 1000)}ms\n**⚡ Versión:** 2.0.0\n**👨‍💻 Desarrollado por:** Latin Clipping", inline=False)
+    embed.add_field(name="🔧 Información Técnica", value=f"**🟢 Estado:** Operativo\n**📡 Latencia:** {round(main_bot.latency * 1000)}ms\n**⚡ Versión:** 2.0.0\n**🗄️ Réplica:** {main_bot.db_pool.estado()}\n**👨‍💻 Desarrollado por:** Latin Clipping", inline=False)
     embed.add_field(name="🎯 Características Principales", value="• Sistema de registro y verificación\n• Seguimiento automático de métricas\n• Gestión de pagos múltiples\n• Leaderboards competitivos\n• Detección de fraude\n• Soporte para múltiples plataformas", inline=False)
     embed.set_footer(text="💡 Usa /registrar para vincular tus cuentas")
     
@@ -839,6 +1034,8 @@ async def set_payrate(interaction: discord.Interaction, tipo: str, precio_por_1k
             ON CONFLICT (rate_key) 
             DO UPDATE SET amount_per_1k = $2
         ''', key, precio_por_1k)
+
+    main_bot.programar_rerender(rate_key=key)
         
     await interaction.response.send_message(f"✅ Precio actualizado: **{key}** = **${precio_por_1k}** / 1k views.", ephemeral=True)
 
@@ -942,7 +1139,7 @@ async def stats(interaction: discord.Interaction):
     discord_id = str(interaction.user.id)
     await interaction.response.defer(ephemeral=True)
 
-    async with main_bot.db_pool.acquire() as conn:
+    async with main_bot.db_pool.acquire_lectura() as conn:
         # A. Obtener precios
         rate_std = await conn.fetchval("SELECT amount_per_1k FROM payment_rates WHERE rate_key = 'STANDARD'") or 0.60
         bounty_rows = await conn.fetch("SELECT rate_key, amount_per_1k FROM payment_rates WHERE rate_key != 'STANDARD'")
@@ -950,11 +1147,11 @@ async def stats(interaction: discord.Interaction):
 
         # B. Traer videos de las 3 tablas
         query = """
-            SELECT post_url as url, views, is_bounty, bounty_tag, 'YouTube' as plat FROM tracked_posts WHERE discord_id = $1
+            SELECT post_url as url, views, settled_views, is_bounty, bounty_tag, 'YouTube' as plat FROM tracked_posts WHERE discord_id = $1
             UNION ALL
-            SELECT tiktok_url as url, views, is_bounty, bounty_tag, 'TikTok' as plat FROM tracked_posts_tiktok WHERE discord_id = $1
+            SELECT tiktok_url as url, views, settled_views, is_bounty, bounty_tag, 'TikTok' as plat FROM tracked_posts_tiktok WHERE discord_id = $1
             UNION ALL
-            SELECT instagram_url as url, views, is_bounty, bounty_tag, 'Instagram' as plat FROM tracked_posts_instagram WHERE discord_id = $1
+            SELECT instagram_url as url, views, settled_views, is_bounty, bounty_tag, 'Instagram' as plat FROM tracked_posts_instagram WHERE discord_id = $1
         """
         videos = await conn.fetch(query, discord_id)
 
@@ -977,7 +1174,8 @@ async def stats(interaction: discord.Interaction):
             rate = float(rate_std)
             tipo_lbl = "📹 Normal"
             
-        ganancia = (views / 1000) * rate
+        # Solo cobra las vistas posteriores al último pago
+        ganancia = (max(views - (v['settled_views'] or 0), 0) / 1000) * rate
         total_views += views
         total_earned += ganancia
         
@@ -1015,7 +1213,7 @@ async def leaderboard(interaction: discord.Interaction):
     LIMIT 10;
     """
     
-    async with main_bot.db_pool.acquire() as conn:
+    async with main_bot.db_pool.acquire_lectura() as conn:
         top_users = await conn.fetch(query)
 
     embed = discord.Embed(title="🏆 Leaderboard (Top 10)", color=0xFFD700)
@@ -1024,8 +1222,9 @@ async def leaderboard(interaction: discord.Interaction):
     for i, user in enumerate(top_users, 1):
         medal = "🥇" if i==1 else "🥈" if i==2 else "🥉" if i==3 else f"#{i}"
         
-        member = interaction.guild.get_member(int(user['discord_id']))
-        name = member.display_name if member else f"Usuario...{str(user['discord_id'])[-4:]}"
+        # Sin cache de miembros: la mención la resuelve el cliente de Discord
+        member = interaction.guild.get_member(int(user['discord_id'])) if interaction.guild else None
+        name = member.display_name if member else f"<@{user['discord_id']}>"
         
         texto += f"**{medal} {name}** — {user['total_views']:,} views\n"
 
@@ -1054,6 +1253,8 @@ async def registrar(interaction: discord.Interaction, plataforma: str, usuario:
         try:
             await conn.execute('INSERT INTO users (discord_id, username) VALUES ($1, $2) ON CONFLICT (discord_id) DO UPDATE SET username = $2', discord_id, str(interaction.user))
             await conn.execute('INSERT INTO social_accounts (discord_id, platform, username, verification_code, is_verified) VALUES ($1, $2, $3, $4, FALSE) ON CONFLICT (discord_id, platform, username) DO UPDATE SET verification_code = EXCLUDED.verification_code', discord_id, plataforma, usuario_limpio, verification_code)
+            # Avisamos a metrics_server para que refresque /users/active
+            await conn.execute("SELECT pg_notify('social_accounts_changed', $1)", plataforma)
 
             n8n_url = os.getenv(f"N8N_{plataforma.upper()}_WEBHOOK")
             if n8n_url:
@@ -1092,26 +1293,33 @@ async def verificar(interaction: discord.Interaction, plataforma: str, usuario:
         await interaction.followup.send("❌ Error de configuración (Webhook).", ephemeral=True)
         return
 
-    payload = {"discord_id": discord_id, "username": cuenta['username'], "platform": plataforma, "verification_code": cuenta['verification_code']}
-
+    # Encolamos el job: si ya hay uno activo para (discord_id, plataforma) no se duplica
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(webhook_url, json=payload) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    if data.get("verified"):
-                        await interaction.followup.send("✅ ¡Verificado exitosamente!", ephemeral=True)
-                    else:
-                        await interaction.followup.send("❌ No encontramos el código en tu bio.", ephemeral=True)
-                else:
-                    await interaction.followup.send("❌ Error al contactar verificador.", ephemeral=True)
+        async with main_bot.db_pool.acquire() as conn:
+            job_id = await conn.fetchval('''
+                INSERT INTO verification_jobs (discord_id, platform, username)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (discord_id, platform) WHERE status IN ('pending', 'running', 'waiting')
+                DO NOTHING
+                RETURNING id
+            ''', discord_id, plataforma, cuenta['username'])
     except Exception as e:
         await interaction.followup.send(f"❌ Error: {e}", ephemeral=True)
+        return
+
+    main_bot.verify_interactions[(discord_id, plataforma)] = interaction
+
+    if job_id is None:
+        await interaction.followup.send("⏳ Ya hay una verificación en curso para esta cuenta. Te avisaremos cuando termine.", ephemeral=True)
+        return
+
+    main_bot.verify_queue.put_nowait(job_id)
+    await interaction.followup.send("🔎 Verificación en cola. Te avisaremos por aquí o por DM cuando termine.", ephemeral=True)
 
 @main_bot.tree.command(name="mis-videos", description="Muestra tus videos trackeados")
 async def mis_videos(interaction: discord.Interaction):
     discord_id = str(interaction.user.id)
-    async with main_bot.db_pool.acquire() as conn:
+    async with main_bot.db_pool.acquire_lectura() as conn:
         yt = await conn.fetch("SELECT post_url as url, views, likes, uploaded_at, 'YouTube' as platform FROM tracked_posts WHERE discord_id = $1", discord_id)
         tt = await conn.fetch("SELECT tiktok_url as url, views, likes, uploaded_at, 'TikTok' as platform FROM tracked_posts_tiktok WHERE discord_id = $1", discord_id)
         ig = await conn.fetch("SELECT instagram_url as url, views, likes, uploaded_at, 'Instagram' as platform FROM tracked_posts_instagram WHERE discord_id = $1", discord_id) # <--- FALTABA ESTO
@@ -1172,7 +1380,7 @@ async def add_paypal(interaction: discord.Interaction, email: str, nombre: str,
     discord_id = str(interaction.user.id)
     async with main_bot.db_pool.acquire() as conn:
         await conn.execute('INSERT INTO users (discord_id, username) VALUES ($1, $2) ON CONFLICT (discord_id) DO NOTHING', discord_id, str(interaction.user))
-        await conn.execute('INSERT INTO payment_methods (discord_id, method_type, paypal_email, first_name, last_name) VALUES ($1, $2, $3, $4, $5) ON CONFLICT (discord_id, method_type) DO UPDATE SET paypal_email = $2, first_name = $3, last_name = $4', discord_id, 'paypal', email, nombre, apellido)
+        await conn.execute('INSERT INTO payment_methods (discord_id, method_type, paypal_email, first_name, last_name) VALUES ($1, $2, $3, $4, $5) ON CONFLICT (discord_id, method_type) DO UPDATE SET paypal_email = EXCLUDED.paypal_email, first_name = EXCLUDED.first_name, last_name = EXCLUDED.last_name', discord_id, 'paypal', email, nombre, apellido)
     await interaction.response.send_message("✅ PayPal guardado.", ephemeral=True)
 
 @main_bot.tree.command(name="payment-details", description="Ver tus datos de pago")
@@ -1190,11 +1398,33 @@ async def payment_details(interaction: discord.Interaction):
 async def sync(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
     try:
-        s = await main_bot.tree.sync()
+        s = await sincronizar_comandos(main_bot, forzar=True)
         await interaction.followup.send(f"✅ Sincronizados {len(s)} comandos.")
     except Exception as e:
         await interaction.followup.send(f"❌ Error: {e}")
 
+@main_bot.tree.command(name="rerender-campañas", description="ADMIN: Re-renderiza los anuncios de campañas cuyo contenido cambió")
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(forzar="Editar todos los mensajes aunque el hash no haya cambiado")
+async def rerender_campanas(interaction: discord.Interaction, forzar: bool = False):
+    await interaction.response.defer(ephemeral=True)
+    reporte = await campanas.rerenderizar(main_bot, forzar=forzar)
+
+    embed = discord.Embed(title="🖼️ Re-render de campañas", color=0x00ff00 if not reporte["errores"] else 0xffa500)
+    embed.add_field(name="Revisadas", value=str(reporte["revisadas"]), inline=True)
+    embed.add_field(name="Editadas", value=str(reporte["editadas"]), inline=True)
+    embed.add_field(name="Sin cambios", value=str(reporte["sin_cambios"]), inline=True)
+    if reporte["sin_mensaje"]:
+        embed.add_field(name="⚠️ Mensaje borrado", value=", ".join(f"#{i}" for i in reporte["sin_mensaje"][:30]), inline=False)
+    if reporte["errores"]:
+        embed.add_field(name="❌ Errores", value="\n".join(f"#{i}: {e}" for i, e in reporte["errores"][:10]), inline=False)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@main_bot.tree.command(name="cola-salida", description="ADMIN: Métricas de la cola de mensajes salientes")
+@app_commands.default_permissions(administrator=True)
+async def cola_salida(interaction: discord.Interaction):
+    await interaction.response.send_message(embed=outbound.embed_metricas(main_bot.salida), ephemeral=True)
+
 if __name__ == "__main__":
     token = os.getenv('DISCORD_MAIN_BOT_TOKEN')
     main_bot.run(token)
@@ -1203,40 +1433,35 @@ if __name__ == "__main__":
 # COMANDO PRINCIPAL Y FUNCIÓN HELPER (ADAPTADO A TU DB REAL 🏗️)
 # -----------------------------------------------------------------------------
 
-async def generar_vista_principal(bot_instance, interaction):
+async def generar_vista_principal(bot_instance, interaction, primario=False):
     try:
-        # 1. Obtenemos IDs de usuarios desde social_accounts
-        async with bot_instance.db_pool.acquire() as conn:
-            users = await conn.fetch("SELECT DISTINCT discord_id FROM social_accounts")
-            
+        # 1. Saldos pendientes de todos (una sola consulta sobre lo no liquidado)
+        # Justo después de un pago se lee del primario: la réplica puede no tenerlo todavía
+        db = bot_instance.db_pool
+        async with (db.acquire() if primario else db.acquire_lectura()) as conn:
+            saldos = await pagos.saldos_pendientes(conn)
+            nombres = {
+                r['discord_id']: r for r in await conn.fetch("""
+                    SELECT DISTINCT ON (discord_id) discord_id, first_name, last_name
+                    FROM payment_methods
+                    WHERE discord_id = ANY($1::text[])
+                """, [s['discord_id'] for s in saldos[:25]])
+            }
+
         options = []
-        async with bot_instance.db_pool.acquire() as conn:
-            for u in users:
-                uid = u['discord_id']
-                
-                # 2. CALCULAR DEUDA (Suma de las 3 redes)
-                yt = await conn.fetchval("SELECT COALESCE(SUM(final_earned_usd),0) FROM tracked_posts WHERE discord_id=$1", uid)
-                tt = await conn.fetchval("SELECT COALESCE(SUM(final_earned_usd),0) FROM tracked_posts_tiktok WHERE discord_id=$1", uid)
-                ig = await conn.fetchval("SELECT COALESCE(SUM(final_earned_usd),0) FROM tracked_posts_instagram WHERE discord_id=$1", uid)
-                total = (yt or 0) + (tt or 0) + (ig or 0)
-                
-                if total > 0:
-                    # 3. BUSCAR NOMBRE EN LA TABLA DE PAGOS (⚠️ OJO AQUÍ)
-                    # Usamos 'payment_methods'. Si tu tabla se llama distinto, cambia este nombre 👇
-                    pago_info = await conn.fetchrow("""
-                        SELECT first_name, last_name 
-                        FROM payment_methods 
-                        WHERE discord_id = $1 LIMIT 1
-                    """, uid)
-                    
-                    if pago_info and pago_info['first_name']:
-                        nombre_mostrar = f"{pago_info['first_name']} {pago_info['last_name'] or ''}"
-                    else:
-                        nombre_mostrar = "Usuario (Sin PayPal)"
-
-                    # Recortar nombre para evitar error de Discord (>100 chars)
-                    label = f"{nombre_mostrar[:50]} (${total:.2f})"
-                    options.append(discord.SelectOption(label=label, value=str(uid), description=f"ID: {uid}"))
+        for s in saldos[:25]:
+            uid = s['discord_id']
+            total = s['saldo']
+            pago_info = nombres.get(uid)
+
+            if pago_info and pago_info['first_name']:
+                nombre_mostrar = f"{pago_info['first_name']} {pago_info['last_name'] or ''}"
+            else:
+                nombre_mostrar = "Usuario (Sin PayPal)"
+
+            # Recortar nombre para evitar error de Discord (>100 chars)
+            label = f"{nombre_mostrar[:50]} (${total:.2f})"
+            options.append(discord.SelectOption(label=label, value=str(uid), description=f"ID: {uid}"))
 
         # CASO 1: NADIE TIENE DEUDA
         if not options:
@@ -1268,10 +1493,11 @@ class AdminControlView(discord.ui.View):
         self.current_user_id = int(select.values[0])
         await self.mostrar_detalle_usuario(interaction)
 
-    async def mostrar_detalle_usuario(self, interaction: discord.Interaction):
+    async def mostrar_detalle_usuario(self, interaction: discord.Interaction, primario=False):
         user_id = self.current_user_id
         
-        async with self.bot.db_pool.acquire() as conn:
+        db = self.bot.db_pool
+        async with (db.acquire() if primario else db.acquire_lectura()) as conn:
             # ⚠️ AQUÍ TAMBIÉN: Cambia 'payment_methods' si tu tabla tiene otro nombre
             user_data = await conn.fetchrow("""
                 SELECT paypal_email, first_name, last_name 
@@ -1279,12 +1505,14 @@ class AdminControlView(discord.ui.View):
                 WHERE discord_id = $1 LIMIT 1
             """, str(user_id))
             
-            yt_vids = await conn.fetch("SELECT 'YouTube' as src, post_url, final_earned_usd, bounty_tag FROM tracked_posts WHERE discord_id = $1", str(user_id))
-            tt_vids = await conn.fetch("SELECT 'TikTok' as src, tiktok_url as post_url, final_earned_usd, bounty_tag FROM tracked_posts_tiktok WHERE discord_id = $1", str(user_id))
-            ig_vids = await conn.fetch("SELECT 'Instagram' as src, instagram_url as post_url, final_earned_usd, bounty_tag FROM tracked_posts_instagram WHERE discord_id = $1", str(user_id))
-
-        all_vids = yt_vids + tt_vids + ig_vids
-        total_deuda = sum([v['final_earned_usd'] or 0 for v in all_vids])
+            # Solo lo que falta pagar de cada video (por encima de su marca de liquidación)
+            all_vids = await pagos.videos_pendientes(conn, str(user_id))
+            ultimo_pago = await conn.fetchrow(
+                "SELECT amount_usd, created_at FROM payouts WHERE discord_id = $1 ORDER BY created_at DESC LIMIT 1",
+                str(user_id)
+            )
+
+        total_deuda = sum([v['pendiente'] for v in all_vids])
         
         embed = discord.Embed(title=f"🕵️ Auditoría de Usuario", color=discord.Color.blue())
         embed.description = f"<@{user_id}>\n**Deuda Total:** `${total_deuda:.2f}`"
@@ -1296,20 +1524,23 @@ class AdminControlView(discord.ui.View):
             embed.add_field(name="💳 Datos de Pago", value=f"Titular: `{nombre}`\nEmail: `{email}`", inline=False)
         else:
             embed.add_field(name="💳 Datos de Pago", value="⚠️ No ha configurado PayPal", inline=False)
+        if ultimo_pago:
+            embed.add_field(name="🧾 Último Pago", value=f"`${ultimo_pago['amount_usd']:.2f}` el {ultimo_pago['created_at']:%d/%m/%Y}", inline=False)
 
         # ... (El resto de la lógica de videos sigue igual)
         lista_texto = ""
         options_borrar = []
         for i, vid in enumerate(all_vids[:20]):
-            ganancia = vid['final_earned_usd'] or 0
+            ganancia = vid['pendiente']
             tag = vid['bounty_tag'] or "Std"
             url_corta = vid['post_url'][-15:]
-            lista_texto += f"**{i+1}.** [{vid['src']}] `${ganancia:.2f}` ({tag}) -> [Link]({vid['post_url']})\n"
-            label = f"{i+1}. {vid['src']} (${ganancia:.2f})"
+            vid_src = vid['platform'].capitalize()
+            lista_texto += f"**{i+1}.** [{vid_src}] `${ganancia:.2f}` ({tag}) -> [Link]({vid['post_url']})\n"
+            label = f"{i+1}. {vid_src} (${ganancia:.2f})"
             options_borrar.append(discord.SelectOption(label=label, value=vid['post_url'], description=f"Borrar: {url_corta}", emoji="🗑️"))
 
-        if not lista_texto: lista_texto = "No hay videos activos."
-        embed.add_field(name="📹 Videos Activos", value=lista_texto, inline=False)
+        if not lista_texto: lista_texto = "No hay videos con saldo pendiente."
+        embed.add_field(name="📹 Videos con Saldo", value=lista_texto, inline=False)
 
         self.clear_items()
         if options_borrar:
@@ -1317,7 +1548,7 @@ class AdminControlView(discord.ui.View):
             select_borrar.callback = self.borrar_video_callback
             self.add_item(select_borrar)
 
-        btn_pagar = discord.ui.Button(label="💸 Pagar y Resetear", style=discord.ButtonStyle.green, custom_id="pay_btn")
+        btn_pagar = discord.ui.Button(label="💸 Registrar Pago", style=discord.ButtonStyle.green, custom_id="pay_btn")
         btn_pagar.callback = self.pagar_callback
         self.add_item(btn_pagar)
 
@@ -1334,15 +1565,20 @@ class AdminControlView(discord.ui.View):
             await conn.execute("DELETE FROM tracked_posts WHERE post_url = $1", video_url)
             await conn.execute("DELETE FROM tracked_posts_tiktok WHERE tiktok_url = $1", video_url)
             await conn.execute("DELETE FROM tracked_posts_instagram WHERE instagram_url = $1", video_url)
-        await self.mostrar_detalle_usuario(interaction)
+        # Recién borrado: se relee del primario para ver el propio cambio
+        await self.mostrar_detalle_usuario(interaction, primario=True)
 
     async def pagar_callback(self, interaction: discord.Interaction):
         user_id = self.current_user_id
         async with self.bot.db_pool.acquire() as conn:
-            await conn.execute("DELETE FROM tracked_posts WHERE discord_id = $1", str(user_id))
-            await conn.execute("DELETE FROM tracked_posts_tiktok WHERE discord_id = $1", str(user_id))
-            await conn.execute("DELETE FROM tracked_posts_instagram WHERE discord_id = $1", str(user_id))
-        embed = discord.Embed(title="✅ Pago Registrado", description=f"Se ha reseteado la cuenta de <@{user_id}>.", color=discord.Color.green())
+            # Liquida sin borrar: los videos siguen trackeados y solo se paga lo nuevo
+            liquidado = await pagos.liquidar(conn, [user_id], pagado_por=str(interaction.user.id))
+        pago = liquidado.get(str(user_id))
+        if pago:
+            descripcion = f"Se liquidaron **${pago['amount_usd']:.2f}** ({pago['post_count']} videos) a <@{user_id}>.\nPago #{pago['payout_id']} guardado en el historial."
+        else:
+            descripcion = f"<@{user_id}> no tenía saldo pendiente."
+        embed = discord.Embed(title="✅ Pago Registrado", description=descripcion, color=discord.Color.green())
         self.clear_items()
         btn_back = discord.ui.Button(label="🏠 Inicio", style=discord.ButtonStyle.primary)
         btn_back.callback = self.volver_callback
@@ -1350,7 +1586,51 @@ class AdminControlView(discord.ui.View):
         await interaction.response.edit_message(embed=embed, view=self)
 
     async def volver_callback(self, interaction: discord.Interaction):
-        await generar_vista_principal(self.bot, interaction)
+        # También se llega aquí justo después de un pago: se relee del primario
+        await generar_vista_principal(self.bot, interaction, primario=True)
+
+@main_bot.tree.command(name="exportar-pagos", description="ADMIN: CSV de PayPal Payouts con todos los saldos pendientes")
+@app_commands.describe(
+    minimo="Saldo mínimo en USD para entrar al lote",
+    liquidar="Marca el lote como pagado al generarlo",
+    lote="ID de un lote ya liquidado para volver a descargarlo"
+)
+@app_commands.default_permissions(administrator=True)
+async def exportar_pagos(interaction: discord.Interaction, minimo: float = None, liquidar: bool = False, lote: str = None):
+    await interaction.response.defer(ephemeral=True)
+    minimo = pagos.PAYOUT_MIN_USD if minimo is None else minimo
+    batch_id = lote
+    filas = 0
+
+    # El CSV se escribe a disco por partes, nunca entero en memoria
+    archivo = tempfile.TemporaryFile()
+    try:
+        async with main_bot.db_pool.acquire() as conn:
+            if liquidar and not batch_id:
+                batch_id = await pagos.preparar_lote_paypal(conn, minimo, pagado_por=str(interaction.user.id))
+                if not batch_id:
+                    await interaction.followup.send(f"👍 Nadie con PayPal supera **${minimo:.2f}** pendientes.", ephemeral=True)
+                    return
+            async for parte in pagos.exportar_paypal(conn, minimo, batch_id):
+                filas += parte.count("\n")
+                archivo.write(parte.encode())
+
+        if filas == 0:
+            await interaction.followup.send("📭 No hay pagos para exportar.", ephemeral=True)
+            return
+
+        if batch_id:
+            descripcion = f"Lote `{batch_id}` liquidado: **{filas}** pagos. Sube el archivo en PayPal → Payouts."
+        else:
+            descripcion = f"Vista previa (sin liquidar): **{filas}** creadores con saldo ≥ ${minimo:.2f}."
+        archivo.seek(0)
+        await interaction.followup.send(
+            content=descripcion,
+            file=discord.File(archivo, filename=f"paypal_{batch_id or 'preview'}.csv"),
+            ephemeral=True
+        )
+    finally:
+        archivo.close()
 
 @main_bot.tree.command(name="admin-control", description="ADMIN: Panel interactivo para auditar, borrar videos y pagar")
 @app_commands.checks.has_permissions(administrator=True)
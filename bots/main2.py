@@ -6,24 +6,46 @@ import asyncpg
 from datetime import datetime
 import asyncio
 import json
+import re
+import tempfile
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
+from bots import backups, difusion
+from bots.diferido import BotDiferido
+from bots.gateway import opciones_gateway
+from bots.sincronizar import sincronizar_comandos
+from bots import outbound
+from bots.outbound import ColaSalida
 
 load_dotenv()
 
+# LRU de miembros resueltos por REST en /encontrar-usuario
+MEMBER_LRU_SIZE = 2048
+MEMBER_LRU_TTL = 600
+# Resultados por búsqueda (un embed admite 25 campos)
+BUSQUEDA_LIMITE = 10
+
+# Miembros por tanda al hacer /backup-servidor (lectura de cuentas y progreso)
+BACKUP_CHUNK_SIZE = int(os.getenv("BACKUP_CHUNK_SIZE", "1000"))
+
 class AdminBot(commands.Bot):
     def __init__(self):
-        intents = discord.Intents.default()
-        intents.message_content = True
-        intents.members = True
-        intents.bans = True
-        
+        # Único bot con miembros completos (backups): chunk a pedido, no al arrancar
         super().__init__(
             command_prefix='!',
-            intents=intents,
-            help_command=None
+            help_command=None,
+            **opciones_gateway("ADMIN_BOT", miembros="lazy", bans=True)
         )
         self.db_pool = None
         self.start_time = datetime.now()
+        # Búsqueda: ¿hay índice trigram? y LRU de miembros resueltos por REST
+        self.trgm_ok = False
+        self.member_lru = OrderedDict()
+        # Anuncios y ediciones salen pausados por bucket (bots/outbound.py)
+        self.salida = ColaSalida("admin")
+        # Difusiones en curso (fanout_id -> Task), ver bots/difusion.py
+        self.difusiones = {}
 
     async def setup_hook(self):
         # Conectar a la base de datos
@@ -35,25 +57,21 @@ class AdminBot(commands.Bot):
         )
 
         await self.create_tables()
+        self.backup_retention_task = asyncio.create_task(self.backup_retention_loop())
 
-        # ===============================
-        # LIMPIEZA DE COMANDOS SOLO DEL ADMIN BOT
-        # ===============================
-        try:
-            guild_id_str = os.getenv("DISCORD_GUILD_ID")
-            if guild_id_str:
-                guild_id = int(guild_id_str)
-                print("🧹 Limpiando comandos del AdminBot...")
-
-                guild = self.get_guild(guild_id)
-                if guild:
-                    synced = await self.tree.sync(guild=guild)
-                    print(f"🔄 Comandos del AdminBot sincronizados en guild: {len(synced)}")
-                else:
-                    print("⚠️ AdminBot aún no está en el servidor (Guild no encontrada en cache).")
-            else:
-                print("⚠️ DISCORD_GUILD_ID no configurado.")
+        # Difusiones que quedaron a medias en el arranque anterior
+        async with self.db_pool.acquire() as conn:
+            pendientes = await difusion.difusiones_pendientes(conn)
+        for fanout_id in pendientes:
+            self.lanzar_difusion(fanout_id)
+        if pendientes:
+            print(f"📢 Reanudando {len(pendientes)} difusiones pendientes")
 
+        # Sync global solo si cambió el árbol de comandos (huella en command_sync_state)
+        try:
+            synced = await sincronizar_comandos(self)
+            if synced is not None:
+                print(f"🔄 Comandos del AdminBot sincronizados: {len(synced)}")
         except Exception as e:
             print(f"❌ Error en setup_hook (admin bot): {e}")
 
@@ -74,6 +92,70 @@ class AdminBot(commands.Bot):
                 )
             ''')
 
+            # Backup en bloques: cada fila es un chunk del snapshot (ver bots/backups.py)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS server_backup_chunks (
+                    backup_id INTEGER REFERENCES server_backups(id) ON DELETE CASCADE,
+                    seq INTEGER,
+                    member_count INTEGER,
+                    data JSONB,
+                    PRIMARY KEY (backup_id, seq)
+                )
+            ''')
+
+            # Borrar un usuario arrastra sus cuentas y métodos de pago (ON DELETE CASCADE)
+            for tabla in ("social_accounts", "payment_methods"):
+                try:
+                    regla = await conn.fetchval(
+                        "SELECT confdeltype FROM pg_constraint WHERE conname = $1",
+                        f"{tabla}_discord_id_fkey"
+                    )
+                    if regla != "c":
+                        async with conn.transaction():
+                            await conn.execute(f"ALTER TABLE {tabla} DROP CONSTRAINT IF EXISTS {tabla}_discord_id_fkey")
+                            await conn.execute(f'''
+                                ALTER TABLE {tabla} ADD CONSTRAINT {tabla}_discord_id_fkey
+                                FOREIGN KEY (discord_id) REFERENCES users(discord_id) ON DELETE CASCADE
+                            ''')
+                        print(f"✅ {tabla}: ON DELETE CASCADE activado")
+                except Exception as e:
+                    print(f"⚠️ Nota sobre cascada en {tabla}: {e}")
+
+            # Índices para /encontrar-usuario (trigram para fuzzy/substring, btree para prefijo)
+            try:
+                await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                await conn.execute('''
+                    CREATE INDEX IF NOT EXISTS social_accounts_username_trgm
+                    ON social_accounts USING gin (lower(username) gin_trgm_ops)
+                ''')
+                # GIN resuelve "contiene"; para "más parecido primero" hace falta GiST: solo GiST
+                # entrega filas ordenadas por distancia (<->) y deja cortar en el LIMIT.
+                # Firma de 256 bytes: con la de 12 por defecto el recorrido KNN casi no poda
+                await conn.execute('''
+                    CREATE INDEX IF NOT EXISTS social_accounts_username_trgm_gist
+                    ON social_accounts USING gist (lower(username) gist_trgm_ops(siglen=256))
+                ''')
+                self.trgm_ok = True
+            except Exception as e:
+                print(f"⚠️ pg_trgm no disponible, búsqueda sin fuzzy: {e}")
+            if self.trgm_ok:
+                # Con plataforma elegida, el KNN filtra dentro del índice en vez de descartar filas de las otras
+                try:
+                    await conn.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+                    await conn.execute('''
+                        CREATE INDEX IF NOT EXISTS social_accounts_platform_username_trgm_gist
+                        ON social_accounts USING gist (platform, lower(username) gist_trgm_ops(siglen=256))
+                    ''')
+                except Exception as e:
+                    print(f"⚠️ btree_gist no disponible, la búsqueda por plataforma usa el índice general: {e}")
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS social_accounts_username_prefix
+                ON social_accounts (lower(username) text_pattern_ops)
+            ''')
+
+            # Backups direccionados por contenido (chunks deduplicados)
+            await backups.crear_tablas(conn)
+
             # Anuncios: created_by ahora es TEXT
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS announcements (
@@ -87,8 +169,48 @@ class AdminBot(commands.Bot):
                 )
             ''')
 
+            # Difusión de anuncios a muchos destinos (estado por entrega)
+            await difusion.crear_tablas(conn)
+
             print("✅ Tablas de administración verificadas")
 
+    async def backup_retention_loop(self):
+        """Una vez al día recorta y compacta los backups de todos los servidores"""
+        await self.wait_until_ready()
+        while not self.is_closed():
+            try:
+                async with self.db_pool.acquire() as conn:
+                    resultado = await backups.aplicar_retencion(conn)
+                print(f"🧹 Retención de backups: {resultado}")
+            except Exception as e:
+                print(f"❌ Error en retención de backups: {e}")
+            await asyncio.sleep(24 * 3600)
+
+    async def resolver_miembro(self, guild, user_id):
+        """Miembro desde la cache del gateway; si no está, REST con LRU acotado"""
+        member = guild.get_member(user_id)
+        if member:
+            return member
+
+        clave = (guild.id, user_id)
+        cacheado = self.member_lru.get(clave)
+        if cacheado and time.monotonic() - cacheado[0] < MEMBER_LRU_TTL:
+            self.member_lru.move_to_end(clave)
+            return cacheado[1]
+
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            member = None  # También cacheamos "no está en el servidor"
+        except discord.HTTPException:
+            return None
+
+        self.member_lru[clave] = (time.monotonic(), member)
+        self.member_lru.move_to_end(clave)
+        while len(self.member_lru) > MEMBER_LRU_SIZE:
+            self.member_lru.popitem(last=False)
+        return member
+
     async def on_ready(self):
         self.start_time = datetime.now()
         print(f'✅ Bot de Administración conectado como {self.user.name}')
@@ -97,8 +219,65 @@ class AdminBot(commands.Bot):
             name="Sistema de Administración"
         ))
 
+    def lanzar_difusion(self, fanout_id, concurrencia=difusion.CONCURRENCIA, al_progreso=None, al_terminar=None):
+        """Corre la difusión en segundo plano (una sola vez por fanout en este proceso)"""
+        if fanout_id in self.difusiones:
+            return self.difusiones[fanout_id]
+
+        async def correr():
+            try:
+                await self.wait_until_ready()
+                reporte = await difusion.ejecutar_difusion(self, fanout_id, concurrencia, al_progreso)
+                if al_terminar and reporte:
+                    await al_terminar(reporte)
+            except Exception as e:
+                print(f"❌ Error en difusión #{fanout_id}: {e}")
+            finally:
+                self.difusiones.pop(fanout_id, None)
+
+        self.difusiones[fanout_id] = asyncio.create_task(correr())
+        return self.difusiones[fanout_id]
+
+    async def close(self):
+        for tarea in self.difusiones.values():
+            tarea.cancel()
+        await self.salida.cerrar()
+        await super().close()
+
 # Inicializar el bot de administración
-admin_bot = AdminBot()
+admin_bot = BotDiferido(AdminBot)  # Se construye al arrancar (ver bots/diferido.py)
+
+# =============================================
+# HELPER: CURSOR ORDENADO (Backups en streaming)
+# =============================================
+
+class CursorOrdenado:
+    """Lee un cursor ordenado por discord_id y lo reparte por tramos de IDs"""
+
+    def __init__(self, cursor, fetch_size=2000):
+        self.cursor = cursor
+        self.fetch_size = fetch_size
+        self.buffer = []
+        self.pos = 0
+        self.agotado = False
+
+    async def hasta(self, ultimo_id):
+        """Agrupa por discord_id todas las filas con discord_id <= ultimo_id"""
+        grupos = {}
+        while True:
+            if self.pos >= len(self.buffer):
+                if self.agotado:
+                    return grupos
+                self.buffer = await self.cursor.fetch(self.fetch_size)
+                self.pos = 0
+                if not self.buffer:
+                    self.agotado = True
+                    return grupos
+            fila = self.buffer[self.pos]
+            if fila['discord_id'] > ultimo_id:
+                return grupos
+            grupos.setdefault(fila['discord_id'], []).append(fila)
+            self.pos += 1
 
 # =============================================
 # 1. COMANDO: ENCONTRAR USUARIO POR REDES SOCIALES
@@ -110,6 +289,7 @@ admin_bot = AdminBot()
     nombre_usuario="Nombre de usuario a buscar"
 )
 @app_commands.choices(plataforma=[
+    app_commands.Choice(name="Todas las plataformas", value="all"),
     app_commands.Choice(name="Twitter/X", value="twitter"),
     app_commands.Choice(name="Instagram", value="instagram"),
     app_commands.Choice(name="TikTok", value="tiktok"),
@@ -121,52 +301,107 @@ admin_bot = AdminBot()
 async def encontrar_usuario(interaction: discord.Interaction, plataforma: str, nombre_usuario: str):
     """Encuentra usuarios del servidor por sus redes sociales"""
     
-    async with admin_bot.db_pool.acquire() as conn:
-        # Buscar en la base de datos
-        usuarios = await conn.fetch(
-            '''
-            SELECT u.discord_id, u.username, sa.username as social_username, sa.is_verified
-            FROM users u
-            JOIN social_accounts sa ON u.discord_id = sa.discord_id
-            WHERE sa.platform = $1 AND sa.username ILIKE $2 AND sa.is_verified = true
-            ''',
-            plataforma, f"%{nombre_usuario}%"
-        )
+    # Antes de cualquier llamada de red: DB + REST de miembros pueden pasar los 3s de la interacción
+    await interaction.response.defer(ephemeral=True)
+    embed = await buscar_usuarios(admin_bot, interaction.guild, plataforma, nombre_usuario)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+async def buscar_usuarios(bot, guild, plataforma, nombre_usuario):
+    """Embed de resultados de /encontrar-usuario (consulta + miembros). Lo mide benchmarks/bench_encontrar_usuario.py"""
+    busqueda = nombre_usuario.lstrip('@').lower().strip()
+    filtro_plataforma = None if plataforma == "all" else plataforma
+    # Escapamos comodines de LIKE para que "_" o "%" se busquen literalmente
+    patron = busqueda.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    
+    # Nada de COUNT(*) OVER () ni ORDER BY sobre todos los matches: cada paso sale de un
+    # índice y corta en el LIMIT, y solo corre si el anterior no llenó la página.
+    # Pedimos uno de más para saber si hay más.
+    limite = BUSQUEDA_LIMITE + 1
+    # Rango [busqueda, siguiente) sobre el índice text_pattern_ops: sirve también en planes genéricos
+    hasta = busqueda[:-1] + chr(ord(busqueda[-1]) + 1) if busqueda else chr(0x10FFFF)
+    
+    async with bot.db_pool.acquire() as conn, conn.transaction():
+        # Planes por valor: con el plan genérico del statement cacheado Postgres no ve el
+        # patrón y deja de elegir bien entre índices (probado en bench_encontrar_usuario)
+        await conn.execute("SET LOCAL plan_cache_mode = force_custom_plan")
+        # 1. Exacto y prefijo, en el orden del índice (el exacto sale primero)
+        usuarios = await conn.fetch('''
+            SELECT u.discord_id, u.username, sa.username as social_username, sa.platform, sa.is_verified
+            FROM social_accounts sa
+            JOIN users u ON u.discord_id = sa.discord_id
+            WHERE sa.is_verified = true
+              AND ($2::text IS NULL OR sa.platform = $2)
+              AND lower(sa.username) ~>=~ $1 AND lower(sa.username) ~<~ $4
+              AND lower(sa.username) LIKE $3 || '%'
+            ORDER BY lower(sa.username) USING ~<~
+            LIMIT $5
+        ''', busqueda, filtro_plataforma, patron, hasta, limite)
+        
+        if bot.trgm_ok and len(usuarios) < limite:
+            # 2. Si no alcanzó: los que contienen el texto (índice trigram, corta en el LIMIT)
+            contienen = await conn.fetch('''
+                SELECT u.discord_id, u.username, sa.username as social_username, sa.platform, sa.is_verified
+                FROM social_accounts sa
+                JOIN users u ON u.discord_id = sa.discord_id
+                WHERE sa.is_verified = true
+                  AND ($1::text IS NULL OR sa.platform = $1)
+                  AND lower(sa.username) LIKE '%' || $2 || '%'
+                LIMIT $3
+            ''', filtro_plataforma, patron, limite + len(usuarios))
+            vistos = {(u['discord_id'], u['platform'], u['social_username']) for u in usuarios}
+            usuarios += [u for u in contienen if (u['discord_id'], u['platform'], u['social_username']) not in vistos]
+
+        if bot.trgm_ok and not usuarios:
+            # 3. Ninguna coincidencia literal (typo): los más parecidos por distancia trigram,
+            #    en el orden del índice GiST (KNN). Es el paso caro, por eso va solo al final
+            usuarios = await conn.fetch('''
+                SELECT u.discord_id, u.username, sa.username as social_username, sa.platform, sa.is_verified
+                FROM social_accounts sa
+                JOIN users u ON u.discord_id = sa.discord_id
+                WHERE sa.is_verified = true
+                  AND ($2::text IS NULL OR sa.platform = $2)
+                  AND lower(sa.username) % $1
+                ORDER BY lower(sa.username) <-> $1
+                LIMIT $3
+            ''', busqueda, filtro_plataforma, limite)
+    
+    hay_mas = len(usuarios) > BUSQUEDA_LIMITE
+    usuarios = usuarios[:BUSQUEDA_LIMITE]
+    
+    nombre_plataforma = "todas las plataformas" if plataforma == "all" else plataforma
     
     if not usuarios:
         embed = discord.Embed(
             title="🔍 Búsqueda de Usuario",
-            description=f"No se encontraron usuarios con **{nombre_usuario}** en **{plataforma}**",
+            description=f"No se encontraron usuarios con **{nombre_usuario}** en **{nombre_plataforma}**",
             color=0xff0000
         )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
+        return embed
     
     embed = discord.Embed(
         title="🔍 Resultados de Búsqueda",
-        description=f"Usuarios encontrados en **{plataforma}** con: `{nombre_usuario}`",
+        description=f"Usuarios encontrados en **{nombre_plataforma}** con: `{nombre_usuario}`",
         color=0x00ff00
     )
     
-    for i, usuario in enumerate(usuarios[:10], 1):  # Mostrar máximo 10 resultados
-        try:
-            # Convertimos a int para discord.py, ya que viene como str de la DB
-            user_id_int = int(usuario['discord_id'])
-            user = await interaction.guild.fetch_member(user_id_int)
-            user_mention = user.mention
-        except:
-            user_mention = f"`{usuario['username']}` (No en el servidor)"
+    # Resolvemos los miembros en paralelo (cache del gateway + LRU de REST)
+    miembros = await asyncio.gather(*[
+        bot.resolver_miembro(guild, int(u['discord_id'])) for u in usuarios
+    ])
+    
+    for i, (usuario, member) in enumerate(zip(usuarios, miembros), 1):
+        user_mention = member.mention if member else f"`{usuario['username']}` (No en el servidor)"
         
         embed.add_field(
-            name=f"#{i} {usuario['social_username']}",
+            name=f"#{i} {usuario['social_username']} ({usuario['platform']})",
             value=f"Discord: {user_mention}\nEstado: {'✅ Verificado' if usuario['is_verified'] else '❌ No verificado'}",
             inline=False
         )
     
-    if len(usuarios) > 10:
-        embed.set_footer(text=f"Mostrando 10 de {len(usuarios)} resultados encontrados")
+    if hay_mas:
+        embed.set_footer(text=f"Mostrando los {len(usuarios)} más parecidos; hay más resultados, afina la búsqueda")
     
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    return embed
 
 # =============================================
 # 2. COMANDO: BACKUP DEL SERVIDOR
@@ -181,56 +416,90 @@ async def backup_servidor(interaction: discord.Interaction, nombre_backup: str =
     """Crea un backup completo del servidor"""
     
     await interaction.response.defer(ephemeral=True)
+    progreso = await interaction.followup.send("⏳ Preparando backup...", ephemeral=True, wait=True)
     
-    # Recolectar datos de miembros
-    miembros_data = []
-    total_miembros = 0
+    # La guild no se chunkea al arrancar: la pedimos completa solo para el backup
+    if not interaction.guild.chunked:
+        await progreso.edit(content="⏳ Descargando lista de miembros...")
+        await interaction.guild.chunk()
+
+    # Miembros ordenados por ID (texto) para cruzarlos con las cuentas en streaming
+    miembros = sorted((m for m in interaction.guild.members if not m.bot), key=lambda m: str(m.id))
+    total_miembros = len(miembros)
     miembros_con_cuentas = 0
+    backup_name = nombre_backup or f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    async with admin_bot.db_pool.acquire() as conn:
-        for member in interaction.guild.members:
-            if not member.bot:  # Ignorar bots
-                total_miembros += 1
-                
-                # Obtener cuentas sociales del miembro
-                # ⚠️ IMPORTANTE: Casting de member.id (int) a str para la DB
-                cuentas_sociales = await conn.fetch(
-                    'SELECT platform, username, is_verified FROM social_accounts WHERE discord_id = $1',
-                    str(member.id)
-                )
-                
-                miembro_info = {
-                    'discord_id': str(member.id),
-                    'username': str(member),
-                    'joined_at': member.joined_at.isoformat() if member.joined_at else None,
-                    'cuentas_sociales': [
-                        {
-                            'platform': cuenta['platform'],
-                            'username': cuenta['username'],
-                            'verified': cuenta['is_verified']
-                        } for cuenta in cuentas_sociales
-                    ]
-                }
-                
-                if cuentas_sociales:
-                    miembros_con_cuentas += 1
-                
-                miembros_data.append(miembro_info)
-        
-        # Guardar backup en la base de datos
-        backup_name = nombre_backup or f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
-        await conn.execute(
-            '''
-            INSERT INTO server_backups (guild_id, backup_name, member_count, backup_data, created_by)
-            VALUES ($1, $2, $3, $4, $5)
-            ''',
-            interaction.guild.id, 
-            backup_name, 
-            total_miembros, 
-            json.dumps(miembros_data), 
-            str(interaction.user.id) # ⚠️ Casting a str
-        )
+    # Conexión propia: el pool del admin tiene una sola y un backup grande tarda
+    # minutos (snapshot + retención); los demás comandos siguen usando el pool
+    conn = await asyncpg.connect(os.getenv('DATABASE_URL'), ssl='require')
+    try:
+        async with conn.transaction():
+            # Antes de leer los hashes del padre: el GC no los puede borrar hasta el commit
+            await backups.bloquear_gc(conn)
+            # El snapshot anterior es el padre de la cadena: sus chunks no se vuelven a escribir
+            parent_id = await conn.fetchval(
+                'SELECT id FROM server_backups WHERE guild_id = $1 ORDER BY id DESC LIMIT 1',
+                interaction.guild.id
+            )
+            backup_id = await conn.fetchval(
+                '''
+                INSERT INTO server_backups (guild_id, backup_name, member_count, created_by, parent_id)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING id
+                ''',
+                interaction.guild.id, 
+                backup_name, 
+                total_miembros, 
+                str(interaction.user.id), # ⚠️ Casting a str
+                parent_id
+            )
+            escritor = backups.EscritorBackup(conn, backup_id, await backups.hashes_de_backup(conn, parent_id))
+
+            # Una sola consulta para las cuentas de TODOS los miembros, leída por cursor
+            cuentas = CursorOrdenado(await conn.cursor(
+                '''
+                SELECT discord_id, platform, username, is_verified
+                FROM social_accounts
+                WHERE discord_id = ANY($1::text[])
+                ORDER BY discord_id COLLATE "C", platform, username
+                ''',
+                [str(m.id) for m in miembros]
+            ))
+
+            ultimo_aviso = 0
+            for inicio in range(0, total_miembros, BACKUP_CHUNK_SIZE):
+                bloque = miembros[inicio:inicio + BACKUP_CHUNK_SIZE]
+                cuentas_bloque = await cuentas.hasta(str(bloque[-1].id))
+
+                for member in bloque:
+                    cuentas_sociales = cuentas_bloque.get(str(member.id), [])
+                    if cuentas_sociales:
+                        miembros_con_cuentas += 1
+                    await escritor.agregar({
+                        'discord_id': str(member.id),
+                        'username': str(member),
+                        'joined_at': member.joined_at.isoformat() if member.joined_at else None,
+                        'cuentas_sociales': [
+                            {
+                                'platform': cuenta['platform'],
+                                'username': cuenta['username'],
+                                'verified': cuenta['is_verified']
+                            } for cuenta in cuentas_sociales
+                        ]
+                    })
+
+                # Progreso para el admin (como mucho cada 2 segundos)
+                procesados = inicio + len(bloque)
+                if time.monotonic() - ultimo_aviso > 2 or procesados == total_miembros:
+                    ultimo_aviso = time.monotonic()
+                    await progreso.edit(content=f"⏳ Respaldando miembros... **{procesados:,}/{total_miembros:,}**")
+
+            stats = await escritor.cerrar()
+
+        # Recortar cadenas viejas y liberar chunks huérfanos
+        await backups.aplicar_retencion(conn, interaction.guild.id)
+    finally:
+        await conn.close()
     
     # Crear embed de resultados
     embed = discord.Embed(
@@ -244,6 +513,12 @@ async def backup_servidor(interaction: discord.Interaction, nombre_backup: str =
     embed.add_field(name="📱 Con Cuentas", value=miembros_con_cuentas, inline=True)
     embed.add_field(name="👤 Creado por", value=interaction.user.mention, inline=True)
     
+    embed.add_field(
+        name="🧩 Almacenamiento",
+        value=f"{stats['chunks_nuevos']} de {stats['chunks']} bloques nuevos ({stats['bytes_nuevos'] / 1024:.1f} KB escritos)",
+        inline=False
+    )
+    
     embed.add_field(
         name="📊 Estadísticas",
         value=(
@@ -256,7 +531,158 @@ async def backup_servidor(interaction: discord.Interaction, nombre_backup: str =
     
     embed.set_footer(text="El backup incluye información de miembros y sus cuentas sociales verificadas")
     
+    await progreso.edit(content=None, embed=embed)
+
+@admin_bot.tree.command(name="compactar-backups", description="Recorta backups viejos y libera bloques sin uso")
+@app_commands.describe(conservar="Cuántos backups recientes conservar (default: BACKUP_RETENTION)")
+@app_commands.default_permissions(administrator=True)
+async def compactar_backups(interaction: discord.Interaction, conservar: int = None):
+    """Retención manual de la cadena de backups del servidor"""
+    
+    await interaction.response.defer(ephemeral=True)
+    
+    async with admin_bot.db_pool.acquire() as conn:
+        resultado = await backups.aplicar_retencion(conn, interaction.guild.id, max(1, conservar or backups.BACKUP_RETENTION))
+    
+    await interaction.followup.send(
+        f"🧹 Backups borrados: **{resultado['backups_borrados']}** • "
+        f"Compactados: **{resultado['backups_compactados']}** • "
+        f"Bloques liberados: **{resultado['chunks_liberados']}**",
+        ephemeral=True
+    )
+
+async def backup_del_servidor(conn, guild_id, backup_id):
+    return await conn.fetchrow(
+        'SELECT id, backup_name, member_count, parent_id, created_at FROM server_backups WHERE id = $1 AND guild_id = $2',
+        backup_id, guild_id
+    )
+
+@admin_bot.tree.command(name="listar-backups", description="Muestra los backups guardados del servidor")
+@app_commands.default_permissions(administrator=True)
+async def listar_backups(interaction: discord.Interaction):
+    """Lista los últimos backups para elegir cuál restaurar o comparar"""
+    
+    async with admin_bot.db_pool.acquire() as conn:
+        filas = await conn.fetch(
+            'SELECT id, backup_name, member_count, created_at FROM server_backups WHERE guild_id = $1 ORDER BY id DESC LIMIT 15',
+            interaction.guild.id
+        )
+    
+    if not filas:
+        await interaction.response.send_message("📭 Este servidor no tiene backups.", ephemeral=True)
+        return
+    
+    embed = discord.Embed(title="💾 Backups del Servidor", color=0x3498db)
+    embed.description = "\n".join(
+        f"**#{f['id']}** `{f['backup_name']}` • {f['member_count']} miembros • {f['created_at'].strftime('%Y-%m-%d %H:%M')}"
+        for f in filas
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@admin_bot.tree.command(name="restaurar-backup", description="Restaura usuarios y cuentas sociales desde un backup")
+@app_commands.describe(
+    backup_id="ID del backup (ver /listar-backups)",
+    reemplazar="Borrar también las cuentas que no estaban en el backup"
+)
+@app_commands.default_permissions(administrator=True)
+async def restaurar_backup(interaction: discord.Interaction, backup_id: int, reemplazar: bool = False):
+    """Recarga users y social_accounts desde un backup (COPY + una transacción)"""
+    
+    await interaction.response.defer(ephemeral=True)
+    
+    # Conexión propia (como /backup-servidor): el pool del admin tiene una sola
+    conn = await asyncpg.connect(os.getenv('DATABASE_URL'), ssl='require')
+    try:
+        backup = await backup_del_servidor(conn, interaction.guild.id, backup_id)
+        if not backup:
+            await interaction.followup.send("❌ Backup no encontrado en este servidor.", ephemeral=True)
+            return
+        try:
+            resultado = await backups.restaurar_backup(conn, backup_id, reemplazar)
+        except Exception as e:
+            print(f"❌ Error restaurando backup #{backup_id}: {e}")
+            await interaction.followup.send(f"❌ Error restaurando (no se aplicó ningún cambio): {e}", ephemeral=True)
+            return
+    finally:
+        await conn.close()
+    
+    embed = discord.Embed(
+        title="♻️ Backup Restaurado",
+        description=f"Se restauró **{backup['backup_name']}** (#{backup_id})",
+        color=0x00ff00,
+        timestamp=datetime.now()
+    )
+    embed.add_field(name="👥 Usuarios", value=resultado['usuarios'], inline=True)
+    embed.add_field(name="📱 Cuentas", value=resultado['cuentas'], inline=True)
+    embed.add_field(name="🗑️ Cuentas Borradas", value=resultado['cuentas_borradas'], inline=True)
+    embed.set_footer(text=f"Admin: {interaction.user.name}")
     await interaction.followup.send(embed=embed, ephemeral=True)
+    print(f"♻️ Backup #{backup_id} restaurado por {interaction.user.name}: {resultado}")
+
+@admin_bot.tree.command(name="diff-backups", description="Compara dos backups y lista los miembros y cuentas que cambiaron")
+@app_commands.describe(
+    backup_nuevo="ID del backup más reciente",
+    backup_viejo="ID del backup anterior (por defecto, el padre del nuevo)"
+)
+@app_commands.default_permissions(administrator=True)
+async def diff_backups(interaction: discord.Interaction, backup_nuevo: int, backup_viejo: int = None):
+    """Genera un archivo con las diferencias entre dos snapshots"""
+    
+    await interaction.response.defer(ephemeral=True)
+    conteo = {"added": 0, "removed": 0, "changed": 0}
+    simbolos = {"added": "+", "removed": "-", "changed": "~"}
+
+    def describir(registro):
+        if not registro:
+            return "(sin datos)"
+        cuentas = ", ".join(
+            f"{c['platform']}:{c['username']}{' ✅' if c.get('verified') else ''}" for c in registro.get('cuentas_sociales') or []
+        )
+        return f"{registro.get('username')} [{cuentas or 'sin cuentas'}]"
+
+    # El diff se escribe a disco a medida que sale, nunca entero en memoria
+    archivo = tempfile.TemporaryFile()
+    try:
+        # Conexión propia: un diff grande no debe tomar la única conexión del pool
+        conn = await asyncpg.connect(os.getenv('DATABASE_URL'), ssl='require')
+        try:
+            nuevo = await backup_del_servidor(conn, interaction.guild.id, backup_nuevo)
+            viejo_id = backup_viejo or (nuevo['parent_id'] if nuevo else None)
+            viejo = await backup_del_servidor(conn, interaction.guild.id, viejo_id) if viejo_id else None
+            if not nuevo or not viejo:
+                await interaction.followup.send("❌ No encontré los dos backups a comparar en este servidor.", ephemeral=True)
+                return
+
+            async for tipo, discord_id, antes, despues in backups.diferencias(conn, viejo['id'], nuevo['id']):
+                conteo[tipo] += 1
+                if tipo == "changed":
+                    linea = f"~ {discord_id}: {describir(antes)} -> {describir(despues)}\n"
+                else:
+                    linea = f"{simbolos[tipo]} {discord_id}: {describir(antes or despues)}\n"
+                archivo.write(linea.encode())
+        finally:
+            await conn.close()
+
+        embed = discord.Embed(
+            title="🔍 Diferencias entre Backups",
+            description=f"**#{viejo['id']}** `{viejo['backup_name']}` → **#{nuevo['id']}** `{nuevo['backup_name']}`",
+            color=0x3498db
+        )
+        embed.add_field(name="➕ Nuevos", value=conteo['added'], inline=True)
+        embed.add_field(name="➖ Eliminados", value=conteo['removed'], inline=True)
+        embed.add_field(name="✏️ Cambiados", value=conteo['changed'], inline=True)
+
+        if sum(conteo.values()) == 0:
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
+        archivo.seek(0)
+        await interaction.followup.send(
+            embed=embed,
+            file=discord.File(archivo, filename=f"diff_{viejo['id']}_{nuevo['id']}.txt"),
+            ephemeral=True
+        )
+    finally:
+        archivo.close()
 
 # =============================================
 # 3. COMANDO: VERIFICAR BANEOS
@@ -349,28 +775,18 @@ async def crear_anuncio(
         canal = interaction.channel
     
     # Crear embed del anuncio
-    anuncio_embed = discord.Embed(
-        title=f"📢 {titulo}",
-        description=mensaje,
-        color=0xffd700,
-        timestamp=datetime.now()
-    )
-    
-    anuncio_embed.add_field(
-        name="ℹ️ Información",
-        value="Este es un anuncio oficial del servidor",
-        inline=False
-    )
-    
-    anuncio_embed.set_footer(text=f"Anuncio por {interaction.user.name}")
+    anuncio_embed = difusion.embed_anuncio(titulo, mensaje, interaction.user.name)
     
+    # Envío + DB pueden pasar los 3s de la interacción
+    await interaction.response.defer(ephemeral=True)
+
     try:
-        # Publicar anuncio
-        mensaje_anuncio = await canal.send(embed=anuncio_embed)
+        # Publicar anuncio (crítico: la confirmación espera el mensaje)
+        mensaje_anuncio = await admin_bot.salida.enviar(canal, embed=anuncio_embed, prioridad=outbound.CRITICA)
         
-        # Opcional: mencionar everyone/here si es un canal de anuncios
+        # Opcional: mencionar everyone/here si es un canal de anuncios (no hace falta esperarlo)
         if "anuncios" in canal.name.lower() or "announcements" in canal.name.lower():
-            await mensaje_anuncio.edit(content="@everyone")
+            admin_bot.salida.editar(mensaje_anuncio, content="@everyone", etiqueta=f"mención del anuncio en #{canal.name}")
         
         # Guardar en base de datos
         async with admin_bot.db_pool.acquire() as conn:
@@ -394,7 +810,7 @@ async def crear_anuncio(
         confirm_embed.add_field(name="📝 Canal", value=canal.mention, inline=True)
         confirm_embed.add_field(name="👤 Publicado por", value=interaction.user.mention, inline=True)
         
-        await interaction.response.send_message(embed=confirm_embed, ephemeral=True)
+        await interaction.followup.send(embed=confirm_embed, ephemeral=True)
         
         print(f"📢 Anuncio publicado por {interaction.user.name} en {canal.name}")
         
@@ -404,12 +820,196 @@ async def crear_anuncio(
             description=f"No se pudo publicar el anuncio: {str(e)}",
             color=0xff0000
         )
-        await interaction.response.send_message(embed=error_embed, ephemeral=True)
+        await interaction.followup.send(embed=error_embed, ephemeral=True)
+
+# =============================================
+# 4b. COMANDO: DIFUNDIR ANUNCIO (muchos canales / DMs)
+# =============================================
+
+def embed_reporte_difusion(reporte, errores=()):
+    color = 0x00ff00 if not reporte['fallidos'] else 0xffa500
+    embed = discord.Embed(title=f"📢 Difusión #{reporte['fanout_id']} terminada", color=color)
+    embed.add_field(name="✅ Entregados", value=f"{reporte['enviados']:,}/{reporte['total']:,}", inline=True)
+    embed.add_field(name="❌ Fallidos", value=f"{reporte['fallidos']:,}", inline=True)
+    embed.add_field(name="❔ Sin confirmar", value=f"{reporte['desconocidos']:,}", inline=True)
+    embed.add_field(name="⏱️ Ritmo", value=f"{reporte['procesados']:,} en {reporte['segundos']}s ({reporte['por_segundo']}/s)", inline=False)
+    if errores:
+        embed.add_field(name="Errores más comunes", value="\n".join(f"`{e['error']}`: {e['n']}" for e in errores), inline=False)
+    return embed
+
+@admin_bot.tree.command(name="difundir-anuncio", description="Publica un anuncio en varios canales y/o por DM")
+@app_commands.describe(
+    titulo="Título del anuncio",
+    mensaje="Mensaje del anuncio",
+    canales="Canales destino (menciones o IDs separados por espacio)",
+    rol="Enviar por DM a todos los miembros con este rol",
+    creadores_verificados="Enviar por DM a todos los creadores con una cuenta verificada",
+    concurrencia="Entregas en vuelo a la vez (1-32)"
+)
+@app_commands.default_permissions(administrator=True)
+async def difundir_anuncio(
+    interaction: discord.Interaction,
+    titulo: str,
+    mensaje: str,
+    canales: str = None,
+    rol: discord.Role = None,
+    creadores_verificados: bool = False,
+    concurrencia: app_commands.Range[int, 1, 32] = difusion.CONCURRENCIA
+):
+    await interaction.response.defer(ephemeral=True)
+
+    ids_canales = {int(x) for x in re.findall(r"\d{15,21}", canales or "")}
+    ids_usuarios = set()
+    if rol:
+        # Los miembros del rol salen de la cache: chunk a pedido (política lazy)
+        if not interaction.guild.chunked:
+            await interaction.guild.chunk()
+        ids_usuarios = {m.id for m in rol.members if not m.bot}
+
+    if not ids_canales and not ids_usuarios and not creadores_verificados:
+        return await interaction.followup.send("❌ Indica al menos un destino: canales, rol o creadores verificados.", ephemeral=True)
+
+    async with admin_bot.db_pool.acquire() as conn:
+        fanout_id, total = await difusion.crear_difusion(
+            conn, interaction.guild.id, titulo, mensaje, str(interaction.user.id), interaction.user.name,
+            canales=ids_canales, usuarios=ids_usuarios, creadores_verificados=creadores_verificados
+        )
+
+    if not total:
+        async with admin_bot.db_pool.acquire() as conn:
+            await conn.execute("UPDATE announcement_fanouts SET status = 'done', finished_at = NOW() WHERE id = $1", fanout_id)
+        return await interaction.followup.send("📭 La selección no tiene destinos.", ephemeral=True)
+
+    progreso = await interaction.followup.send(
+        f"🚀 Difusión **#{fanout_id}** en marcha: **{total:,}** destinos (concurrencia {concurrencia}).",
+        ephemeral=True, wait=True
+    )
+
+    async def al_progreso(hechos, total):
+        # Ediciones seguidas al mismo mensaje se fusionan en la cola de salida
+        admin_bot.salida.editar(progreso, content=f"⏳ Difusión **#{fanout_id}**: **{hechos:,}/{total:,}** procesados...", etiqueta="progreso de difusión")
+
+    async def al_terminar(reporte):
+        async with admin_bot.db_pool.acquire() as conn:
+            errores = await difusion.errores_frecuentes(conn, fanout_id)
+        embed = embed_reporte_difusion(reporte, errores)
+        # El token de la interacción vive 15 min; después solo queda el log
+        if (discord.utils.utcnow() - interaction.created_at).total_seconds() < 14 * 60:
+            admin_bot.salida.editar(progreso, content=None, embed=embed, etiqueta="reporte de difusión")
+
+    admin_bot.lanzar_difusion(fanout_id, concurrencia, al_progreso, al_terminar)
+    print(f"📢 Difusión #{fanout_id} creada por {interaction.user.name}: {total} destinos")
+
+@admin_bot.tree.command(name="estado-difusion", description="Estado de entrega de una difusión")
+@app_commands.describe(fanout_id="ID de la difusión")
+@app_commands.default_permissions(administrator=True)
+async def estado_difusion(interaction: discord.Interaction, fanout_id: int):
+    async with admin_bot.db_pool.acquire() as conn:
+        fanout = await conn.fetchrow("SELECT * FROM announcement_fanouts WHERE id = $1 AND guild_id = $2", fanout_id, interaction.guild.id)
+        if not fanout:
+            return await interaction.response.send_message("❌ Difusión no encontrada en este servidor.", ephemeral=True)
+        estados = await difusion.resumen(conn, fanout_id)
+        errores = await difusion.errores_frecuentes(conn, fanout_id)
+
+    embed = discord.Embed(title=f"📢 Difusión #{fanout_id}: {fanout['title']}", color=0xffd700)
+    embed.add_field(name="Estado", value="🟢 En curso" if fanout['status'] == 'running' else "✅ Terminada", inline=True)
+    embed.add_field(name="Destinos", value=f"{fanout['total']:,}", inline=True)
+    embed.add_field(
+        name="Entregas",
+        value=" · ".join(f"{k}: **{v:,}**" for k, v in sorted(estados.items())) or "—",
+        inline=False
+    )
+    if errores:
+        embed.add_field(name="Errores más comunes", value="\n".join(f"`{e['error']}`: {e['n']}" for e in errores), inline=False)
+    if fanout['finished_at']:
+        segundos = (fanout['finished_at'] - fanout['created_at']).total_seconds()
+        embed.set_footer(text=f"Duración total: {segundos:.0f}s")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # =============================================
 # 5. COMANDO: REMOVER CUENTA
 # =============================================
 
+# Tablas de videos por plataforma (Twitter/Twitch no tienen tracking de videos)
+TABLAS_POSTS = {
+    "youtube": "tracked_posts",
+    "tiktok": "tracked_posts_tiktok",
+    "instagram": "tracked_posts_instagram",
+}
+
+async def purgar_usuarios(conn, discord_ids, plataforma="all", nombre_usuario=None):
+    """Borra los datos de uno o varios usuarios de TODAS las tablas en una transacción.
+
+    Con plataforma="all" borra también pagos, equipos y la fila de users
+    (social_accounts y payment_methods caen por ON DELETE CASCADE). Devuelve
+    cuántas filas se borraron por tabla.
+    """
+    ids_bigint = [int(i) for i in discord_ids]
+    borrado = {}
+
+    async with conn.transaction():
+        # Tablas que crean los otros bots: pueden no existir todavía
+        existentes = {
+            r["t"] for r in await conn.fetch(
+                "SELECT t FROM unnest($1::text[]) t WHERE to_regclass(t) IS NOT NULL",
+                ["verification_jobs", "teams", "team_members"]
+            )
+        }
+
+        tablas = TABLAS_POSTS.values() if plataforma == "all" else [TABLAS_POSTS[plataforma]] if plataforma in TABLAS_POSTS else []
+        for tabla in tablas:
+            res = await conn.execute(f"DELETE FROM {tabla} WHERE discord_id = ANY($1::text[])", discord_ids)
+            borrado[tabla] = int(res.split()[-1])
+        for tabla in TABLAS_POSTS.values():
+            borrado.setdefault(tabla, 0)
+
+        if "verification_jobs" in existentes:
+            await conn.execute(
+                "DELETE FROM verification_jobs WHERE discord_id = ANY($1::text[]) AND ($2 = 'all' OR platform = $2)",
+                discord_ids, plataforma
+            )
+
+        if plataforma == "all":
+            borrado["social_accounts"] = await conn.fetchval(
+                "SELECT COUNT(*) FROM social_accounts WHERE discord_id = ANY($1::text[])", discord_ids
+            )
+            borrado["payment_methods"] = await conn.fetchval(
+                "SELECT COUNT(*) FROM payment_methods WHERE discord_id = ANY($1::text[])", discord_ids
+            )
+
+            borrado["teams"] = borrado["team_members"] = 0
+            if "team_members" in existentes:
+                res = await conn.execute("DELETE FROM team_members WHERE user_id = ANY($1::bigint[])", ids_bigint)
+                borrado["team_members"] = int(res.split()[-1])
+            if "teams" in existentes:
+                # Los miembros de sus equipos caen por ON DELETE CASCADE
+                res = await conn.execute("DELETE FROM teams WHERE owner_id = ANY($1::bigint[])", ids_bigint)
+                borrado["teams"] = int(res.split()[-1])
+
+            res = await conn.execute("DELETE FROM users WHERE discord_id = ANY($1::text[])", discord_ids)
+            borrado["users"] = int(res.split()[-1])
+        else:
+            if nombre_usuario:
+                res = await conn.execute(
+                    'DELETE FROM social_accounts WHERE discord_id = ANY($1::text[]) AND platform = $2 AND username = $3',
+                    discord_ids, plataforma, nombre_usuario
+                )
+            else:
+                res = await conn.execute(
+                    'DELETE FROM social_accounts WHERE discord_id = ANY($1::text[]) AND platform = $2',
+                    discord_ids, plataforma
+                )
+            borrado["social_accounts"] = int(res.split()[-1])
+
+        # Avisamos a metrics_server para que refresque /users/active
+        await conn.execute("SELECT pg_notify('social_accounts_changed', $1)", "" if plataforma == "all" else plataforma)
+        if borrado.get("teams") or borrado.get("team_members"):
+            # El bot de equipos recarga su cache de membresías
+            await conn.execute("SELECT pg_notify('teams_changed', ':admin')")
+
+    return borrado
+
+
 @admin_bot.tree.command(name="remover-cuenta", description="Remover completamente una cuenta y sus datos")
 @app_commands.describe(
     usuario="Usuario de Discord",
@@ -438,64 +1038,65 @@ async def remover_cuenta(
 
     async with admin_bot.db_pool.acquire() as conn:
         try:
-            if plataforma == "all":
-                # 1. Borrar VIDEOS (Métricas) de todas las tablas
-                deleted_yt = await conn.execute("DELETE FROM tracked_posts WHERE discord_id = $1", discord_id_str)
-                deleted_tt = await conn.execute("DELETE FROM tracked_posts_tiktok WHERE discord_id = $1", discord_id_str)
-                
-                # 2. Borrar Cuentas Sociales
-                deleted_social = await conn.execute("DELETE FROM social_accounts WHERE discord_id = $1", discord_id_str)
-                
-                # 3. Borrar Métodos de Pago
-                await conn.execute("DELETE FROM payment_methods WHERE discord_id = $1", discord_id_str)
-                
-                # 4. Borrar Usuario de la tabla principal (Esto baja el contador de Usuarios Registrados)
-                deleted_user = await conn.execute("DELETE FROM users WHERE discord_id = $1", discord_id_str)
-
-                if deleted_social == "DELETE 0" and deleted_user == "DELETE 0":
-                    await interaction.followup.send(f"❌ {usuario.mention} no tiene datos registrados.", ephemeral=True)
-                    return
-
-                embed = discord.Embed(title="🗑️ Limpieza Completa Exitosa", color=0x00ff00)
-                embed.description = f"Se han eliminado todos los registros de {usuario.mention}."
-                embed.add_field(name="Videos Eliminados", value=f"YouTube: {deleted_yt}\nTikTok: {deleted_tt}", inline=True)
-                embed.add_field(name="Cuentas Desvinculadas", value=deleted_social.replace("DELETE ", ""), inline=True)
+            borrado = await purgar_usuarios(conn, [discord_id_str], plataforma, nombre_usuario)
+        except Exception as e:
+            print(f"❌ Error borrando cuenta: {e}")
+            await interaction.followup.send(f"❌ Error interno al borrar (no se borró nada): {e}", ephemeral=True)
+            return
 
-            else:
-                # Borrado específico por plataforma
-                if plataforma == "youtube":
-                    # Si borramos YouTube, borramos sus videos también
-                    await conn.execute("DELETE FROM tracked_posts WHERE discord_id = $1", discord_id_str)
-                
-                elif plataforma == "tiktok":
-                    # Si borramos TikTok, borramos sus videos también
-                    await conn.execute("DELETE FROM tracked_posts_tiktok WHERE discord_id = $1", discord_id_str)
-
-                # Borrar la vinculación social
-                if nombre_usuario:
-                    result = await conn.execute(
-                        'DELETE FROM social_accounts WHERE discord_id = $1 AND platform = $2 AND username = $3',
-                        discord_id_str, plataforma, nombre_usuario
-                    )
-                else:
-                    result = await conn.execute(
-                        'DELETE FROM social_accounts WHERE discord_id = $1 AND platform = $2',
-                        discord_id_str, plataforma
-                    )
+    if plataforma == "all":
+        if borrado["social_accounts"] == 0 and borrado["users"] == 0:
+            await interaction.followup.send(f"❌ {usuario.mention} no tiene datos registrados.", ephemeral=True)
+            return
+
+        embed = discord.Embed(title="🗑️ Limpieza Completa Exitosa", color=0x00ff00)
+        embed.description = f"Se han eliminado todos los registros de {usuario.mention}."
+        embed.add_field(
+            name="Videos Eliminados",
+            value=f"YouTube: {borrado['tracked_posts']}\nTikTok: {borrado['tracked_posts_tiktok']}\nInstagram: {borrado['tracked_posts_instagram']}",
+            inline=True
+        )
+        embed.add_field(name="Cuentas Desvinculadas", value=borrado["social_accounts"], inline=True)
+        if borrado["teams"] or borrado["team_members"]:
+            embed.add_field(name="Equipos", value=f"Propios: {borrado['teams']}\nMembresías: {borrado['team_members']}", inline=True)
 
-                if result == "DELETE 0":
-                    await interaction.followup.send(f"❌ No se encontraron cuentas de **{plataforma}** para ese usuario.", ephemeral=True)
-                    return
+    else:
+        if borrado["social_accounts"] == 0:
+            await interaction.followup.send(f"❌ No se encontraron cuentas de **{plataforma}** para ese usuario.", ephemeral=True)
+            return
 
-                embed = discord.Embed(title="✅ Cuenta Removida", color=0x00ff00)
-                embed.description = f"Se han eliminado las cuentas y videos de **{plataforma}** para {usuario.mention}."
+        embed = discord.Embed(title="✅ Cuenta Removida", color=0x00ff00)
+        embed.description = f"Se han eliminado las cuentas y videos de **{plataforma}** para {usuario.mention}."
 
-            embed.set_footer(text=f"Admin: {interaction.user.name} • Acción irreversible")
-            await interaction.followup.send(embed=embed, ephemeral=True)
+    embed.set_footer(text=f"Admin: {interaction.user.name} • Acción irreversible")
+    await interaction.followup.send(embed=embed, ephemeral=True)
 
+@admin_bot.tree.command(name="purgar-usuarios", description="Borra por completo los datos de varios usuarios a la vez")
+@app_commands.describe(ids="IDs o menciones de Discord separados por espacio o coma")
+@app_commands.default_permissions(administrator=True)
+async def purgar_usuarios_cmd(interaction: discord.Interaction, ids: str):
+    """Purga masiva: todas las tablas, una sola transacción"""
+    
+    await interaction.response.defer(ephemeral=True)
+    discord_ids = sorted(set(re.findall(r"\d{15,21}", ids)))
+    if not discord_ids:
+        await interaction.followup.send("❌ No encontré IDs de Discord válidos.", ephemeral=True)
+        return
+
+    async with admin_bot.db_pool.acquire() as conn:
+        try:
+            borrado = await purgar_usuarios(conn, discord_ids)
         except Exception as e:
-            print(f"❌ Error borrando cuenta: {e}")
-            await interaction.followup.send(f"❌ Error interno al borrar: {e}", ephemeral=True)
+            print(f"❌ Error en purga masiva: {e}")
+            await interaction.followup.send(f"❌ Error interno (no se borró nada): {e}", ephemeral=True)
+            return
+
+    embed = discord.Embed(title="🗑️ Purga Completada", color=0x00ff00)
+    embed.description = f"Se procesaron **{len(discord_ids)}** usuarios."
+    embed.add_field(name="Detalle", value="\n".join(f"`{tabla}`: {n}" for tabla, n in borrado.items()), inline=False)
+    embed.set_footer(text=f"Admin: {interaction.user.name} • Acción irreversible")
+    await interaction.followup.send(embed=embed, ephemeral=True)
+    print(f"🗑️ Purga de {len(discord_ids)} usuarios por {interaction.user.name}: {borrado}")
 
 # =============================================
 # COMANDO SYNC PARA ADMIN BOT
@@ -513,19 +1114,25 @@ async def sync_admin(interaction: discord.Interaction):
         await interaction.response.send_message("❌ Solo el owner puede usar este comando.", ephemeral=True)
         return
     
+    await interaction.response.defer(ephemeral=True)
     try:
-        synced = await admin_bot.tree.sync()
-        await interaction.response.send_message(
+        synced = await sincronizar_comandos(admin_bot, forzar=True)
+        await interaction.followup.send(
             f"✅ Sincronizados {len(synced)} comandos de administración.", 
             ephemeral=True
         )
         print(f"✅ {len(synced)} comandos de admin sincronizados")
     except Exception as e:
-        await interaction.response.send_message(
+        await interaction.followup.send(
             f"❌ Error sincronizando: {str(e)}", 
             ephemeral=True
         )
 
+@admin_bot.tree.command(name="cola-salida-admin", description="Métricas de la cola de mensajes salientes del bot de administración")
+@app_commands.default_permissions(administrator=True)
+async def cola_salida_admin(interaction: discord.Interaction):
+    await interaction.response.send_message(embed=outbound.embed_metricas(admin_bot.salida), ephemeral=True)
+
 # =============================================
 # EJECUCIÓN DEL BOT DE ADMINISTRACIÓN
 # =============================================
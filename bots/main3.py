@@ -3,7 +3,12 @@ from discord import app_commands
 from discord.ext import commands
 import asyncpg, asyncio, os
 from dotenv import load_dotenv
+from decimal import Decimal
 import uuid
+from common import pagos
+from bots.diferido import BotDiferido
+from bots.gateway import opciones_gateway
+from bots.sincronizar import sincronizar_comandos
 
 # Cargar .env
 load_dotenv()
@@ -11,17 +16,83 @@ TOKEN = os.getenv("DISCORD_EQUIPOS_BOT_TOKEN")
 DB_URL = os.getenv("DATABASE_URL")
 GUILD_ID = int(os.getenv("DISCORD_GUILD_ID"))
 
+# Identifica a este proceso en los NOTIFY de teams_changed (para ignorar los propios)
+ORIGEN = uuid.uuid4().hex[:8]
+
+# ====================================================
+#   CACHE DE EQUIPOS Y MEMBRESÍAS
+# ====================================================
+class CacheEquipos:
+    """Índices en memoria: equipo por id/código/owner y equipos de cada miembro.
+
+    Se carga una vez al iniciar; cada escritura del bot la actualiza al
+    momento (write-through) y los cambios de otros procesos llegan por
+    NOTIFY teams_changed con el id del equipo ('' = recargar todo).
+    """
+
+    def __init__(self):
+        self.equipos = {}      # team_id -> fila de teams (dict)
+        self.por_codigo = {}   # invite_code -> team_id
+        self.por_owner = {}    # owner_id -> team_id
+        self.miembros = {}     # team_id -> {user_id}
+        self.por_miembro = {}  # user_id -> {team_id}
+
+    def cargar(self, equipos, miembros):
+        self.__init__()
+        for e in equipos:
+            self.poner_equipo(e)
+        for m in miembros:
+            self.agregar_miembro(m["team_id"], m["user_id"])
+
+    def poner_equipo(self, fila):
+        equipo = dict(fila)
+        anterior = self.equipos.get(equipo["id"])
+        if anterior:
+            self.por_codigo.pop(anterior["invite_code"], None)
+            self.por_owner.pop(anterior["owner_id"], None)
+        self.equipos[equipo["id"]] = equipo
+        self.por_codigo[equipo["invite_code"]] = equipo["id"]
+        self.por_owner[equipo["owner_id"]] = equipo["id"]
+        self.miembros.setdefault(equipo["id"], set())
+
+    def quitar_equipo(self, team_id):
+        equipo = self.equipos.pop(team_id, None)
+        if equipo:
+            self.por_codigo.pop(equipo["invite_code"], None)
+            self.por_owner.pop(equipo["owner_id"], None)
+        for user_id in self.miembros.pop(team_id, set()):
+            self.por_miembro.get(user_id, set()).discard(team_id)
+
+    def agregar_miembro(self, team_id, user_id):
+        self.miembros.setdefault(team_id, set()).add(user_id)
+        self.por_miembro.setdefault(user_id, set()).add(team_id)
+
+    def equipo_por_codigo(self, codigo):
+        return self.equipos.get(self.por_codigo.get(codigo))
+
+    def equipo_de_owner(self, user_id):
+        return self.equipos.get(self.por_owner.get(user_id))
+
+    def equipo_de(self, user_id):
+        """El equipo propio o, si no tiene, el primero del que es miembro"""
+        propio = self.equipo_de_owner(user_id)
+        if propio:
+            return propio
+        ids = self.por_miembro.get(user_id)
+        return self.equipos.get(min(ids)) if ids else None
+
+    def es_miembro(self, team_id, user_id):
+        return user_id in self.miembros.get(team_id, ())
+
 # ====================================================
 #   CLASE PRINCIPAL DEL BOT
 # ====================================================
 class ClippingEquipos(commands.Bot):
     def __init__(self):
-        intents = discord.Intents.default()
-        intents.message_content = True
-        intents.members = True
-
-        super().__init__(command_prefix="!", intents=intents)
+        # Equipos solo trabaja con IDs: no necesita cache de miembros
+        super().__init__(command_prefix="!", **opciones_gateway("EQUIPOS_BOT", miembros="none"))
         self.db_pool = None
+        self.cache = CacheEquipos()
 
     async def setup_hook(self):
         # Conectar a la base de datos
@@ -33,11 +104,19 @@ class ClippingEquipos(commands.Bot):
         )
 
         await self.create_tables()
+        await self.recargar_cache()
+        self.teams_listener_task = asyncio.create_task(self.escuchar_cambios_equipos())
 
         # 🔥 SYNC SOLO EN LA GUILD → evita conflictos con los otros bots
+        # Los comandos se registran globales: los copiamos a la guild antes de sincronizarla
         try:
-            synced = await self.tree.sync(guild=discord.Object(id=GUILD_ID))
-            print(f"🟢 Comandos del Bot Equipos sincronizados en guild {GUILD_ID}: {len(synced)} comandos")
+            guild = discord.Object(id=GUILD_ID)
+            self.tree.copy_global_to(guild=guild)
+            synced = await sincronizar_comandos(self, guild=guild)
+            if synced is None:
+                print(f"⏭️ Comandos del Bot Equipos sin cambios en guild {GUILD_ID}")
+            else:
+                print(f"🟢 Comandos del Bot Equipos sincronizados en guild {GUILD_ID}: {len(synced)} comandos")
         except Exception as e:
             print(f"❌ Error sincronizando comandos del Bot Equipos: {e}")
 
@@ -68,13 +147,117 @@ class ClippingEquipos(commands.Bot):
             )
             ''')
 
+            # Para el rollup de equipos (join por usuario)
+            await conn.execute("CREATE INDEX IF NOT EXISTS team_members_user_idx ON team_members (user_id)")
+
+            # El rollup lee settled_usd: no depende de que el bot principal haya migrado antes
+            try:
+                await pagos.crear_tablas(conn)
+            except Exception as e:
+                print(f"⚠️ Nota sobre ledger de pagos: {e}")
+
         print("✅ Tablas 'teams' y 'team_members' listas")
 
     async def on_ready(self):
         print(f"✅ Clipping Equipos conectado como {self.user} (ID: {self.user.id})")
 
+    async def recargar_cache(self, team_id=None):
+        """Recarga la cache entera o solo un equipo desde la DB"""
+        async with self.db_pool.acquire() as conn:
+            if team_id is None:
+                equipos = await conn.fetch("SELECT * FROM teams")
+                miembros = await conn.fetch("SELECT team_id, user_id FROM team_members")
+                self.cache.cargar(equipos, miembros)
+                print(f"🧠 Cache de equipos: {len(equipos)} equipos, {len(miembros)} membresías")
+                return
+
+            equipo = await conn.fetchrow("SELECT * FROM teams WHERE id = $1", team_id)
+            miembros = await conn.fetch("SELECT user_id FROM team_members WHERE team_id = $1", team_id)
+        self.cache.quitar_equipo(team_id)
+        if equipo:
+            self.cache.poner_equipo(equipo)
+            for m in miembros:
+                self.cache.agregar_miembro(team_id, m["user_id"])
+
+    async def avisar_cambio_equipo(self, conn, team_id):
+        await conn.execute("SELECT pg_notify('teams_changed', $1)", f"{team_id}:{ORIGEN}")
+
+    def _on_teams_changed(self, _conn, _pid, _channel, payload):
+        team_id, _, origen = payload.partition(":")
+        if origen == ORIGEN:
+            return  # Ya aplicado por write-through
+        asyncio.create_task(self.recargar_cache(int(team_id) if team_id else None))
+
+    async def escuchar_cambios_equipos(self):
+        """LISTEN teams_changed en una conexión aparte (el pool tiene una sola)"""
+        while not self.is_closed():
+            conn = None
+            try:
+                conn = await asyncpg.connect(os.getenv('DATABASE_URL'), ssl='require')
+                await conn.add_listener("teams_changed", self._on_teams_changed)
+                # Lo que cambió mientras no escuchábamos: recarga completa
+                await self.recargar_cache()
+                while not conn.is_closed():
+                    await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Listener de equipos caído: {e}")
+            finally:
+                if conn and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(5)
+
+
+bot = BotDiferido(ClippingEquipos)  # Se construye al arrancar (ver bots/diferido.py)
 
-bot = ClippingEquipos()
+# ====================================================
+#   ROLLUP DE GANANCIAS POR EQUIPO
+# ====================================================
+# Una sola consulta agrupada: primero sumamos los posts de los miembros por
+# usuario (índice por discord_id) y después por equipo.
+def _posts_de_miembros():
+    return "\nUNION ALL\n".join(
+        f"""SELECT discord_id, COALESCE(views, 0) AS views, COALESCE(final_earned_usd, 0) AS ganado,
+                   GREATEST(COALESCE(final_earned_usd, 0) - settled_usd, 0) AS pendiente
+            FROM {tabla} WHERE discord_id IN (SELECT discord_id FROM miembros)"""
+        for tabla, _ in pagos.TABLAS_POSTS.values()
+    )
+
+async def resumen_equipos(conn, team_id=None, limite=None):
+    """Miembros, vistas, ganancias y comisión del owner de un equipo (o de todos)"""
+    filas = await conn.fetch(f"""
+        WITH miembros AS (
+            SELECT team_id, user_id::text AS discord_id FROM team_members
+            WHERE $1::int IS NULL OR team_id = $1
+        ), por_usuario AS (
+            SELECT discord_id, SUM(views) AS views, SUM(ganado) AS ganado, SUM(pendiente) AS pendiente
+            FROM ({_posts_de_miembros()}) p
+            GROUP BY discord_id
+        )
+        SELECT t.id, t.team_name, t.owner_id, t.commission_rate, t.invite_code,
+               COUNT(mi.discord_id) AS miembros,
+               COALESCE(SUM(u.views), 0) AS views,
+               COALESCE(SUM(u.ganado), 0) AS ganado,
+               COALESCE(SUM(u.pendiente), 0) AS pendiente
+        FROM teams t
+        LEFT JOIN miembros mi ON mi.team_id = t.id
+        LEFT JOIN por_usuario u ON u.discord_id = mi.discord_id
+        WHERE $1::int IS NULL OR t.id = $1
+        GROUP BY t.id
+        ORDER BY views DESC
+        LIMIT $2
+    """, team_id, limite)
+
+    resumen = []
+    for f in filas:
+        tasa = Decimal(f["commission_rate"] or 0) / 100
+        resumen.append({
+            **dict(f),
+            "comision": f["ganado"] * tasa,
+            "comision_pendiente": f["pendiente"] * tasa,
+        })
+    return resumen
 # ====================================================
 #   /team-create
 # ====================================================
@@ -82,6 +265,13 @@ bot = ClippingEquipos()
 @app_commands.describe(nombre="Nombre del equipo", comision="Porcentaje de comisión (default 5%)")
 async def team_create(interaction: discord.Interaction, nombre: str, comision: float = 5.0):
     try:
+        if bot.cache.equipo_de_owner(interaction.user.id):
+            await interaction.response.send_message(
+                "⚠️ Ya tenés un equipo creado.",
+                ephemeral=True
+            )
+            return
+
         async with bot.db_pool.acquire() as conn:
             user = await conn.fetchrow(
                 "SELECT * FROM users WHERE discord_id = $1",
@@ -108,22 +298,14 @@ async def team_create(interaction: discord.Interaction, nombre: str, comision: f
                 await interaction.response.send_message(embed=embed, ephemeral=True)
                 return
 
-            existing_team = await conn.fetchrow(
-                "SELECT * FROM teams WHERE owner_id = $1",
-                interaction.user.id
-            )
-            if existing_team:
-                await interaction.response.send_message(
-                    "⚠️ Ya tenés un equipo creado.",
-                    ephemeral=True
-                )
-                return
-
             invite_code = str(uuid.uuid4())[:8]
-            await conn.execute('''
+            team = await conn.fetchrow('''
             INSERT INTO teams (team_name, owner_id, commission_rate, invite_code)
             VALUES ($1, $2, $3, $4)
+            RETURNING *
             ''', nombre, interaction.user.id, comision, invite_code)
+            bot.cache.poner_equipo(team)
+            await bot.avisar_cambio_equipo(conn, team["id"])
 
             embed = discord.Embed(
                 title="✅ Team Created",
@@ -159,52 +341,47 @@ async def team_create(interaction: discord.Interaction, nombre: str, comision: f
 @app_commands.describe(codigo="Código de invitación del equipo")
 async def team_join(interaction: discord.Interaction, codigo: str):
     try:
-        async with bot.db_pool.acquire() as conn:
-            team = await conn.fetchrow(
-                "SELECT * FROM teams WHERE invite_code = $1",
-                codigo
+        team = bot.cache.equipo_por_codigo(codigo)
+        if not team:
+            await interaction.response.send_message(
+                "❌ Código inválido. Verificá que sea correcto.",
+                ephemeral=True
             )
-            if not team:
-                await interaction.response.send_message(
-                    "❌ Código inválido. Verificá que sea correcto.",
-                    ephemeral=True
-                )
-                return
+            return
 
-            # Evitar que el owner se una como miembro
-            if team["owner_id"] == interaction.user.id:
-                await interaction.response.send_message(
-                    "⚠️ No podés unirte a tu propio equipo.",
-                    ephemeral=True
-                )
-                return
+        # Evitar que el owner se una como miembro
+        if team["owner_id"] == interaction.user.id:
+            await interaction.response.send_message(
+                "⚠️ No podés unirte a tu propio equipo.",
+                ephemeral=True
+            )
+            return
 
-            # Verificar si ya es miembro
-            existing = await conn.fetchrow(
-                "SELECT * FROM team_members WHERE team_id = $1 AND user_id = $2",
-                team["id"], interaction.user.id
+        # Verificar si ya es miembro
+        if bot.cache.es_miembro(team["id"], interaction.user.id):
+            await interaction.response.send_message(
+                "ℹ️ Ya sos miembro de este equipo.",
+                ephemeral=True
             )
-            if existing:
-                await interaction.response.send_message(
-                    "ℹ️ Ya sos miembro de este equipo.",
-                    ephemeral=True
-                )
-                return
+            return
 
+        async with bot.db_pool.acquire() as conn:
             await conn.execute(
-                "INSERT INTO team_members (team_id, user_id) VALUES ($1, $2)",
+                "INSERT INTO team_members (team_id, user_id) VALUES ($1, $2) ON CONFLICT DO NOTHING",
                 team["id"], interaction.user.id
             )
+            await bot.avisar_cambio_equipo(conn, team["id"])
+        bot.cache.agregar_miembro(team["id"], interaction.user.id)
 
-            embed = discord.Embed(
-                title="🎉 Joined Team Successfully",
-                description=f"You have joined **{team['team_name']}**!",
-                color=0x00ff00
-            )
-            embed.add_field(name="Owner", value=f"<@{team['owner_id']}>", inline=True)
-            embed.add_field(name="Commission Rate", value=f"{team['commission_rate']}%", inline=True)
-            embed.set_footer(text="Clipping Equipos • 2025")
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = discord.Embed(
+            title="🎉 Joined Team Successfully",
+            description=f"You have joined **{team['team_name']}**!",
+            color=0x00ff00
+        )
+        embed.add_field(name="Owner", value=f"<@{team['owner_id']}>", inline=True)
+        embed.add_field(name="Commission Rate", value=f"{team['commission_rate']}%", inline=True)
+        embed.set_footer(text="Clipping Equipos • 2025")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     except Exception as e:
         print("❌ ERROR en /team-join:", e)
@@ -229,41 +406,35 @@ async def team_join(interaction: discord.Interaction, codigo: str):
 @bot.tree.command(name="team-info", description="Muestra información de tu equipo o del que sos miembro")
 async def team_info(interaction: discord.Interaction):
     try:
-        async with bot.db_pool.acquire() as conn:
-            team = await conn.fetchrow(
-                "SELECT * FROM teams WHERE owner_id = $1",
-                interaction.user.id
-            )
-            if not team:
-                # Buscar si el usuario es miembro de algún equipo
-                member_of = await conn.fetchrow("""
-                    SELECT t.* FROM teams t
-                    JOIN team_members m ON m.team_id = t.id
-                    WHERE m.user_id = $1
-                """, interaction.user.id)
-                if not member_of:
-                    await interaction.response.send_message(
-                        "❌ No pertenecés a ningún equipo.",
-                        ephemeral=True
-                    )
-                    return
-                team = member_of
-
-            members = await conn.fetch(
-                "SELECT user_id FROM team_members WHERE team_id = $1",
-                team["id"]
+        # Propio o del que es miembro, directo de la cache
+        team = bot.cache.equipo_de(interaction.user.id)
+        if not team:
+            await interaction.response.send_message(
+                "❌ No pertenecés a ningún equipo.",
+                ephemeral=True
             )
+            return
 
-            embed = discord.Embed(
-                title=f"📊 Team Info: {team['team_name']}",
-                color=0x00b0f0
-            )
-            embed.add_field(name="💰 Commission", value=f"{team['commission_rate']}%", inline=True)
-            embed.add_field(name="🔑 Invite Code", value=f"`{team['invite_code']}`", inline=True)
-            embed.add_field(name="👑 Owner", value=f"<@{team['owner_id']}>", inline=True)
-            embed.add_field(name="👥 Members", value=f"{len(members)}", inline=True)
-            embed.set_footer(text="Use /team-edit-commission or /team-new-inv for updates")
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+        async with bot.db_pool.acquire() as conn:
+            resumen = (await resumen_equipos(conn, team["id"]))[0]
+
+        embed = discord.Embed(
+            title=f"📊 Team Info: {team['team_name']}",
+            color=0x00b0f0
+        )
+        embed.add_field(name="💰 Commission", value=f"{team['commission_rate']}%", inline=True)
+        embed.add_field(name="🔑 Invite Code", value=f"`{team['invite_code']}`", inline=True)
+        embed.add_field(name="👑 Owner", value=f"<@{team['owner_id']}>", inline=True)
+        embed.add_field(name="👥 Members", value=f"{resumen['miembros']}", inline=True)
+        embed.add_field(name="👁️ Members' Views", value=f"{resumen['views']:,}", inline=True)
+        embed.add_field(name="💵 Members' Earnings", value=f"${resumen['ganado']:.2f}", inline=True)
+        embed.add_field(
+            name="🤝 Owner Commission",
+            value=f"${resumen['comision']:.2f} total\n${resumen['comision_pendiente']:.2f} pending",
+            inline=True
+        )
+        embed.set_footer(text="Use /team-edit-commission or /team-new-inv for updates")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     except Exception as e:
         print("❌ ERROR en /team-info:", e)
@@ -282,6 +453,37 @@ async def team_info(interaction: discord.Interaction):
             print("❌ Error enviando respuesta de error en /team-info:", send_err)
 
 
+# ====================================================
+#   /team-leaderboard
+# ====================================================
+@bot.tree.command(name="team-leaderboard", description="Top 10 equipos por vistas de sus miembros")
+async def team_leaderboard(interaction: discord.Interaction):
+    try:
+        await interaction.response.defer()
+        async with bot.db_pool.acquire() as conn:
+            top = await resumen_equipos(conn, limite=10)
+
+        texto = ""
+        for i, team in enumerate(top, 1):
+            medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"#{i}"
+            texto += (
+                f"**{medal} {team['team_name']}** — {team['views']:,} views · "
+                f"{team['miembros']} members · ${team['ganado']:.2f} earned\n"
+            )
+
+        embed = discord.Embed(title="🏆 Team Leaderboard (Top 10)", color=0xFFD700)
+        embed.description = texto or "Aún no hay equipos."
+        embed.set_footer(text="Clipping Equipos • 2025")
+        await interaction.followup.send(embed=embed)
+
+    except Exception as e:
+        print("❌ ERROR en /team-leaderboard:", e)
+        try:
+            await interaction.followup.send("❌ Ocurrió un error interno al obtener el ranking.", ephemeral=True)
+        except Exception as send_err:
+            print("❌ Error enviando respuesta de error en /team-leaderboard:", send_err)
+
+
 # ====================================================
 #   /team-edit-commission
 # ====================================================
@@ -289,31 +491,30 @@ async def team_info(interaction: discord.Interaction):
 @app_commands.describe(nueva_comision="Nuevo porcentaje de comisión")
 async def team_edit_commission(interaction: discord.Interaction, nueva_comision: float):
     try:
-        async with bot.db_pool.acquire() as conn:
-            team = await conn.fetchrow(
-                "SELECT * FROM teams WHERE owner_id = $1",
-                interaction.user.id
+        team = bot.cache.equipo_de_owner(interaction.user.id)
+        if not team:
+            await interaction.response.send_message(
+                "❌ No tenés ningún equipo creado.",
+                ephemeral=True
             )
-            if not team:
-                await interaction.response.send_message(
-                    "❌ No tenés ningún equipo creado.",
-                    ephemeral=True
-                )
-                return
+            return
 
-            await conn.execute(
-                "UPDATE teams SET commission_rate = $1 WHERE owner_id = $2",
-                nueva_comision, interaction.user.id
+        async with bot.db_pool.acquire() as conn:
+            actualizado = await conn.fetchrow(
+                "UPDATE teams SET commission_rate = $1 WHERE id = $2 RETURNING *",
+                nueva_comision, team["id"]
             )
+            await bot.avisar_cambio_equipo(conn, team["id"])
+        bot.cache.poner_equipo(actualizado)
 
-            embed = discord.Embed(
-                title="💼 Commission Updated",
-                description=f"Your team's commission rate is now **{nueva_comision}%**.",
-                color=0x00b0f0
-            )
-            embed.add_field(name="Team", value=team["team_name"], inline=True)
-            embed.set_footer(text="Clipping Equipos • 2025")
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = discord.Embed(
+            title="💼 Commission Updated",
+            description=f"Your team's commission rate is now **{nueva_comision}%**.",
+            color=0x00b0f0
+        )
+        embed.add_field(name="Team", value=team["team_name"], inline=True)
+        embed.set_footer(text="Clipping Equipos • 2025")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     except Exception as e:
         print("❌ ERROR en /team-edit-commission:", e)
@@ -338,33 +539,33 @@ async def team_edit_commission(interaction: discord.Interaction, nueva_comision:
 @bot.tree.command(name="team-new-inv", description="Genera un nuevo código de invitación para tu equipo")
 async def team_new_inv(interaction: discord.Interaction):
     try:
-        async with bot.db_pool.acquire() as conn:
-            team = await conn.fetchrow(
-                "SELECT * FROM teams WHERE owner_id = $1",
-                interaction.user.id
+        team = bot.cache.equipo_de_owner(interaction.user.id)
+        if not team:
+            await interaction.response.send_message(
+                "❌ No tenés ningún equipo creado.",
+                ephemeral=True
             )
-            if not team:
-                await interaction.response.send_message(
-                    "❌ No tenés ningún equipo creado.",
-                    ephemeral=True
-                )
-                return
+            return
 
-            new_invite = str(uuid.uuid4())[:8]
-            await conn.execute(
-                "UPDATE teams SET invite_code = $1 WHERE id = $2",
+        new_invite = str(uuid.uuid4())[:8]
+        async with bot.db_pool.acquire() as conn:
+            actualizado = await conn.fetchrow(
+                "UPDATE teams SET invite_code = $1 WHERE id = $2 RETURNING *",
                 new_invite, team['id']
             )
-
-            embed = discord.Embed(
-                title="🔄 New Invite Code Generated",
-                description="Your old invite has been replaced with a new one.",
-                color=0xf1c40f
-            )
-            embed.add_field(name="Team", value=team['team_name'], inline=True)
-            embed.add_field(name="New Code", value=f"`{new_invite}`", inline=True)
-            embed.set_footer(text="Share this new code with your members.")
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            await bot.avisar_cambio_equipo(conn, team["id"])
+        # El código viejo deja de resolver al instante
+        bot.cache.poner_equipo(actualizado)
+
+        embed = discord.Embed(
+            title="🔄 New Invite Code Generated",
+            description="Your old invite has been replaced with a new one.",
+            color=0xf1c40f
+        )
+        embed.add_field(name="Team", value=team['team_name'], inline=True)
+        embed.add_field(name="New Code", value=f"`{new_invite}`", inline=True)
+        embed.set_footer(text="Share this new code with your members.")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     except Exception as e:
         print("❌ ERROR en /team-new-inv:", e)
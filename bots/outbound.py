@@ -0,0 +1,348 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+
+import discord
+
+# ====================================================
+#   COLA DE SALIDA (envíos, ediciones y DMs pausados)
+# ====================================================
+# Los comandos de admin publicaban con `canal.send()` / `msg.edit()` directo
+# desde el handler: en operaciones masivas Discord devolvía 429 y el handler
+# quedaba colgado esperando el retry. Acá todo lo que sale hacia canales o DMs
+# pasa por una cola por bot:
+#   - Una sub-cola por ruta (el bucket de mensajes de Discord es por canal);
+#     un worker por ruta activa, así el orden dentro de un canal se respeta.
+#   - Cada ruta tiene su cubeta de tokens + una global del bot + una para DMs.
+#   - Prioridad: CRITICA (la interacción espera el resultado) > NORMAL > MASIVA,
+#     dentro de cada ruta y también en las cubetas compartidas (global y DMs):
+#     un post crítico no queda detrás del tráfico masivo de otros canales.
+#   - Ediciones al mismo mensaje que aún no salieron se fusionan en una sola.
+#   - Envíos con `agrupar=True` (solo embeds) al mismo canal se juntan en un
+#     mensaje de hasta 10 embeds.
+# enviar/editar/dm devuelven un Future: se puede `await` (y obtener el
+# Message) o ignorar. Si nadie lo espera, pasar `etiqueta` para que los
+# errores queden en el log (sin etiqueta se asume que el caller los maneja).
+# Al cerrar, lo que no llegó a salir falla con ColaCerrada: nadie queda
+# esperando un Future que nunca se resuelve.
+
+CRITICA, NORMAL, MASIVA = 0, 1, 2
+
+# Límites por defecto (conservadores respecto a los de Discord)
+RUTA_CAPACIDAD = int(os.getenv("OUTBOUND_RUTA_CAPACIDAD", "5"))      # mensajes por canal...
+RUTA_PERIODO = float(os.getenv("OUTBOUND_RUTA_PERIODO", "5"))        # ...cada N segundos
+GLOBAL_POR_SEGUNDO = int(os.getenv("OUTBOUND_GLOBAL_POR_SEGUNDO", "40"))
+DM_CAPACIDAD = int(os.getenv("OUTBOUND_DM_CAPACIDAD", "5"))
+DM_PERIODO = float(os.getenv("OUTBOUND_DM_PERIODO", "5"))
+REINTENTOS_429 = 3
+MAX_EMBEDS = 10
+
+
+class ColaCerrada(RuntimeError):
+    pass
+
+
+class Cubeta:
+    """Token bucket: `capacidad` tokens que se recargan en `periodo` segundos.
+
+    Si hay varios esperando, el próximo token es para la prioridad más alta
+    (y a igual prioridad, para el que llegó antes).
+    """
+
+    def __init__(self, capacidad, periodo):
+        self.capacidad = capacidad
+        self.ritmo = capacidad / periodo
+        self.tokens = float(capacidad)
+        self.ultimo = time.monotonic()
+        self.bloqueada_hasta = 0.0
+        self._fila = []                  # heap de (prioridad, turno) esperando
+        self._turnos = itertools.count()
+        self._aviso = asyncio.Event()    # se dispara cada vez que cambia el primero de la fila
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.ritmo)
+        self.ultimo = ahora
+        return ahora
+
+    def _avisar(self):
+        self._aviso.set()
+        self._aviso = asyncio.Event()
+
+    async def tomar(self, prioridad=NORMAL):
+        """Espera un token; devuelve los segundos esperados"""
+        inicio = time.monotonic()
+        turno = (prioridad, next(self._turnos))
+        heapq.heappush(self._fila, turno)
+        if self._fila[0] == turno:
+            self._avisar()  # pasó adelante: el que estaba primero vuelve a la fila
+        try:
+            while True:
+                aviso = self._aviso
+                if self._fila[0] != turno:
+                    await aviso.wait()
+                    continue
+                ahora = self._recargar()
+                espera = max(self.bloqueada_hasta - ahora, 0.0)
+                if not espera and self.tokens >= 1:
+                    self.tokens -= 1
+                    return time.monotonic() - inicio
+                espera = espera or (1 - self.tokens) / self.ritmo
+                # Dormimos hasta el próximo token, salvo que alguien más urgente se adelante
+                try:
+                    await asyncio.wait_for(aviso.wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self._fila[0] == turno:
+                heapq.heappop(self._fila)
+            else:
+                self._fila.remove(turno)
+                heapq.heapify(self._fila)
+            self._avisar()
+
+    def penalizar(self, segundos):
+        # Tras un 429 vaciamos la cubeta y la bloqueamos lo que pidió Discord
+        self._recargar()
+        self.tokens = 0.0
+        self.bloqueada_hasta = max(self.bloqueada_hasta, time.monotonic() + segundos)
+
+
+class _Trabajo:
+    __slots__ = ("tipo", "prioridad", "orden", "destino", "kwargs", "futuro", "etiqueta", "encolado", "agrupar")
+
+    def __init__(self, tipo, prioridad, orden, destino, kwargs, futuro, etiqueta, agrupar=False):
+        self.tipo = tipo
+        self.prioridad = prioridad
+        self.orden = orden
+        self.destino = destino
+        self.kwargs = kwargs
+        self.futuro = futuro
+        self.etiqueta = etiqueta
+        self.encolado = time.monotonic()
+        self.agrupar = agrupar
+
+    def __lt__(self, otro):
+        return (self.prioridad, self.orden) < (otro.prioridad, otro.orden)
+
+
+class ColaSalida:
+    def __init__(self, nombre="bot"):
+        self.nombre = nombre
+        self._rutas = {}        # ruta -> heap de _Trabajo
+        self._workers = {}      # ruta -> Task
+        self._cubetas = {}      # ruta -> Cubeta
+        self._ediciones = {}    # message_id -> _Trabajo pendiente (para fusionar)
+        self._en_curso = {}     # ruta -> lote que el worker está enviando
+        self._orden = itertools.count()
+        self._global = Cubeta(GLOBAL_POR_SEGUNDO, 1.0)
+        self._dm = Cubeta(DM_CAPACIDAD, DM_PERIODO)
+        self._cerrada = False
+
+        # Métricas
+        self.contadores = {
+            "encolados": 0, "enviados": 0, "editados": 0, "dms": 0,
+            "ediciones_fusionadas": 0, "envios_agrupados": 0,
+            "rate_limited": 0, "errores": 0,
+        }
+        self.espera_cubetas = 0.0
+        self.latencias = deque(maxlen=500)
+
+    # ---------- API pública ----------
+
+    def enviar(self, canal, *, prioridad=NORMAL, agrupar=False, etiqueta=None, **kwargs):
+        """Encola `canal.send(**kwargs)`. Con agrupar=True solo se aceptan embeds"""
+        if agrupar and set(kwargs) - {"embed", "embeds"}:
+            raise ValueError("agrupar=True solo admite embed/embeds")
+        return self._encolar(("canal", canal.id), "enviar", canal, kwargs, prioridad, etiqueta, agrupar)
+
+    def editar(self, mensaje, *, prioridad=NORMAL, etiqueta=None, **kwargs):
+        """Encola `mensaje.edit(**kwargs)`; se fusiona con una edición pendiente del mismo mensaje"""
+        pendiente = self._ediciones.get(mensaje.id)
+        if pendiente is not None:
+            # La última edición gana campo a campo; hereda la prioridad más alta
+            pendiente.kwargs.update(kwargs)
+            if prioridad < pendiente.prioridad:
+                ruta = ("canal", mensaje.channel.id)
+                pendiente.prioridad = prioridad
+                heapq.heapify(self._rutas[ruta])
+            self.contadores["ediciones_fusionadas"] += 1
+            return pendiente.futuro
+        return self._encolar(("canal", mensaje.channel.id), "editar", mensaje, kwargs, prioridad, etiqueta)
+
+    def dm(self, usuario, *, prioridad=NORMAL, etiqueta=None, **kwargs):
+        """Encola un DM (`usuario.send(**kwargs)`); pasa además por la cubeta de DMs"""
+        return self._encolar(("dm", usuario.id), "dm", usuario, kwargs, prioridad, etiqueta)
+
+    def metricas(self):
+        latencias = sorted(self.latencias)
+        pendientes = [0, 0, 0]
+        for heap in self._rutas.values():
+            for t in heap:
+                pendientes[t.prioridad] += 1
+        return {
+            **self.contadores,
+            "pendientes": sum(pendientes),
+            "pendientes_critica": pendientes[CRITICA],
+            "pendientes_normal": pendientes[NORMAL],
+            "pendientes_masiva": pendientes[MASIVA],
+            "rutas_activas": len(self._workers),
+            "espera_cubetas_s": round(self.espera_cubetas, 2),
+            "latencia_p50_ms": round(latencias[len(latencias) // 2] * 1000) if latencias else 0,
+            "latencia_p95_ms": round(latencias[int(len(latencias) * 0.95)] * 1000) if latencias else 0,
+        }
+
+    async def cerrar(self, timeout=10):
+        """Deja de aceptar trabajos y espera a que se vacíe la cola (hasta `timeout`).
+
+        Lo que no salió a tiempo falla con ColaCerrada antes de cancelar los workers.
+        """
+        self._cerrada = True
+        workers = list(self._workers.values())
+        if not workers:
+            return
+        _, pendientes = await asyncio.wait(workers, timeout=timeout)
+        if not pendientes:
+            return
+
+        error = ColaCerrada(f"La cola de salida de {self.nombre} se cerró antes de enviar")
+        descartados = 0
+        for ruta, heap in self._rutas.items():
+            lote = list(heap) + self._en_curso.get(ruta, [])
+            heap.clear()
+            for t in lote:
+                if not t.futuro.done():
+                    t.futuro.set_exception(error)
+                    descartados += 1
+        self._ediciones.clear()
+        for w in pendientes:
+            w.cancel()
+        await asyncio.gather(*pendientes, return_exceptions=True)
+        print(f"⚠️ Cola de salida de {self.nombre}: se descartaron {descartados} envíos al cerrar")
+
+    # ---------- Internos ----------
+
+    def _encolar(self, ruta, tipo, destino, kwargs, prioridad, etiqueta, agrupar=False):
+        if self._cerrada:
+            raise ColaCerrada(f"La cola de salida de {self.nombre} está cerrada")
+        futuro = asyncio.get_running_loop().create_future()
+        futuro.add_done_callback(lambda f: self._loguear_error(f, etiqueta))
+        trabajo = _Trabajo(tipo, prioridad, next(self._orden), destino, kwargs, futuro, etiqueta, agrupar)
+        heapq.heappush(self._rutas.setdefault(ruta, []), trabajo)
+        if tipo == "editar":
+            self._ediciones[destino.id] = trabajo
+        self.contadores["encolados"] += 1
+
+        if ruta not in self._workers:
+            self._workers[ruta] = asyncio.create_task(self._worker(ruta))
+        return futuro
+
+    def _loguear_error(self, futuro, etiqueta):
+        # exception() además marca el error como recuperado (sin warnings de asyncio)
+        if not futuro.cancelled() and futuro.exception() is not None and etiqueta:
+            print(f"⚠️ Cola de salida de {self.nombre}: {etiqueta} falló: {futuro.exception()}")
+
+    def _siguiente(self, ruta):
+        heap = self._rutas[ruta]
+        trabajo = heapq.heappop(heap)
+        if trabajo.tipo == "editar":
+            self._ediciones.pop(trabajo.destino.id, None)
+        if not trabajo.agrupar:
+            return [trabajo]
+
+        # Juntamos los siguientes envíos agrupables de la misma prioridad
+        lote, total = [trabajo], len(self._embeds(trabajo))
+        while heap and heap[0].agrupar and heap[0].prioridad == trabajo.prioridad:
+            n = len(self._embeds(heap[0]))
+            if total + n > MAX_EMBEDS:
+                break
+            lote.append(heapq.heappop(heap))
+            total += n
+        return lote
+
+    @staticmethod
+    def _embeds(trabajo):
+        if "embeds" in trabajo.kwargs:
+            return list(trabajo.kwargs["embeds"])
+        return [trabajo.kwargs["embed"]] if trabajo.kwargs.get("embed") else []
+
+    async def _worker(self, ruta):
+        cubeta = self._cubetas.setdefault(ruta, Cubeta(RUTA_CAPACIDAD, RUTA_PERIODO))
+        try:
+            while self._rutas.get(ruta):
+                lote = self._siguiente(ruta)
+                self._en_curso[ruta] = lote
+                await self._ejecutar(ruta, cubeta, lote)
+                self._en_curso.pop(ruta, None)
+        finally:
+            self._en_curso.pop(ruta, None)
+            self._workers.pop(ruta, None)
+            if not self._rutas.get(ruta):
+                self._rutas.pop(ruta, None)
+                # La cubeta se conserva mientras le falten tokens o esté penalizada
+                if cubeta.tokens >= cubeta.capacidad - 1 and cubeta.bloqueada_hasta <= time.monotonic():
+                    self._cubetas.pop(ruta, None)
+
+    async def _ejecutar(self, ruta, cubeta, lote):
+        trabajo = lote[0]
+        if len(lote) > 1:
+            kwargs = {"embeds": [e for t in lote for e in self._embeds(t)]}
+            self.contadores["envios_agrupados"] += len(lote) - 1
+        else:
+            kwargs = trabajo.kwargs
+
+        for intento in range(REINTENTOS_429 + 1):
+            self.espera_cubetas += await cubeta.tomar(trabajo.prioridad)
+            if trabajo.tipo == "dm":
+                self.espera_cubetas += await self._dm.tomar(trabajo.prioridad)
+            self.espera_cubetas += await self._global.tomar(trabajo.prioridad)
+            try:
+                if trabajo.tipo == "editar":
+                    resultado = await trabajo.destino.edit(**kwargs)
+                    self.contadores["editados"] += 1
+                else:
+                    resultado = await trabajo.destino.send(**kwargs)
+                    self.contadores["dms" if trabajo.tipo == "dm" else "enviados"] += 1
+                break
+            except discord.RateLimited as e:
+                # Solo llega si el cliente tiene max_ratelimit_timeout; si no, discord.py reintenta solo
+                self.contadores["rate_limited"] += 1
+                cubeta.penalizar(e.retry_after)
+                if intento == REINTENTOS_429:
+                    return self._fallar(lote, e)
+            except discord.HTTPException as e:
+                if e.status == 429 and intento < REINTENTOS_429:
+                    self.contadores["rate_limited"] += 1
+                    cubeta.penalizar(RUTA_PERIODO)
+                    continue
+                return self._fallar(lote, e)
+            except Exception as e:
+                return self._fallar(lote, e)
+
+        ahora = time.monotonic()
+        for t in lote:
+            self.latencias.append(ahora - t.encolado)
+            if not t.futuro.done():
+                t.futuro.set_result(resultado)
+
+    def _fallar(self, lote, error):
+        self.contadores["errores"] += len(lote)
+        for t in lote:
+            if not t.futuro.done():
+                t.futuro.set_exception(error)
+
+
+def embed_metricas(cola):
+    """Embed con las métricas de la cola (para /cola-salida)"""
+    m = cola.metricas()
+    embed = discord.Embed(title=f"📤 Cola de salida · {cola.nombre}", color=0x3498db)
+    embed.add_field(name="Pendientes", value=f"**{m['pendientes']}** (🔴 {m['pendientes_critica']} · 🟡 {m['pendientes_normal']} · ⚪ {m['pendientes_masiva']})", inline=False)
+    embed.add_field(name="Enviados", value=f"{m['enviados']} msgs · {m['editados']} ediciones · {m['dms']} DMs", inline=False)
+    embed.add_field(name="Ahorro", value=f"{m['ediciones_fusionadas']} ediciones fusionadas · {m['envios_agrupados']} envíos agrupados", inline=False)
+    embed.add_field(name="Ritmo", value=f"{m['rutas_activas']} rutas activas · {m['espera_cubetas_s']}s esperando cubetas", inline=False)
+    embed.add_field(name="Latencia", value=f"p50 {m['latencia_p50_ms']} ms · p95 {m['latencia_p95_ms']} ms", inline=True)
+    embed.add_field(name="Problemas", value=f"{m['rate_limited']} 429 · {m['errores']} errores", inline=True)
+    return embed
@@ -0,0 +1,56 @@
+import hashlib
+import json
+
+# ====================================================
+#   SYNC DE COMANDOS POR HUELLA
+# ====================================================
+# tree.sync() son varias llamadas REST con rate limit global. Guardamos en la
+# DB un hash del árbol de comandos (lo mismo que se mandaría a Discord) y solo
+# sincronizamos cuando cambió. /sync y /sync-admin fuerzan el sync igual.
+
+
+def huella_arbol(tree, guild=None) -> str:
+    # to_dict(tree) es lo que manda tree.sync() (discord.py >= 2.4)
+    comandos = sorted(
+        (cmd.to_dict(tree) for cmd in tree.get_commands(guild=guild)),
+        key=lambda c: (c.get("type", 1), c["name"])
+    )
+    canonico = json.dumps(comandos, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonico.encode()).hexdigest()
+
+
+async def sincronizar_comandos(bot, guild=None, forzar=False):
+    """Sincroniza el árbol si su huella cambió. Devuelve los comandos o None si no hizo falta"""
+    alcance = str(guild.id) if guild else "global"
+    huella = huella_arbol(bot.tree, guild)
+
+    async with bot.db_pool.acquire() as conn:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS command_sync_state (
+                application_id TEXT,
+                scope TEXT,
+                fingerprint TEXT,
+                synced_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (application_id, scope)
+            )
+        ''')
+        previa = await conn.fetchval(
+            "SELECT fingerprint FROM command_sync_state WHERE application_id = $1 AND scope = $2",
+            str(bot.application_id), alcance
+        )
+
+    if previa == huella and not forzar:
+        print(f"⏭️ Comandos de {bot.user or bot.application_id} sin cambios ({alcance}), no se sincroniza")
+        return None
+
+    # El REST va sin conexión tomada (los pools de los bots son chicos)
+    synced = await bot.tree.sync(guild=guild)
+
+    async with bot.db_pool.acquire() as conn:
+        await conn.execute('''
+            INSERT INTO command_sync_state (application_id, scope, fingerprint, synced_at)
+            VALUES ($1, $2, $3, NOW())
+            ON CONFLICT (application_id, scope)
+            DO UPDATE SET fingerprint = EXCLUDED.fingerprint, synced_at = NOW()
+        ''', str(bot.application_id), alcance, huella)
+    return synced
@@ -0,0 +1,30 @@
+from decimal import Decimal, ROUND_HALF_EVEN, localcontext
+
+# ====================================================
+#   REGLAS DE GANANCIA (referencia exacta en Decimal)
+# ====================================================
+# Dos modelos conviven en las tablas de posts:
+#   - Por cada 1k vistas: views / 1000 * tarifa. Es lo que guarda
+#     /metrics/ingest con TARIFA_INGEST_1K, y lo que muestra /stats con
+#     payment_rates (STANDARD o el tag del bounty).
+#   - Bounty por N vistas (bounty_rates): lo que ganó desde starting_views,
+#     amount_usd por cada per_views, redondeado a 4 decimales
+#     (calculate_bounty_earnings en bots/main.py).
+# tools/recalcular_ganancias.py vectoriza estas mismas reglas y se valida
+# contra estas funciones.
+
+TARIFA_INGEST_1K = Decimal("0.025")
+TARIFA_STANDARD_DEFAULT = Decimal("0.60")  # /stats si no hay fila STANDARD
+DECIMALES_BOUNTY = Decimal("0.0001")
+
+
+def ganancia_por_mil(views, tarifa_1k) -> Decimal:
+    return Decimal(max(views or 0, 0)) * Decimal(tarifa_1k) / 1000
+
+
+def ganancia_bounty(views, starting_views, amount_usd, per_views) -> Decimal:
+    ganadas = max((views or 0) - (starting_views or 0), 0)
+    with localcontext() as ctx:
+        ctx.prec = 60
+        valor = Decimal(ganadas) * Decimal(amount_usd) / Decimal(per_views)
+        return valor.quantize(DECIMALES_BOUNTY, rounding=ROUND_HALF_EVEN)
@@ -0,0 +1,259 @@
+import csv
+import io
+import os
+import uuid
+from decimal import Decimal, ROUND_DOWN
+
+# ====================================================
+#   LIBRO DE PAGOS (LEDGER) Y MARCAS DE LIQUIDACIÓN
+# ====================================================
+# Pagar ya no borra videos: cada post guarda hasta dónde se le pagó
+# (settled_views / settled_usd) y el saldo pendiente es final_earned_usd -
+# settled_usd. Cada liquidación deja una fila en `payouts` y el detalle por
+# video en `payout_items`; ambas tablas son solo-append.
+# Se paga en centavos enteros (lo único que acepta PayPal): lo que sobra por
+# debajo del centavo queda sin liquidar y se suma al próximo pago.
+
+# Mínimo por creador para entrar en un lote de PayPal y nota que ve el receptor
+PAYOUT_MIN_USD = float(os.getenv("PAYOUT_MIN_USD", "1.00"))
+PAYOUT_NOTE = os.getenv("PAYOUT_NOTE", "Latin Clipping - pago de campañas")
+
+CENTAVO = Decimal("0.01")
+
+# Plataforma -> (tabla, columna_url)
+TABLAS_POSTS = {
+    "youtube": ("tracked_posts", "post_url"),
+    "tiktok": ("tracked_posts_tiktok", "tiktok_url"),
+    "instagram": ("tracked_posts_instagram", "instagram_url"),
+}
+
+
+async def crear_tablas(conn):
+    for tabla, _ in TABLAS_POSTS.values():
+        await conn.execute(f"ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS settled_views INTEGER NOT NULL DEFAULT 0")
+        await conn.execute(f"ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS settled_usd NUMERIC NOT NULL DEFAULT 0")
+        await conn.execute(f"ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS settled_at TIMESTAMP")
+        # Solo indexa lo que falta pagar: liquidar no recorre el histórico
+        await conn.execute(f'''
+            CREATE INDEX IF NOT EXISTS {tabla}_pendiente_idx
+            ON {tabla} (discord_id) WHERE final_earned_usd > settled_usd
+        ''')
+
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS payouts (
+            id SERIAL PRIMARY KEY,
+            batch_id TEXT,
+            discord_id TEXT,
+            amount_usd NUMERIC NOT NULL,
+            views BIGINT DEFAULT 0,
+            post_count INTEGER DEFAULT 0,
+            paid_by TEXT,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    ''')
+    await conn.execute("CREATE INDEX IF NOT EXISTS payouts_discord_idx ON payouts (discord_id, created_at)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS payouts_batch_idx ON payouts (batch_id)")
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS payout_items (
+            payout_id INTEGER REFERENCES payouts(id),
+            platform TEXT,
+            post_url TEXT,
+            views_from INTEGER,
+            views_to INTEGER,
+            usd_from NUMERIC,
+            usd_to NUMERIC
+        )
+    ''')
+    await conn.execute("CREATE INDEX IF NOT EXISTS payout_items_payout_idx ON payout_items (payout_id)")
+
+
+def _union_pendientes(filtro=""):
+    """UNION ALL de los posts con saldo de las 3 tablas"""
+    return "\nUNION ALL\n".join(
+        f'''SELECT discord_id, '{plat}' AS platform, {url_col} AS post_url, views, settled_views,
+                   final_earned_usd, settled_usd, bounty_tag
+            FROM {tabla} WHERE final_earned_usd > settled_usd {filtro}'''
+        for plat, (tabla, url_col) in TABLAS_POSTS.items()
+    )
+
+
+async def saldos_pendientes(conn, minimo=CENTAVO):
+    """[(discord_id, saldo, videos)] de todos los usuarios con saldo >= minimo (por defecto, algo cobrable)"""
+    return await conn.fetch(f'''
+        SELECT discord_id, SUM(final_earned_usd - settled_usd) AS saldo, COUNT(*) AS videos
+        FROM ({_union_pendientes()}) p
+        GROUP BY discord_id
+        HAVING SUM(final_earned_usd - settled_usd) >= $1
+        ORDER BY saldo DESC
+    ''', minimo)
+
+
+async def videos_pendientes(conn, discord_id):
+    """Posts de un usuario con saldo, con lo que falta pagar de cada uno"""
+    return await conn.fetch(f'''
+        SELECT platform, post_url, bounty_tag, views - settled_views AS views_pendientes,
+               final_earned_usd - settled_usd AS pendiente
+        FROM ({_union_pendientes("AND discord_id = $1")}) p
+        ORDER BY pendiente DESC
+    ''', discord_id)
+
+
+def a_centavos(monto):
+    """Lo que realmente se puede pagar: hacia abajo al centavo"""
+    return Decimal(monto).quantize(CENTAVO, rounding=ROUND_DOWN)
+
+
+async def liquidar(conn, discord_ids, pagado_por=None, batch_id=None):
+    """Liquida el saldo de uno o varios usuarios en una sola transacción.
+
+    Mueve la marca de cada post pendiente a sus vistas/ganancias actuales y
+    registra el pago en el ledger. El monto se paga en centavos enteros: la
+    fracción de centavo queda pendiente en el post con más saldo. Devuelve
+    {discord_id: {"payout_id", "amount_usd", "views", "post_count"}} (solo
+    usuarios con al menos un centavo que pagar).
+    """
+    batch_id = batch_id or uuid.uuid4().hex
+    discord_ids = [str(i) for i in discord_ids]
+
+    async with conn.transaction():
+        pendientes = []
+        for plat, (tabla, url_col) in TABLAS_POSTS.items():
+            filas = await conn.fetch(f'''
+                SELECT id, discord_id, {url_col} AS post_url, COALESCE(views, 0) AS views,
+                       settled_views, final_earned_usd, settled_usd
+                FROM {tabla}
+                WHERE discord_id = ANY($1::text[]) AND final_earned_usd > settled_usd
+                FOR UPDATE
+            ''', discord_ids)
+            pendientes.extend((plat, f) for f in filas)
+
+        por_usuario = {}
+        for plat, f in pendientes:
+            por_usuario.setdefault(f["discord_id"], []).append((plat, f))
+
+        # Nueva marca de cada post: todo, salvo el resto sub-centavo del usuario
+        items = []
+        totales = {}
+        for discord_id, posts in por_usuario.items():
+            saldo = sum(f["final_earned_usd"] - f["settled_usd"] for _, f in posts)
+            monto = a_centavos(saldo)
+            if monto <= 0:
+                continue
+            resto = saldo - monto
+            posts.sort(key=lambda pf: pf[1]["final_earned_usd"] - pf[1]["settled_usd"], reverse=True)
+            for plat, f in posts:
+                queda = min(resto, f["final_earned_usd"] - f["settled_usd"])
+                resto -= queda
+                items.append((plat, f, f["final_earned_usd"] - queda))
+            totales[discord_id] = {
+                "amount_usd": monto,
+                "views": sum(max(f["views"] - f["settled_views"], 0) for _, f in posts),
+                "post_count": len(posts),
+            }
+
+        if not items:
+            return {}
+
+        for plat, (tabla, _) in TABLAS_POSTS.items():
+            de_tabla = [(f, usd_to) for p, f, usd_to in items if p == plat]
+            if de_tabla:
+                await conn.execute(f'''
+                    UPDATE {tabla} t
+                    SET settled_views = u.views, settled_usd = u.usd, settled_at = NOW()
+                    FROM unnest($1::int[], $2::int[], $3::numeric[]) AS u(id, views, usd)
+                    WHERE t.id = u.id
+                ''', [f["id"] for f, _ in de_tabla], [f["views"] for f, _ in de_tabla], [u for _, u in de_tabla])
+
+        usuarios = list(totales)
+        payouts = await conn.fetch('''
+            INSERT INTO payouts (batch_id, discord_id, amount_usd, views, post_count, paid_by)
+            SELECT $1, u.discord_id, u.amount_usd, u.views, u.post_count, $2
+            FROM unnest($3::text[], $4::numeric[], $5::bigint[], $6::int[]) AS u(discord_id, amount_usd, views, post_count)
+            RETURNING id, discord_id
+        ''', batch_id, pagado_por, usuarios,
+            [totales[u]["amount_usd"] for u in usuarios],
+            [totales[u]["views"] for u in usuarios],
+            [totales[u]["post_count"] for u in usuarios])
+        for p in payouts:
+            totales[p["discord_id"]]["payout_id"] = p["id"]
+
+        await conn.copy_records_to_table(
+            "payout_items",
+            records=[
+                (totales[f["discord_id"]]["payout_id"], plat, f["post_url"],
+                 f["settled_views"], f["views"], f["settled_usd"], usd_to)
+                for plat, f, usd_to in items
+            ],
+            columns=["payout_id", "platform", "post_url", "views_from", "views_to", "usd_from", "usd_to"]
+        )
+
+    return totales
+
+
+# ====================================================
+#   EXPORTACIÓN PAYPAL MASS PAYOUT (CSV)
+# ====================================================
+# Formato de PayPal Payouts: email, monto, moneda, id propio, nota (sin cabecera).
+
+def _saldos_con_paypal():
+    return f'''
+        SELECT s.discord_id, s.saldo AS amount_usd, pm.paypal_email
+        FROM (
+            SELECT discord_id, SUM(final_earned_usd - settled_usd) AS saldo
+            FROM ({_union_pendientes()}) p
+            GROUP BY discord_id
+            HAVING SUM(final_earned_usd - settled_usd) >= $1
+        ) s
+        JOIN payment_methods pm ON pm.discord_id = s.discord_id AND pm.method_type = 'paypal'
+        WHERE pm.paypal_email IS NOT NULL
+    '''
+
+
+async def preparar_lote_paypal(conn, minimo=PAYOUT_MIN_USD, pagado_por=None):
+    """Liquida en una transacción a todos los que superan el mínimo y tienen PayPal.
+
+    Devuelve el batch_id (None si no había nadie); el CSV sale después de
+    `payouts`, así que el mismo lote puede volver a exportarse.
+    """
+    async with conn.transaction():
+        ids = [r["discord_id"] for r in await conn.fetch(_saldos_con_paypal(), minimo)]
+        if not ids:
+            return None
+        batch_id = uuid.uuid4().hex
+        await liquidar(conn, ids, pagado_por=pagado_por, batch_id=batch_id)
+    return batch_id
+
+
+async def exportar_paypal(conn, minimo=PAYOUT_MIN_USD, batch_id=None, lote=500):
+    """Genera el CSV por partes (str) leyendo con un cursor de servidor.
+
+    Sin batch_id exporta los saldos pendientes actuales (vista previa, no
+    liquida); con batch_id exporta ese lote ya liquidado del ledger.
+    """
+    if batch_id:
+        query = '''
+            SELECT p.discord_id, p.amount_usd, pm.paypal_email, p.id AS payout_id
+            FROM payouts p
+            JOIN payment_methods pm ON pm.discord_id = p.discord_id AND pm.method_type = 'paypal'
+            WHERE p.batch_id = $1
+            ORDER BY p.id
+        '''
+        args = (batch_id,)
+    else:
+        query = _saldos_con_paypal() + " ORDER BY s.discord_id"
+        args = (minimo,)
+
+    async with conn.transaction():
+        cursor = await conn.cursor(query, *args)
+        while True:
+            filas = await cursor.fetch(lote)
+            if not filas:
+                break
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer, lineterminator="\n")
+            for f in filas:
+                # Los lotes liquidados ya están en centavos; la vista previa se redondea igual que liquidar
+                monto = a_centavos(f["amount_usd"])
+                referencia = f"{batch_id[:8]}-{f['payout_id']}" if batch_id else f["discord_id"]
+                escritor.writerow([f["paypal_email"], f"{monto}", "USD", referencia, PAYOUT_NOTE])
+            yield buffer.getvalue()
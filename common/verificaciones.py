@@ -0,0 +1,31 @@
+# ====================================================
+#   COLA DE VERIFICACIÓN (tabla compartida)
+# ====================================================
+# El bot principal encola los /verificar y metrics_server los cierra cuando
+# n8n confirma. Los dos crean la tabla al arrancar: metrics_server puede
+# correr contra una base que el bot nunca inicializó.
+# status: pending -> running -> waiting (esperando a n8n) -> verified | failed
+
+
+async def crear_tablas(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS verification_jobs (
+            id SERIAL PRIMARY KEY,
+            discord_id TEXT,
+            platform TEXT,
+            username TEXT,
+            status TEXT DEFAULT 'pending',
+            result TEXT,
+            attempts INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW(),
+            finished_at TIMESTAMP,
+            notified_at TIMESTAMP
+        )
+    ''')
+    # Un solo job activo por (discord_id, platform): los clicks repetidos no duplican scrapes
+    await conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS verification_jobs_activos
+        ON verification_jobs (discord_id, platform)
+        WHERE status IN ('pending', 'running', 'waiting')
+    ''')
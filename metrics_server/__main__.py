@@ -0,0 +1,32 @@
+"""Entry point liviano del metrics_server: `python -m metrics_server`.
+
+No importa nada de bots/ ni discord.py, así que sirve para escalar solo el
+tier HTTP de ingest. Con METRICS_WORKERS > 1 uvicorn levanta varios
+procesos; cada uno corre el startup y arma su propio pool (METRICS_POOL_MAX).
+Todos comparten el spool de ingest (METRICS_SPOOL_DIR), que debe vivir en un
+disco persistente.
+"""
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    workers = int(os.getenv("METRICS_WORKERS", "1"))
+    uvicorn.run(
+        "metrics_server.metrics_server:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 8000)),
+        workers=workers,
+        log_level=os.getenv("LOG_LEVEL", "info"),
+        # uvloop/httptools si están instalados
+        loop="auto",
+        http="auto",
+    )
+
+
+if __name__ == "__main__":
+    main()
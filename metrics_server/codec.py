@@ -0,0 +1,110 @@
+import json
+from typing import List, Optional
+
+from fastapi import HTTPException, Response
+
+# ====================================================
+#   CODEC RÁPIDO PARA METRICS_SERVER
+# ====================================================
+# Decodifica los payloads de n8n con msgspec (validador compilado) y codifica
+# las respuestas con orjson. Las dos están en requirements.txt (el camino
+# rápido es el de producción); si faltan en algún entorno se vuelve a
+# Pydantic / json de la stdlib con el mismo resultado, pero más lento.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+# ---------------------------------------------------------
+# ENCODE
+# ---------------------------------------------------------
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+elif msgspec is not None:
+    dumps = msgspec.json.Encoder().encode
+else:
+    def _por_defecto(obj):
+        # Fechas como ISO 8601, igual que orjson/msgspec
+        return obj.isoformat() if hasattr(obj, "isoformat") else str(obj)
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_por_defecto).encode()
+
+
+def respuesta_json(obj, status_code=200, headers=None) -> Response:
+    """Response ya serializada: evita el jsonable_encoder de FastAPI"""
+    return Response(content=dumps(obj), status_code=status_code, media_type="application/json", headers=headers)
+
+
+def filas_json(records, campos) -> List[bytes]:
+    """Codifica cada Record una sola vez como objeto JSON con `campos` como claves.
+
+    Las claves se pre-codifican y los valores van directo del Record, sin
+    armar un dict por fila.
+    """
+    claves = [dumps(c) + b":" for c in campos]
+    primera, resto = b"{" + claves[0], claves[1:]
+    filas = []
+    for r in records:
+        partes = [primera, dumps(r[0])]
+        for i, clave in enumerate(resto, 1):
+            partes.append(b"," + clave)
+            partes.append(dumps(r[i]))
+        partes.append(b"}")
+        filas.append(b"".join(partes))
+    return filas
+
+
+def array_json(filas: List[bytes]) -> bytes:
+    return b"[" + b",".join(filas) + b"]"
+
+
+# JSON genérico (lo usa el spool de ingest para leer sus registros)
+if orjson is not None:
+    loads = orjson.loads
+elif msgspec is not None:
+    loads = msgspec.json.decode
+else:
+    loads = json.loads
+
+
+# ---------------------------------------------------------
+# DECODE (payloads de /metrics/ingest)
+# ---------------------------------------------------------
+if msgspec is not None:
+    class MetricItemStruct(msgspec.Struct):
+        video_id: str
+        views: int
+        likes: int
+        url: str
+        shares: int = 0
+
+    class MetricsPayloadStruct(msgspec.Struct):
+        discord_id: str
+        platform: str
+        videos: List[MetricItemStruct]
+        lease_id: Optional[str] = None
+
+    # strict=False: acepta números como string ("1200"), igual que Pydantic
+    _decoder = msgspec.json.Decoder(MetricsPayloadStruct, strict=False)
+
+    def decodificar_metricas(body: bytes, modelo=None):
+        try:
+            return _decoder.decode(body)
+        except msgspec.DecodeError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+else:
+    def decodificar_metricas(body: bytes, modelo=None):
+        """Sin msgspec: Pydantic v2 valida directo desde los bytes (sin dict intermedio)"""
+        try:
+            return modelo.model_validate_json(body)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
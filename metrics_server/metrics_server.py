@@ -1,9 +1,76 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import asyncpg
+import asyncio
+import hashlib
+import hmac
+import time
+import uuid
 import uvicorn
+from datetime import datetime, timedelta, timezone
 import os
 from typing import List, Optional
+from common import ganancias, pagos, verificaciones
+from metrics_server import codec, spool
+
+# Cache de /users/active: segundos máximos aunque no llegue ningún NOTIFY,
+# y filas por consulta al recorrer la lista completa
+ACTIVE_CACHE_TTL = int(os.getenv("ACTIVE_CACHE_TTL", "600"))
+ACTIVE_PAGE_SIZE = int(os.getenv("ACTIVE_PAGE_SIZE", "1000"))
+
+# Scheduler de scrapes: intervalos mínimo/máximo entre refrescos de un post
+# y tope de posts que entregamos por llamada
+SCRAPE_MIN_HOURS = float(os.getenv("SCRAPE_MIN_HOURS", "1"))
+SCRAPE_MAX_HOURS = float(os.getenv("SCRAPE_MAX_HOURS", "72"))
+SCRAPE_SCHEDULE_MAX = int(os.getenv("SCRAPE_SCHEDULE_MAX", "500"))
+# Cada cuánto vuelve a repartirse una cuenta entre los workers (n8n)
+SCRAPE_ACCOUNT_INTERVAL_MIN = int(os.getenv("SCRAPE_ACCOUNT_INTERVAL_MIN", "720"))
+# Conexiones del pool por proceso (con varios workers de uvicorn, cada uno tiene el suyo)
+METRICS_POOL_MAX = int(os.getenv("METRICS_POOL_MAX", "5"))
+# Tiempo máximo que /metrics/ingest espera a la DB antes de guardar en el spool
+INGEST_DB_BUDGET = float(os.getenv("METRICS_INGEST_DB_BUDGET_MS", "3000")) / 1000
+
+# Fallos de DB por los que vale la pena reintentar más tarde (el resto es un error real)
+ERRORES_DB_TRANSITORIOS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.TooManyConnectionsError,
+    asyncpg.QueryCanceledError,
+    asyncpg.exceptions.OperatorInterventionError,
+    asyncpg.exceptions.TransactionRollbackError,
+)
+
+# Token para exportar pagos (sin token el endpoint queda deshabilitado)
+PAYOUTS_API_TOKEN = os.getenv("PAYOUTS_API_TOKEN", "")
+
+# ---------------------------------------------------------
+# HELPERS
+# ---------------------------------------------------------
+def tabla_por_plataforma(platform: str):
+    """Devuelve (tabla, columna_url) para la red social"""
+    if platform == "youtube":
+        return "tracked_posts", "post_url"
+    elif platform == "instagram":
+        return "tracked_posts_instagram", "instagram_url"
+    return "tracked_posts_tiktok", "tiktok_url"
+
+def calcular_intervalo_refresco(views_per_hour: float, edad_horas: float, es_bounty: bool) -> float:
+    """Horas hasta el próximo scrape de un post.
+
+    Cuanto más rápido suben las vistas, antes volvemos; los clips viejos se
+    espacian y los que están en campaña (bounty) se refrescan el doble de seguido.
+    """
+    horas = SCRAPE_MIN_HOURS + (SCRAPE_MAX_HOURS - SCRAPE_MIN_HOURS) / (1 + views_per_hour / 50)
+    if edad_horas < 48:
+        horas = min(horas, 6)  # Los clips recién subidos se mueven rápido
+    else:
+        horas *= min(1 + edad_horas / (24 * 14), 4)
+    if es_bounty:
+        horas /= 2
+    return max(SCRAPE_MIN_HOURS, min(horas, SCRAPE_MAX_HOURS))
 
 # Modelos de datos
 class MetricItem(BaseModel):
@@ -17,132 +84,481 @@ class MetricsPayload(BaseModel):
     discord_id: str
     platform: str  # 'youtube' o 'tiktok'
     videos: List[MetricItem]
+    lease_id: Optional[str] = None  # Lease de /work/claim que completa este envío
 
 class VerificationPayload(BaseModel):
     discord_id: str
     platform: str
     is_verified: bool
 
+class VerificationBatchPayload(BaseModel):
+    results: List[VerificationPayload]
+
+class WorkClaimPayload(BaseModel):
+    worker_id: str
+    platform: str
+    kind: str = "accounts"  # 'accounts' (perfiles) o 'posts' (videos vencidos)
+    batch_size: int = 50
+    lease_seconds: int = 900
+
+class WorkCompletePayload(BaseModel):
+    lease_id: str
+
+class PayoutExportPayload(BaseModel):
+    min_usd: float = pagos.PAYOUT_MIN_USD
+    settle: bool = False            # True: liquida el lote antes de exportarlo
+    batch_id: Optional[str] = None  # Re-exporta un lote ya liquidado
+    paid_by: Optional[str] = None
+
 app = FastAPI()
 app.db_pool = None
+app.spool = None             # metrics_server/spool.py (se abre en el startup)
+app.active_cache = {}        # platform -> {(cursor, limit): {"etag", "next", "loaded_at"}}
+app.active_generation = 0    # sube con cada invalidación (evita guardar cargas viejas)
+app.active_listener_ok = False
 
-app.on_event("startup")
+@app.on_event("startup")
 async def startup():
+    app.spool = spool.Spool()
     print("⏳ Conectando metrics_server a DB...")
     app.db_pool = await asyncpg.create_pool(
         os.getenv("DATABASE_URL"),
         ssl="require",
         min_size=1,
-        max_size=5
+        max_size=METRICS_POOL_MAX
     )
     
     # --- AUTO-FIX DE BASE DE DATOS (EL DOCTOR 👨‍⚕️) ---
     print("🔧 Ejecutando mantenimiento de tablas...")
     async with app.db_pool.acquire() as conn:
-        tables = ["tracked_posts", "tracked_posts_tiktok", "tracked_posts_instagram"]
-        for table in tables:
-            try:
-                await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS video_id TEXT;")
-                
-                await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS shares INTEGER DEFAULT 0;")
-                
-                print(f"✅ Columnas verificadas en {table}")
-                
-            except Exception as e:
-                print(f"⚠️ Nota sobre {table}: {e}")
+        # Con varios workers arrancando a la vez, el doctor corre de a uno
+        await conn.execute("SELECT pg_advisory_lock(hashtext('metrics_server_doctor'))")
+        try:
+            await doctor(conn)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext('metrics_server_doctor'))")
     # ---------------------------------------------------
 
+    app.active_listener_task = asyncio.create_task(escuchar_cambios_cuentas())
+    # Lo que quedó en el spool (de este u otro worker, o de antes de reiniciar) vuelve a la DB
+    app.spool_task = asyncio.create_task(app.spool.bucle(aplicar_registros))
+
     print("🟢 metrics_server conectado y tablas actualizadas.")
 
+async def a_timestamptz(conn, tabla, columna, utc):
+    """Pasa una columna TIMESTAMP a TIMESTAMPTZ (una sola vez).
+
+    `utc`: los valores se escribían desde Python en UTC. Si no, salían de NOW()
+    y están en la zona horaria de la sesión, que es como los lee el cast.
+    """
+    tipo = await conn.fetchval('''
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = $1 AND column_name = $2
+    ''', tabla, columna)
+    if tipo == "timestamp without time zone":
+        origen = f"{columna} AT TIME ZONE 'UTC'" if utc else columna
+        await conn.execute(f"ALTER TABLE {tabla} ALTER COLUMN {columna} TYPE TIMESTAMPTZ USING {origen}")
+
+async def doctor(conn):
+    """Agrega columnas/tablas que el bot principal no crea (idempotente)"""
+    tables = ["tracked_posts", "tracked_posts_tiktok", "tracked_posts_instagram"]
+    for table in tables:
+        try:
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS video_id TEXT;")
+            
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS shares INTEGER DEFAULT 0;")
+
+            # Columnas del scheduler adaptativo (timestamptz: se comparan con NOW() sin importar la zona del servidor)
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS last_scraped_at TIMESTAMPTZ;")
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS views_per_hour DOUBLE PRECISION DEFAULT 0;")
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS next_refresh_at TIMESTAMPTZ;")
+            await a_timestamptz(conn, table, "last_scraped_at", utc=True)
+            await a_timestamptz(conn, table, "next_refresh_at", utc=True)
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_next_refresh_idx ON {table} (next_refresh_at);")
+
+            # Leases de workers paralelos
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS lease_id TEXT;")
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS leased_until TIMESTAMPTZ;")
+            await a_timestamptz(conn, table, "leased_until", utc=False)
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_lease_idx ON {table} (lease_id) WHERE lease_id IS NOT NULL;")
+            
+            print(f"✅ Columnas verificadas en {table}")
+            
+        except Exception as e:
+            print(f"⚠️ Nota sobre {table}: {e}")
+    try:
+        await conn.execute("ALTER TABLE social_accounts ADD COLUMN IF NOT EXISTS last_scraped_at TIMESTAMPTZ;")
+        await conn.execute("ALTER TABLE social_accounts ADD COLUMN IF NOT EXISTS lease_id TEXT;")
+        await conn.execute("ALTER TABLE social_accounts ADD COLUMN IF NOT EXISTS leased_until TIMESTAMPTZ;")
+        await a_timestamptz(conn, "social_accounts", "last_scraped_at", utc=False)
+        await a_timestamptz(conn, "social_accounts", "leased_until", utc=False)
+        await conn.execute("CREATE INDEX IF NOT EXISTS social_accounts_lease_idx ON social_accounts (lease_id) WHERE lease_id IS NOT NULL;")
+        # /users/active recorre las verificadas de una plataforma por id
+        await conn.execute("CREATE INDEX IF NOT EXISTS social_accounts_active_idx ON social_accounts (platform, id) WHERE is_verified = TRUE;")
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS scrape_leases (
+                id TEXT PRIMARY KEY,
+                worker_id TEXT,
+                kind TEXT,
+                platform TEXT,
+                item_count INTEGER,
+                status TEXT DEFAULT 'active',
+                expires_at TIMESTAMPTZ,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                completed_at TIMESTAMPTZ
+            )
+        ''')
+        for columna in ("expires_at", "created_at", "completed_at"):
+            await a_timestamptz(conn, "scrape_leases", columna, utc=False)
+        print("✅ Tablas de leases verificadas")
+    except Exception as e:
+        print(f"⚠️ Nota sobre leases: {e}")
+    try:
+        await pagos.crear_tablas(conn)
+        print("✅ Ledger de pagos verificado")
+    except Exception as e:
+        print(f"⚠️ Nota sobre ledger de pagos: {e}")
+    try:
+        # Puede que el bot principal nunca haya corrido contra esta base
+        await verificaciones.crear_tablas(conn)
+        print("✅ Cola de verificación verificada")
+    except Exception as e:
+        print(f"⚠️ Nota sobre verification_jobs: {e}")
+
+# ---------------------------------------------------------
+# CACHE DE CUENTAS ACTIVAS (Invalidación por NOTIFY)
+# ---------------------------------------------------------
+def invalidar_cache_activos(platform: str = ""):
+    """Vacía la cache de una plataforma (o de todas si viene vacío)"""
+    app.active_generation += 1
+    if platform:
+        app.active_cache.pop(platform.lower(), None)
+    else:
+        app.active_cache.clear()
+
+async def escuchar_cambios_cuentas():
+    """LISTEN social_accounts_changed: los bots avisan en /registrar y /remover-cuenta"""
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(os.getenv("DATABASE_URL"), ssl="require")
+            await conn.add_listener(
+                "social_accounts_changed",
+                lambda _conn, _pid, _channel, payload: invalidar_cache_activos(payload)
+            )
+            # Lo que cambió mientras no escuchábamos ya no es confiable
+            invalidar_cache_activos()
+            app.active_listener_ok = True
+            while not conn.is_closed():
+                await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Listener de social_accounts caído: {e}")
+        finally:
+            # Sin listener no podemos confiar en la cache
+            app.active_listener_ok = False
+            invalidar_cache_activos()
+            if conn and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(5)
+
+ACTIVE_SQL = '''
+    SELECT discord_id, username, platform, id
+    FROM social_accounts
+    WHERE is_verified = TRUE AND platform = $1 AND id > $2
+    ORDER BY id
+    LIMIT $3
+'''
+
+async def leer_pagina_activas(platform: str, cursor: int, limit: int):
+    """Cuentas con id > cursor, ya codificadas. Devuelve (filas, siguiente_cursor o None)"""
+    async with app.db_pool.acquire() as conn:
+        users = await conn.fetch(ACTIVE_SQL, platform, cursor, limit + 1)
+    siguiente = users[limit - 1]["id"] if len(users) > limit else None
+    return codec.filas_json(users[:limit], ("discord_id", "username", "platform")), siguiente
+
+def etag_en_cache(platform: str, clave):
+    """ETag conocido de una página, si la cache todavía es confiable"""
+    pagina = app.active_cache.get(platform, {}).get(clave)
+    if pagina and app.active_listener_ok and time.monotonic() - pagina["loaded_at"] < ACTIVE_CACHE_TTL:
+        return pagina
+    return None
+
+def guardar_etag(platform: str, clave, etag: str, siguiente, generation: int):
+    # Si hubo una invalidación mientras leíamos, la página puede estar vieja: no se guarda
+    if generation == app.active_generation and app.active_listener_ok:
+        app.active_cache.setdefault(platform, {})[clave] = {
+            "etag": etag, "next": siguiente, "loaded_at": time.monotonic()
+        }
+
+def cabeceras_activas(etag, siguiente):
+    headers = {"Cache-Control": "no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    if siguiente is not None:
+        headers["X-Next-Cursor"] = str(siguiente)
+    return headers
+
+async def _stream_activas(platform, filas, siguiente, clave, generation):
+    """Lista completa por tramos de ACTIVE_PAGE_SIZE: cada consulta sigue desde el último id enviado"""
+    digest = hashlib.sha1(b"[")
+    yield b"["
+    enviadas = False
+    while True:
+        if filas:
+            parte = (b"," if enviadas else b"") + b",".join(filas)
+            digest.update(parte)
+            yield parte
+            enviadas = True
+        if siguiente is None:
+            break
+        filas, siguiente = await leer_pagina_activas(platform, siguiente, ACTIVE_PAGE_SIZE)
+    digest.update(b"]")
+    yield b"]"
+    # El ETag se conoce recién al final: queda para el próximo pedido
+    guardar_etag(platform, clave, f'"{digest.hexdigest()[:20]}"', None, generation)
+
+# ---------------------------------------------------------
+# HEALTHCHECK (para balanceadores y el benchmark de arranque)
+# ---------------------------------------------------------
+@app.get("/healthz")
+async def healthz():
+    return codec.respuesta_json({
+        "status": "ok" if app.db_pool is not None else "starting",
+        "pid": os.getpid(),
+        "listener": app.active_listener_ok,
+        "spool": app.spool.metricas() if app.spool else None,
+    })
+
 # ---------------------------------------------------------
 # ENDPOINT 1: Para que n8n sepa qué cuentas scrapear (CRON)
 # ---------------------------------------------------------
 @app.get("/users/active")
-async def get_active_users(platform: str):
-    """Devuelve usuarios verificados para que n8n los procese"""
-    async with app.db_pool.acquire() as conn:
-        users = await conn.fetch('''
-            SELECT discord_id, username, platform 
-            FROM social_accounts 
-            WHERE is_verified = TRUE AND platform = $1
-        ''', platform.lower())
-    
-    return [dict(u) for u in users]
+async def get_active_users(request: Request, platform: str, cursor: Optional[int] = None, limit: Optional[int] = None):
+    """Devuelve usuarios verificados para que n8n los procese.
+
+    Sin `limit` devuelve la lista completa (como siempre), leída y enviada en
+    tramos de ACTIVE_PAGE_SIZE. Con `limit` pagina por `cursor` y deja el
+    siguiente en la cabecera X-Next-Cursor. Las filas no quedan en memoria
+    entre pedidos: la cache solo guarda el ETag de cada página.
+    """
+    platform = platform.lower()
+    desde = cursor if cursor is not None else 0
+    limite = limit if limit and limit > 0 else None
+    clave = (desde, limite)
+
+    # n8n ya tiene esta página y nadie tocó social_accounts: 304 sin ir a la DB
+    cacheada = etag_en_cache(platform, clave)
+    if cacheada and request.headers.get("if-none-match") == cacheada["etag"]:
+        return Response(status_code=304, headers=cabeceras_activas(cacheada["etag"], cacheada["next"]))
+
+    generation = app.active_generation
+    filas, siguiente = await leer_pagina_activas(platform, desde, limite or ACTIVE_PAGE_SIZE)
+    if limite is None and siguiente is not None:
+        etag = cacheada["etag"] if cacheada else None
+        return StreamingResponse(_stream_activas(platform, filas, siguiente, clave, generation),
+                                 media_type="application/json", headers=cabeceras_activas(etag, None))
+
+    cuerpo = codec.array_json(filas)
+    etag = f'"{hashlib.sha1(cuerpo).hexdigest()[:20]}"'
+    guardar_etag(platform, clave, etag, siguiente, generation)
+    headers = cabeceras_activas(etag, siguiente)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
 
 # ---------------------------------------------------------
 # ENDPOINT 2: Recibir Métricas Y CALCULAR DINERO
 # ---------------------------------------------------------
-@app.post("/metrics/ingest")
-async def save_metrics(payload: MetricsPayload):
-    print(f"📩 Métricas recibidas para {payload.platform} ({len(payload.videos)} videos)")
-    
-    # 1. Definir la TARIFA (Esto hace que sea real)
-    # $0.025 por cada 1,000 vistas
-    RATE_PER_1K = 0.025 
+def registro_ingest(payload):
+    """Envío de n8n en forma compacta (lo mismo que se guarda en el spool)"""
+    return {
+        "t": time.time(),
+        "d": str(payload.discord_id),
+        "p": payload.platform,
+        "l": payload.lease_id,
+        "v": [[v.url, v.video_id, v.views, v.likes, v.shares] for v in payload.videos],
+    }
+
+async def aplicar_registros(registros):
+    """Escribe envíos de ingest en la DB: último valor por URL y un upsert por tabla.
+
+    Lo usa /metrics/ingest (un registro) y el replayer del spool (lotes). El
+    upsert no pisa un post con un scrape más nuevo que el registro, así que
+    reaplicar un registro es inofensivo.
+    """
+    # 1. Nos quedamos con el scrape más reciente de cada URL
+    ultimos = {}
+    leases = set()
+    for r in registros:
+        for url, video_id, views, likes, shares in r["v"]:
+            clave = (r["p"], url)
+            if clave not in ultimos or ultimos[clave]["t"] <= r["t"]:
+                ultimos[clave] = {"t": r["t"], "d": r["d"], "video_id": video_id,
+                                  "views": views, "likes": likes, "shares": shares}
+        if r["l"]:
+            leases.add((r["l"], r["d"], r["p"]))
 
     # 2. Seleccionar la tabla y columna correcta según la red social
-    if payload.platform == "youtube":
-        table_name = "tracked_posts"
-        url_col = "post_url"
-    elif payload.platform == "instagram":
-        table_name = "tracked_posts_instagram"
-        url_col = "instagram_url"
-    else:
-        table_name = "tracked_posts_tiktok"
-        url_col = "tiktok_url"
+    por_tabla = {}
+    for (platform, url), fila in ultimos.items():
+        por_tabla.setdefault(tabla_por_plataforma(platform), {})[url] = fila
+
+    # $0.025 por cada 1,000 vistas (common/ganancias.py, la misma que concilia tools/recalcular_ganancias)
+    RATE_PER_1K = float(ganancias.TARIFA_INGEST_1K)
 
     async with app.db_pool.acquire() as conn:
-        for v in payload.videos:
-            # 3. 🧮 CÁLCULO MATEMÁTICO AUTOMÁTICO
-            # Si tiene 10,000 vistas -> (10000 / 1000) * 0.025 = $0.25
-            dinero_generado = (v.views / 1000) * RATE_PER_1K
-            
-            # 4. GUARDAR TODO EN LA BASE DE DATOS (Vistas + Dinero)
-            # Fíjate que ahora insertamos 'final_earned_usd'
-            await conn.execute(f'''
-                INSERT INTO {table_name} (discord_id, {url_col}, video_id, views, likes, shares, final_earned_usd)
-                VALUES ($1, $2, $3, $4, $5, $6, $7)
-                ON CONFLICT ({url_col})  
-                DO UPDATE SET 
-                    views = EXCLUDED.views,
-                    likes = EXCLUDED.likes,
-                    shares = EXCLUDED.shares,
-                    final_earned_usd = EXCLUDED.final_earned_usd  -- 🔄 Actualiza el dinero si suben las vistas
-            ''',
-                str(payload.discord_id),
-                v.url,
-                v.video_id,
-                v.views,
-                v.likes,
-                v.shares,
-                dinero_generado  # <--- Aquí va el valor calculado automáticamente
-            )
+        async with conn.transaction():
+            for (table_name, url_col), filas in por_tabla.items():
+                # Estado anterior de los posts del lote (para la velocidad de vistas)
+                previos = {
+                    p["url"]: p for p in await conn.fetch(f'''
+                        SELECT {url_col} AS url, views, last_scraped_at, uploaded_at::timestamptz AS uploaded_at, is_bounty
+                        FROM {table_name} WHERE {url_col} = ANY($1::text[])
+                    ''', list(filas))
+                }
 
-    return {
-        "status": "ok", 
-        "processed": len(payload.videos), 
+                columnas = {k: [] for k in ("discord_id", "url", "video_id", "views", "likes", "shares",
+                                            "dinero", "scrapeado", "vph", "proximo")}
+                for url, f in filas.items():
+                    ahora = datetime.fromtimestamp(f["t"], timezone.utc)
+                    # 3. 🧮 Si tiene 10,000 vistas -> (10000 / 1000) * 0.025 = $0.25
+                    dinero_generado = (f["views"] / 1000) * RATE_PER_1K
+
+                    # 4. ⏱️ PRÓXIMO REFRESCO según velocidad, edad y bounty
+                    previo = previos.get(url)
+                    if previo:
+                        desde = previo["last_scraped_at"] or previo["uploaded_at"] or ahora
+                        horas = max((ahora - desde).total_seconds() / 3600, 0.25)
+                        views_per_hour = max(f["views"] - (previo["views"] or 0), 0) / horas
+                        edad_horas = (ahora - (previo["uploaded_at"] or ahora)).total_seconds() / 3600
+                        es_bounty = bool(previo["is_bounty"])
+                    else:
+                        views_per_hour, edad_horas, es_bounty = 0.0, 0.0, False
+                    proximo = ahora + timedelta(hours=calcular_intervalo_refresco(views_per_hour, edad_horas, es_bounty))
+
+                    for k, valor in (("discord_id", f["d"]), ("url", url), ("video_id", f["video_id"]),
+                                     ("views", f["views"]), ("likes", f["likes"]), ("shares", f["shares"]),
+                                     ("dinero", dinero_generado), ("scrapeado", ahora),
+                                     ("vph", views_per_hour), ("proximo", proximo)):
+                        columnas[k].append(valor)
+
+                # 5. GUARDAR TODO EN LA BASE DE DATOS (Vistas + Dinero), un solo upsert por tabla
+                await conn.execute(f'''
+                    INSERT INTO {table_name} AS t (discord_id, {url_col}, video_id, views, likes, shares, final_earned_usd,
+                                                   last_scraped_at, views_per_hour, next_refresh_at)
+                    SELECT * FROM unnest($1::text[], $2::text[], $3::text[], $4::bigint[], $5::bigint[], $6::bigint[],
+                                         $7::float8[], $8::timestamptz[], $9::float8[], $10::timestamptz[])
+                    ON CONFLICT ({url_col})
+                    DO UPDATE SET
+                        views = EXCLUDED.views,
+                        likes = EXCLUDED.likes,
+                        shares = EXCLUDED.shares,
+                        final_earned_usd = EXCLUDED.final_earned_usd,  -- 🔄 Actualiza el dinero si suben las vistas
+                        last_scraped_at = EXCLUDED.last_scraped_at,
+                        views_per_hour = EXCLUDED.views_per_hour,
+                        next_refresh_at = EXCLUDED.next_refresh_at,
+                        lease_id = NULL,
+                        leased_until = NULL
+                    -- Un registro viejo del spool no pisa un scrape más nuevo
+                    WHERE t.last_scraped_at IS NULL OR t.last_scraped_at <= EXCLUDED.last_scraped_at
+                ''', *columnas.values())
+
+            # 6. Si venía de un lease, la cuenta queda liberada y scrapeada
+            for lease_id, discord_id, platform in leases:
+                await conn.execute('''
+                    UPDATE social_accounts SET lease_id = NULL, leased_until = NULL, last_scraped_at = NOW()
+                    WHERE lease_id = $1 AND discord_id = $2 AND platform = $3
+                ''', lease_id, discord_id, platform)
+                await cerrar_lease_si_terminado(conn, lease_id)
+
+@app.post("/metrics/ingest")
+async def save_metrics(request: Request):
+    # Validación compilada directo desde los bytes (ver metrics_server/codec.py)
+    payload = codec.decodificar_metricas(await request.body(), MetricsPayload)
+    print(f"📩 Métricas recibidas para {payload.platform} ({len(payload.videos)} videos)")
+    registro = registro_ingest(payload)
+
+    # Con la DB recién caída ni lo intentamos: el replayer avisa cuando vuelve
+    if not app.spool.degradado:
+        try:
+            await asyncio.wait_for(aplicar_registros([registro]), INGEST_DB_BUDGET)
+            return codec.respuesta_json({
+                "status": "ok", 
+                "processed": len(payload.videos), 
+                "mode": "REAL_MONEY_CALCULATION"
+            })
+        except ERRORES_DB_TRANSITORIOS as e:
+            print(f"⚠️ DB lenta o caída en ingest ({type(e).__name__}: {e}), guardo en el spool")
+            app.spool.degradado = True
+
+    # 7. Sin DB: al spool en disco y 202 para que n8n no vuelva a scrapear
+    try:
+        await app.spool.guardar(registro)
+    except (spool.SpoolLleno, OSError) as e:
+        print(f"❌ No se pudo guardar en el spool: {e}")
+        raise HTTPException(status_code=503, detail="DB no disponible y spool sin espacio")
+    return codec.respuesta_json({
+        "status": "spooled",
+        "processed": len(payload.videos),
         "mode": "REAL_MONEY_CALCULATION"
-    }
+    }, status_code=202)
 
 # ---------------------------------------------------------
 # ENDPOINT 3: Confirmar Verificación (Desde n8n)
 # ---------------------------------------------------------
+async def finalizar_jobs_verificacion(conn, discord_ids, platforms, verified):
+    """Cierra los jobs activos de verification_jobs y avisa al bot vía NOTIFY"""
+    try:
+        # Savepoint: si falla, la verificación de social_accounts no se pierde
+        async with conn.transaction():
+            await _cerrar_jobs(conn, discord_ids, platforms, verified)
+    except asyncpg.UndefinedTableError:
+        print("⚠️ verification_jobs no existe todavía: no hay jobs que cerrar")
+
+async def _cerrar_jobs(conn, discord_ids, platforms, verified):
+    await conn.execute('''
+        WITH res AS (
+            SELECT * FROM unnest($1::text[], $2::text[], $3::bool[]) AS r(discord_id, platform, verified)
+        ), fin AS (
+            UPDATE verification_jobs j
+            SET status = CASE WHEN res.verified THEN 'verified' ELSE 'failed' END,
+                result = CASE WHEN res.verified THEN NULL ELSE 'code_not_found' END,
+                finished_at = NOW(), updated_at = NOW()
+            FROM res
+            WHERE j.discord_id = res.discord_id AND j.platform = res.platform
+              AND j.status IN ('pending', 'running', 'waiting')
+            RETURNING j.id
+        )
+        SELECT pg_notify('verification_jobs', id::text) FROM fin
+    ''', discord_ids, platforms, verified)
+
 @app.post("/users/confirm-verification")
 async def confirm_verification(payload: VerificationPayload):
     print(f"🕵️ n8n intentó verificar {payload.platform} para {payload.discord_id}. Resultado: {payload.is_verified}")
     
     # Si n8n dice que NO está verificado (código no encontrado)
     if not payload.is_verified:
-        # Devolvemos verified: False para que el bot avise al usuario
+        # Cerramos el job para que el bot avise al usuario
+        try:
+            async with app.db_pool.acquire() as conn:
+                await finalizar_jobs_verificacion(conn, [payload.discord_id], [payload.platform], [False])
+        except Exception as e:
+            print(f"❌ Error DB verification job: {e}")
         return {"status": "ignored", "verified": False, "reason": "code_not_found"}
 
     try:
         async with app.db_pool.acquire() as conn:
-            await conn.execute('''
-                UPDATE social_accounts 
-                SET is_verified = TRUE, verified_at = NOW()
-                WHERE discord_id = $1 AND platform = $2
-            ''', payload.discord_id, payload.platform)
+            async with conn.transaction():
+                await conn.execute('''
+                    UPDATE social_accounts 
+                    SET is_verified = TRUE, verified_at = NOW()
+                    WHERE discord_id = $1 AND platform = $2
+                ''', payload.discord_id, payload.platform)
+                await finalizar_jobs_verificacion(conn, [payload.discord_id], [payload.platform], [True])
+                await conn.execute("SELECT pg_notify('social_accounts_changed', $1)", payload.platform.lower())
+        invalidar_cache_activos(payload.platform)
             
         return {"status": "success", "verified": True}
         
@@ -150,6 +566,235 @@ async def confirm_verification(payload: VerificationPayload):
         print(f"❌ Error DB verification: {e}")
         return {"status": "error", "verified": False, "message": str(e)}
 
+# ---------------------------------------------------------
+# ENDPOINT 4: Confirmar Verificación en LOTE (Re-verificaciones masivas)
+# ---------------------------------------------------------
+@app.post("/users/confirm-verification/batch")
+async def confirm_verification_batch(payload: VerificationBatchPayload):
+    print(f"🕵️ n8n envió {len(payload.results)} resultados de verificación")
+
+    # Si la misma cuenta viene repetida, manda el último resultado
+    resultados = {}
+    for r in payload.results:
+        resultados[(r.discord_id, r.platform)] = r.is_verified
+
+    claves = list(resultados.keys())
+    positivos = [k for k in claves if resultados[k]]
+
+    try:
+        async with app.db_pool.acquire() as conn:
+            async with conn.transaction():
+                # Un único UPDATE set-based para todas las cuentas verificadas
+                actualizadas = await conn.fetch('''
+                    UPDATE social_accounts sa
+                    SET is_verified = TRUE, verified_at = NOW()
+                    FROM unnest($1::text[], $2::text[]) AS v(discord_id, platform)
+                    WHERE sa.discord_id = v.discord_id AND sa.platform = v.platform
+                    RETURNING sa.discord_id, sa.platform
+                ''', [k[0] for k in positivos], [k[1] for k in positivos])
+
+                await finalizar_jobs_verificacion(
+                    conn,
+                    [k[0] for k in claves],
+                    [k[1] for k in claves],
+                    [resultados[k] for k in claves]
+                )
+                for plat in {r['platform'].lower() for r in actualizadas}:
+                    await conn.execute("SELECT pg_notify('social_accounts_changed', $1)", plat)
+    except Exception as e:
+        print(f"❌ Error DB verification batch: {e}")
+        return {"status": "error", "message": str(e)}
+
+    for plat in {r['platform'] for r in actualizadas}:
+        invalidar_cache_activos(plat)
+    encontradas = {(r['discord_id'], r['platform']) for r in actualizadas}
+
+    items = []
+    conteo = {"verified": 0, "not_found": 0, "ignored": 0}
+    for k in claves:
+        if not resultados[k]:
+            estado = "ignored"
+        elif k in encontradas:
+            estado = "verified"
+        else:
+            estado = "not_found"
+        conteo[estado] += 1
+        items.append({"discord_id": k[0], "platform": k[1], "status": estado})
+
+    return codec.respuesta_json({"status": "success", "processed": len(claves), **conteo, "results": items})
+
+# ---------------------------------------------------------
+# ENDPOINT 5: Scheduler de scrapes (qué posts toca refrescar)
+# ---------------------------------------------------------
+POST_SCHEDULE_FIELDS = ("discord_id", "url", "video_id", "views", "is_bounty", "views_per_hour", "next_refresh_at")
+
+@app.get("/scrape/schedule")
+async def get_scrape_schedule(platform: str, limit: int = 200):
+    """Posts vencidos para refrescar, primero bounties y los que más se mueven"""
+    table_name, url_col = tabla_por_plataforma(platform.lower())
+    limit = max(1, min(limit, SCRAPE_SCHEDULE_MAX))
+
+    async with app.db_pool.acquire() as conn:
+        posts = await conn.fetch(f'''
+            SELECT discord_id, {url_col} AS url, video_id, views, COALESCE(is_bounty, FALSE) AS is_bounty,
+                   ROUND(COALESCE(views_per_hour, 0)::numeric, 2)::float8 AS views_per_hour, next_refresh_at
+            FROM {table_name}
+            WHERE next_refresh_at IS NULL OR next_refresh_at <= NOW()
+            ORDER BY is_bounty DESC NULLS LAST, (next_refresh_at IS NULL) DESC, views_per_hour DESC NULLS LAST, next_refresh_at
+            LIMIT $1
+        ''', limit)
+
+    # Los Records se codifican directo (el SQL ya deja los campos con su forma final)
+    posts_json = codec.array_json(codec.filas_json(posts, POST_SCHEDULE_FIELDS)) if posts else b"[]"
+    body = b"".join([
+        b'{"platform":', codec.dumps(platform.lower()),
+        b',"count":', codec.dumps(len(posts)),
+        b',"posts":', posts_json, b"}",
+    ])
+    return Response(content=body, media_type="application/json")
+
+# ---------------------------------------------------------
+# ENDPOINT 6: Leases para workers paralelos de n8n
+# ---------------------------------------------------------
+async def cerrar_lease_si_terminado(conn, lease_id: str):
+    """Marca el lease como completado cuando ya no le quedan items pendientes"""
+    lease = await conn.fetchrow("SELECT kind, platform FROM scrape_leases WHERE id = $1 AND status = 'active'", lease_id)
+    if not lease:
+        return
+    if lease["kind"] == "posts":
+        table_name, _ = tabla_por_plataforma(lease["platform"])
+    else:
+        table_name = "social_accounts"
+    await conn.execute(f'''
+        UPDATE scrape_leases SET status = 'completed', completed_at = NOW()
+        WHERE id = $1 AND status = 'active'
+          AND NOT EXISTS (SELECT 1 FROM {table_name} WHERE lease_id = $1)
+    ''', lease_id)
+
+@app.post("/work/claim")
+async def claim_work(payload: WorkClaimPayload):
+    """Entrega un lote en exclusiva a un worker (FOR UPDATE SKIP LOCKED).
+
+    Los items quedan reservados hasta `leased_until`; si el worker muere, al
+    vencer el lease vuelven a repartirse solos en la siguiente llamada.
+    """
+    platform = payload.platform.lower()
+    batch_size = max(1, min(payload.batch_size, SCRAPE_SCHEDULE_MAX))
+    lease_seconds = max(30, payload.lease_seconds)
+    lease_id = str(uuid.uuid4())
+
+    if payload.kind == "posts":
+        table_name, url_col = tabla_por_plataforma(platform)
+        query = f'''
+            WITH cand AS (
+                SELECT id FROM {table_name}
+                WHERE (next_refresh_at IS NULL OR next_refresh_at <= NOW())
+                  AND (leased_until IS NULL OR leased_until < NOW())
+                ORDER BY is_bounty DESC NULLS LAST, (next_refresh_at IS NULL) DESC, views_per_hour DESC NULLS LAST, next_refresh_at
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE {table_name} t SET lease_id = $2, leased_until = NOW() + make_interval(secs => $3)
+            FROM cand WHERE t.id = cand.id
+            RETURNING t.discord_id, t.{url_col} AS url, t.video_id, t.views, t.is_bounty
+        '''
+        args = (batch_size, lease_id, lease_seconds)
+    elif payload.kind == "accounts":
+        query = '''
+            WITH cand AS (
+                SELECT id FROM social_accounts
+                WHERE is_verified = TRUE AND platform = $4
+                  AND (leased_until IS NULL OR leased_until < NOW())
+                  AND (last_scraped_at IS NULL OR last_scraped_at < NOW() - make_interval(mins => $5))
+                ORDER BY last_scraped_at NULLS FIRST, id
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE social_accounts sa SET lease_id = $2, leased_until = NOW() + make_interval(secs => $3)
+            FROM cand WHERE sa.id = cand.id
+            RETURNING sa.discord_id, sa.username, sa.platform
+        '''
+        args = (batch_size, lease_id, lease_seconds, platform, SCRAPE_ACCOUNT_INTERVAL_MIN)
+    else:
+        raise HTTPException(status_code=400, detail="kind debe ser 'accounts' o 'posts'")
+
+    async with app.db_pool.acquire() as conn:
+        async with conn.transaction():
+            # Leases vencidos: sus items ya son reclamables, solo actualizamos el registro
+            await conn.execute("UPDATE scrape_leases SET status = 'expired' WHERE status = 'active' AND expires_at < NOW()")
+
+            items = await conn.fetch(query, *args)
+            if not items:
+                return {"lease_id": None, "expires_at": None, "items": []}
+
+            expires_at = await conn.fetchval('''
+                INSERT INTO scrape_leases (id, worker_id, kind, platform, item_count, expires_at)
+                VALUES ($1, $2, $3, $4, $5, NOW() + make_interval(secs => $6))
+                RETURNING expires_at
+            ''', lease_id, payload.worker_id, payload.kind, platform, len(items), lease_seconds)
+
+    print(f"📦 Lease {lease_id[:8]} → {payload.worker_id}: {len(items)} {payload.kind} de {platform}")
+    items_json = codec.array_json(codec.filas_json(items, list(items[0].keys())))
+    body = b"".join([
+        b'{"lease_id":', codec.dumps(lease_id),
+        b',"expires_at":', codec.dumps(expires_at.isoformat()),
+        b',"items":', items_json, b"}",
+    ])
+    return Response(content=body, media_type="application/json")
+
+@app.post("/work/complete")
+async def complete_work(payload: WorkCompletePayload):
+    """Cierra un lease: lo que el worker no llegó a enviar se libera para otros"""
+    async with app.db_pool.acquire() as conn:
+        lease = await conn.fetchrow("SELECT kind, platform, status FROM scrape_leases WHERE id = $1", payload.lease_id)
+        if not lease:
+            raise HTTPException(status_code=404, detail="Lease no encontrado")
+
+        table_name = tabla_por_plataforma(lease["platform"])[0] if lease["kind"] == "posts" else "social_accounts"
+        async with conn.transaction():
+            released = await conn.execute(
+                f"UPDATE {table_name} SET lease_id = NULL, leased_until = NULL WHERE lease_id = $1",
+                payload.lease_id
+            )
+            await conn.execute(
+                "UPDATE scrape_leases SET status = 'completed', completed_at = NOW() WHERE id = $1 AND status <> 'completed'",
+                payload.lease_id
+            )
+
+    return {"status": "ok", "lease_id": payload.lease_id, "released": int(released.split()[-1])}
+
+# ---------------------------------------------------------
+# ENDPOINT 7: Exportar lote de PayPal Payouts (CSV en streaming)
+# ---------------------------------------------------------
+@app.post("/payouts/paypal.csv")
+async def export_paypal_payouts(payload: PayoutExportPayload, request: Request):
+    """CSV de PayPal para todos los creadores con saldo >= min_usd.
+
+    Con settle=True liquida el lote en una transacción antes de exportarlo y
+    devuelve su id en X-Payout-Batch (para volver a descargarlo si se corta).
+    """
+    token = request.headers.get("x-admin-token", "")
+    if not PAYOUTS_API_TOKEN or not hmac.compare_digest(token, PAYOUTS_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Token inválido")
+
+    batch_id = payload.batch_id
+    if payload.settle and not batch_id:
+        async with app.db_pool.acquire() as conn:
+            batch_id = await pagos.preparar_lote_paypal(conn, payload.min_usd, payload.paid_by or "api")
+        if not batch_id:
+            return Response(status_code=204)
+        print(f"💸 Lote de pagos {batch_id} liquidado vía API")
+
+    async def generar():
+        async with app.db_pool.acquire() as conn:
+            async for parte in pagos.exportar_paypal(conn, payload.min_usd, batch_id):
+                yield parte.encode()
+
+    headers = {"Content-Disposition": f'attachment; filename="paypal_{batch_id or "preview"}.csv"'}
+    if batch_id:
+        headers["X-Payout-Batch"] = batch_id
+    return StreamingResponse(generar(), media_type="text/csv", headers=headers)
+
 async def start_metrics_server():
     port = int(os.getenv("PORT", 8000))
     config = uvicorn.Config(app, host="0.0.0.0", port=port, log_level="info")
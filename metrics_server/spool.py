@@ -0,0 +1,245 @@
+import asyncio
+import fcntl
+import glob
+import os
+import struct
+import threading
+import time
+import zlib
+
+from metrics_server import codec
+
+# ====================================================
+#   SPOOL EN DISCO PARA /metrics/ingest
+# ====================================================
+# Si Postgres está lento o caído, save_metrics no pierde el scrape de n8n: lo
+# escribe acá y responde 202. Un replayer en segundo plano lo reaplica en
+# bloque cuando la DB vuelve.
+#
+# Formato: segmentos append-only `<ns>-<pid>.seg`, cada registro es
+#   [largo u32][crc32 u32][JSON compacto]
+# El segmento activo lo tiene tomado (flock) el proceso que escribe; solo se
+# reproducen segmentos sellados. El avance de cada segmento se guarda en
+# `<seg>.off` (write + fsync + rename), así que un crash a mitad de replay
+# repite como mucho el último lote, y el upsert es idempotente
+# (guarda por last_scraped_at). Con varios workers de uvicorn todos comparten
+# el directorio: cada uno escribe sus segmentos y cualquiera reproduce los
+# que no están tomados.
+
+SPOOL_DIR = os.getenv("METRICS_SPOOL_DIR", "spool_metrics")
+SEGMENTO_MAX = int(os.getenv("METRICS_SPOOL_SEGMENT_MB", "16")) * 1024 * 1024
+SPOOL_MAX = int(os.getenv("METRICS_SPOOL_MAX_MB", "512")) * 1024 * 1024
+SPOOL_FSYNC = os.getenv("METRICS_SPOOL_FSYNC", "1") == "1"
+REPLAY_LOTE = int(os.getenv("METRICS_SPOOL_REPLAY_BATCH", "500"))  # registros por transacción
+REPLAY_CADA = 2.0
+REPLAY_ESPERA_MAX = 60.0
+
+_CABECERA = struct.Struct("<II")
+REGISTRO_MAX = 64 * 1024 * 1024  # un largo mayor es basura en la cabecera
+
+
+class SpoolLleno(Exception):
+    pass
+
+
+def leer_registros(ruta, desde, maximo):
+    """Hasta `maximo` registros desde el offset. Devuelve (registros, offset_nuevo, corrupto)"""
+    registros = []
+    pos = desde
+    with open(ruta, "rb") as f:
+        f.seek(desde)
+        while len(registros) < maximo:
+            cabecera = f.read(_CABECERA.size)
+            if len(cabecera) < _CABECERA.size:
+                break
+            largo, crc = _CABECERA.unpack(cabecera)
+            if largo > REGISTRO_MAX:
+                return registros, pos, True
+            cuerpo = f.read(largo)
+            if len(cuerpo) < largo:
+                break
+            if zlib.crc32(cuerpo) != crc:
+                return registros, pos, True
+            registros.append(codec.loads(cuerpo))
+            pos += _CABECERA.size + largo
+    return registros, pos, False
+
+
+def _leer_offset(ruta):
+    try:
+        with open(ruta + ".off") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _guardar_offset(ruta, offset):
+    tmp = ruta + ".off.tmp"
+    with open(tmp, "w") as f:
+        f.write(str(offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta + ".off")
+
+
+def _tamano(ruta):
+    try:
+        return os.path.getsize(ruta)
+    except FileNotFoundError:
+        return 0
+
+
+def _borrar(*rutas):
+    for ruta in rutas:
+        try:
+            os.unlink(ruta)
+        except FileNotFoundError:
+            pass
+
+
+class Spool:
+    def __init__(self, directorio=SPOOL_DIR):
+        self.dir = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.Lock()
+        self._fd = None
+        self._ruta = None
+        self._tam = 0
+        self._bytes = 0
+        self._bytes_medido = 0.0
+        # Tras un fallo de la DB, el ingest va directo al spool hasta que el replayer vuelva a escribir
+        self.degradado = False
+        self.contadores = {"guardados": 0, "reproducidos": 0, "corruptos": 0}
+
+    # ---------------------------------------------------------
+    # ESCRITURA
+    # ---------------------------------------------------------
+    def _abrir_segmento(self):
+        ruta = os.path.join(self.dir, f"{time.time_ns():020d}-{os.getpid()}.seg")
+        # Se toma el lock antes de que el archivo sea visible como .seg
+        fd = os.open(ruta + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.rename(ruta + ".tmp", ruta)
+        self._fd, self._ruta, self._tam = fd, ruta, 0
+
+    def _sellar(self):
+        if self._fd is None:
+            return
+        if self._tam == 0:
+            _borrar(self._ruta)
+        os.close(self._fd)  # libera el flock: ya se puede reproducir
+        self._fd, self._ruta, self._tam = None, None, 0
+
+    def rotar(self):
+        """Sella el segmento activo de este proceso"""
+        with self._lock:
+            self._sellar()
+
+    def _escribir(self, datos):
+        with self._lock:
+            if self._fd is None or self._tam >= SEGMENTO_MAX:
+                self._sellar()
+                self._abrir_segmento()
+            try:
+                os.write(self._fd, datos)
+                if SPOOL_FSYNC:
+                    os.fsync(self._fd)
+            except OSError:
+                # Una escritura a medias deja la cola rota: lo que siga va a otro segmento
+                self._sellar()
+                raise
+            self._tam += len(datos)
+            self._bytes += len(datos)
+
+    def bytes_en_disco(self):
+        if time.monotonic() - self._bytes_medido > 1.0:
+            self._bytes = sum(_tamano(r) for r in glob.glob(os.path.join(self.dir, "*.seg")))
+            self._bytes_medido = time.monotonic()
+        return self._bytes
+
+    async def guardar(self, registro):
+        cuerpo = codec.dumps(registro)
+        datos = _CABECERA.pack(len(cuerpo), zlib.crc32(cuerpo)) + cuerpo
+        if self.bytes_en_disco() + len(datos) > SPOOL_MAX:
+            raise SpoolLleno(f"spool lleno ({SPOOL_MAX // (1024 * 1024)} MB)")
+        await asyncio.to_thread(self._escribir, datos)
+        self.contadores["guardados"] += 1
+
+    # ---------------------------------------------------------
+    # REPLAY
+    # ---------------------------------------------------------
+    async def reproducir(self, aplicar):
+        """Reaplica los segmentos sellados con `aplicar(registros)`. Devuelve cuántos registros aplicó.
+
+        Si `aplicar` falla (DB caída) la excepción sube y el offset queda en el último lote bueno.
+        """
+        await asyncio.to_thread(self.rotar)
+        total = 0
+        for ruta in sorted(glob.glob(os.path.join(self.dir, "*.seg"))):
+            try:
+                fd = os.open(ruta, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # otro proceso lo está escribiendo o reproduciendo
+                if os.fstat(fd).st_nlink == 0:
+                    continue  # ya lo terminó otro replayer
+                total += await self._reproducir_segmento(ruta, os.fstat(fd).st_size, aplicar)
+            finally:
+                os.close(fd)
+        return total
+
+    async def _reproducir_segmento(self, ruta, tam, aplicar):
+        offset = _leer_offset(ruta)
+        aplicados = 0
+        while True:
+            registros, nuevo, corrupto = await asyncio.to_thread(leer_registros, ruta, offset, REPLAY_LOTE)
+            if registros:
+                await aplicar(registros)
+                await asyncio.to_thread(_guardar_offset, ruta, nuevo)
+                offset = nuevo
+                aplicados += len(registros)
+                self.contadores["reproducidos"] += len(registros)
+            if corrupto or (not registros and offset < tam):
+                # Checksum malo o cola cortada por un crash: lo válido ya se aplicó
+                self.contadores["corruptos"] += 1
+                print(f"⚠️ Spool: {os.path.basename(ruta)} dañado desde el byte {offset}, se aparta como .corrupto")
+                os.replace(ruta, ruta + ".corrupto")
+                _borrar(ruta + ".off")
+                return aplicados
+            if not registros:
+                break
+        _borrar(ruta, ruta + ".off")
+        return aplicados
+
+    async def bucle(self, aplicar):
+        """Replayer en segundo plano: reintenta con espera creciente mientras la DB no responda"""
+        espera = REPLAY_CADA
+        while True:
+            await asyncio.sleep(espera)
+            try:
+                aplicados = await self.reproducir(aplicar)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                espera = min(espera * 2, REPLAY_ESPERA_MAX)
+                print(f"⚠️ Spool: la DB sigue sin aceptar el replay ({type(e).__name__}: {e}), reintento en {espera:.0f}s")
+                continue
+            espera = REPLAY_CADA
+            if aplicados:
+                print(f"♻️ Spool: {aplicados} envíos de métricas reaplicados")
+            self.degradado = False
+
+    def metricas(self):
+        return {
+            "degradado": self.degradado,
+            "bytes": self.bytes_en_disco(),
+            "segmentos": len(glob.glob(os.path.join(self.dir, "*.seg"))),
+            **self.contadores,
+        }
+
+    def cerrar(self):
+        self.rotar()
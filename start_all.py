@@ -1,25 +1,154 @@
+import argparse
 import asyncio
-from bots.main import main_bot
-from bots.main2 import admin_bot
-from bots.main3 import bot as equipos_bot
-
-# ✔ Import corregido
-from metrics_server.metrics_server import start_metrics_server
-
 import os
+import signal
+import sys
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Servicios que corre el supervisor, cada uno en su propio proceso
+SERVICIOS = {
+    "metrics": None,
+    "main": "DISCORD_MAIN_BOT_TOKEN",
+    "admin": "DISCORD_ADMIN_BOT_TOKEN",
+    "equipos": "DISCORD_EQUIPOS_BOT_TOKEN",
+}
+
+# Reinicios: espera exponencial entre BACKOFF_BASE y BACKOFF_MAX segundos; si el
+# hijo aguantó RESTART_RESET_S vivo, el contador vuelve a cero
+BACKOFF_BASE = float(os.getenv("SUPERVISOR_BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.getenv("SUPERVISOR_BACKOFF_MAX", "60"))
+RESTART_RESET_S = float(os.getenv("SUPERVISOR_RESET_S", "300"))
+# Cuánto esperamos a que un hijo cierre solo antes de matarlo
+STOP_TIMEOUT = float(os.getenv("SUPERVISOR_STOP_TIMEOUT", "20"))
+
+
+def instalar_uvloop():
+    """Usa uvloop si está instalado (USE_UVLOOP=0 para desactivarlo)"""
+    if os.getenv("USE_UVLOOP", "1") == "0":
+        return False
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+async def iniciar_servicio(nombre):
+    """Corre un único servicio hasta que termine (importa solo lo que necesita)"""
+    if nombre == "metrics":
+        from metrics_server.metrics_server import start_metrics_server
+        await start_metrics_server()
+        return
+
+    if nombre == "main":
+        from bots.main import main_bot as bot
+    elif nombre == "admin":
+        from bots.main2 import admin_bot as bot
+    else:
+        from bots.main3 import bot
+
+    async with bot:
+        await bot.start(os.getenv(SERVICIOS[nombre]))
+
+
+# ====================================================
+#   MODO 1: TODO EN UN PROCESO (deploys chicos)
+# ====================================================
 async def run_all_bots():
     print("🚀 Iniciando los 3 bots + metrics_server…")
+    await asyncio.gather(*(iniciar_servicio(nombre) for nombre in SERVICIOS))
+
 
-    task0 = asyncio.create_task(start_metrics_server())
-    task1 = asyncio.create_task(main_bot.start(os.getenv("DISCORD_MAIN_BOT_TOKEN")))
-    task2 = asyncio.create_task(admin_bot.start(os.getenv("DISCORD_ADMIN_BOT_TOKEN")))
-    task3 = asyncio.create_task(equipos_bot.start(os.getenv("DISCORD_EQUIPOS_BOT_TOKEN")))
+# ====================================================
+#   MODO 2: UN SERVICIO SOLO (lo que lanza el supervisor)
+# ====================================================
+async def run_solo(nombre):
+    tarea = asyncio.ensure_future(iniciar_servicio(nombre))
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, tarea.cancel)
+    try:
+        await tarea
+    except asyncio.CancelledError:
+        print(f"🛑 {nombre} detenido")
+
+
+# ====================================================
+#   MODO 3: SUPERVISOR (un proceso por bot + metrics)
+# ====================================================
+async def supervisar(nombre, procesos, parar):
+    intentos = 0
+    while not parar.is_set():
+        inicio = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), "--solo", nombre)
+        procesos[nombre] = proc
+        print(f"▶️ {nombre} iniciado (pid {proc.pid})")
+        codigo = await proc.wait()
+        procesos.pop(nombre, None)
+        if parar.is_set():
+            break
+
+        if time.monotonic() - inicio >= RESTART_RESET_S:
+            intentos = 0
+        espera = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** intentos)
+        intentos += 1
+        print(f"💥 {nombre} terminó con código {codigo}; reinicio #{intentos} en {espera:.0f}s")
+        try:
+            await asyncio.wait_for(parar.wait(), espera)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_supervisor(nombres):
+    print(f"🧭 Supervisor: {', '.join(nombres)} en procesos separados")
+    procesos = {}
+    parar = asyncio.Event()
+
+    def reenviar(sig):
+        print(f"🛑 Señal {sig.name}: deteniendo servicios…")
+        parar.set()
+        for proc in list(procesos.values()):
+            if proc.returncode is None:
+                proc.send_signal(sig)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, reenviar, sig)
+
+    vigilantes = [asyncio.create_task(supervisar(n, procesos, parar)) for n in nombres]
+    await parar.wait()
+
+    # Esperamos el cierre ordenado; el que no termine a tiempo se mata
+    vivos = [p for p in procesos.values() if p.returncode is None]
+    if vivos:
+        await asyncio.wait([asyncio.create_task(p.wait()) for p in vivos], timeout=STOP_TIMEOUT)
+        for proc in vivos:
+            if proc.returncode is None:
+                print(f"🔪 Matando pid {proc.pid} (no cerró en {STOP_TIMEOUT:.0f}s)")
+                proc.kill()
+                await proc.wait()
+    await asyncio.gather(*vigilantes, return_exceptions=True)
+    print("👋 Supervisor detenido")
 
-    await asyncio.gather(task0, task1, task2, task3)
 
 if __name__ == "__main__":
-    asyncio.run(run_all_bots())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Arranca los bots y el metrics_server")
+    parser.add_argument("--supervisor", action="store_true", default=os.getenv("START_MODE") == "supervisor",
+                        help="Un proceso por servicio, con reinicio automático")
+    parser.add_argument("--solo", choices=list(SERVICIOS), help="Corre un único servicio")
+    args = parser.parse_args()
+
+    if instalar_uvloop():
+        print("⚡ uvloop activado")
+
+    if args.solo:
+        asyncio.run(run_solo(args.solo))
+    elif args.supervisor:
+        servicios = [s.strip() for s in os.getenv("SUPERVISOR_SERVICES", ",".join(SERVICIOS)).split(",") if s.strip() in SERVICIOS]
+        asyncio.run(run_supervisor(servicios))
+    else:
+        asyncio.run(run_all_bots())
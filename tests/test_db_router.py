@@ -0,0 +1,235 @@
+"""RouterDB (bots/db.py): lecturas a la réplica, con vuelta al primario.
+
+Los tests con pools falsos corren siempre. Los de integración necesitan dos
+Postgres (o dos schemas del mismo) y se saltan si no están las variables:
+
+    TEST_DATABASE_URL=postgresql://localhost/primario \\
+    TEST_DATABASE_REPLICA_URL=postgresql://localhost:5433/replica \\
+    python -m pytest tests/test_db_router.py
+
+Para usar un solo servidor alcanza con dos DSN que apunten a schemas
+distintos, ej. `...?search_path=replica` (asyncpg pasa el parámetro como
+server setting).
+"""
+import asyncio
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+import asyncpg
+import pytest
+
+from bots import db
+
+PRIMARIO_DSN = os.getenv("TEST_DATABASE_URL")
+REPLICA_DSN = os.getenv("TEST_DATABASE_REPLICA_URL")
+
+
+# ---------------------------------------------------------
+# POOLS FALSOS
+# ---------------------------------------------------------
+class PoolFalso:
+    def __init__(self, nombre, lag=0.0, caido=False):
+        self.nombre = nombre
+        self.lag = lag
+        self.caido = caido
+        self.cerrado = False
+
+    @asynccontextmanager
+    async def _ctx(self):
+        yield self.nombre
+
+    def acquire(self, timeout=None):
+        if self.caido:
+            raise OSError("connection refused")
+        if timeout is not None:
+            # RouterDB usa `await acquire(timeout=...)` + release en la réplica
+            async def conexion():
+                return self.nombre
+            return conexion()
+        return self._ctx()
+
+    async def release(self, conn):
+        pass
+
+    async def fetchval(self, query, *args):
+        # En el primario es el LSN actual, en la réplica el atraso (None = sin WAL receiver)
+        if self.caido:
+            raise OSError("connection refused")
+        return self.lag
+
+    async def close(self):
+        self.cerrado = True
+
+
+def router_falso(monkeypatch, lag=0.0, caido=False, max_lag=5):
+    replica = PoolFalso("replica", lag=lag, caido=caido)
+
+    async def crear_pool(*args, **kwargs):
+        if replica.caido:
+            raise OSError("connection refused")
+        return replica
+
+    monkeypatch.setattr(db.asyncpg, "create_pool", crear_pool)
+    return db.RouterDB(PoolFalso("primario"), "postgresql://replica", max_lag=max_lag), replica
+
+
+async def leer(router, **kwargs):
+    async with router.acquire_lectura(**kwargs) as conn:
+        return conn
+
+
+def test_lectura_va_a_la_replica(monkeypatch):
+    router, _ = router_falso(monkeypatch, lag=1.0)
+    assert asyncio.run(leer(router)) == "replica"
+    assert router.contadores["replica"] == 1
+
+
+def test_escrituras_siguen_en_el_primario(monkeypatch):
+    router, _ = router_falso(monkeypatch)
+
+    async def escribir():
+        async with router.acquire() as conn:
+            return conn
+
+    assert asyncio.run(escribir()) == "primario"
+
+
+def test_replica_atrasada_lee_del_primario(monkeypatch):
+    router, _ = router_falso(monkeypatch, lag=10.0, max_lag=5)
+    assert asyncio.run(leer(router)) == "primario"
+    assert router.contadores["primario_por_lag"] == 1
+
+
+def test_max_lag_por_llamada(monkeypatch):
+    router, _ = router_falso(monkeypatch, lag=1.0)
+
+    async def ambas():
+        return await leer(router), await leer(router, max_lag=0)
+
+    assert asyncio.run(ambas()) == ("replica", "primario")
+
+
+def test_replica_caida_lee_del_primario_y_espera_para_reintentar(monkeypatch):
+    router, replica = router_falso(monkeypatch, caido=True)
+
+    async def escenario():
+        primera = await leer(router)
+        # Vuelve, pero seguimos en el primario hasta que pase REPLICA_RETRY_AFTER
+        replica.caido = False
+        segunda = await leer(router)
+        router._caida_hasta = 0.0
+        tercera = await leer(router)
+        return primera, segunda, tercera
+
+    assert asyncio.run(escenario()) == ("primario", "primario", "replica")
+    assert router.contadores["primario_por_caida"] == 2
+
+
+def test_replica_sin_wal_receiver_cuenta_como_caida(monkeypatch):
+    # Perdió al primario: reprodujo todo lo recibido pero sus datos son viejos
+    router, _ = router_falso(monkeypatch, lag=None)
+    assert asyncio.run(leer(router)) == "primario"
+    assert router.contadores["primario_por_caida"] == 1
+    assert router.estado().startswith("🔴")
+
+
+def test_replica_se_cae_despues_de_medir(monkeypatch):
+    router, replica = router_falso(monkeypatch, lag=0.5)
+
+    async def escenario():
+        antes = await leer(router)
+        replica.caido = True  # el lag sigue cacheado, pero acquire falla
+        despues = await leer(router)
+        return antes, despues
+
+    assert asyncio.run(escenario()) == ("replica", "primario")
+    assert router.estado().startswith("🔴")
+
+
+def test_sin_replica_todo_al_primario():
+    router = db.RouterDB(PoolFalso("primario"))
+    assert asyncio.run(leer(router)) == "primario"
+    assert router.estado() == "sin réplica"
+
+
+# ---------------------------------------------------------
+# INTEGRACIÓN (dos Postgres o dos schemas)
+# ---------------------------------------------------------
+requiere_postgres = pytest.mark.skipif(
+    not (PRIMARIO_DSN and REPLICA_DSN),
+    reason="TEST_DATABASE_URL y TEST_DATABASE_REPLICA_URL no configuradas"
+)
+
+
+@asynccontextmanager
+async def dos_bases(max_lag=5, replica_dsn=None):
+    """Una tabla con el mismo nombre en cada base, marcada con su origen"""
+    tabla = f"router_test_{uuid.uuid4().hex[:8]}"
+    for dsn, origen in ((PRIMARIO_DSN, "primario"), (REPLICA_DSN, "replica")):
+        conn = await asyncpg.connect(dsn)
+        try:
+            await conn.execute(f"CREATE TABLE {tabla} (origen TEXT)")
+            await conn.execute(f"INSERT INTO {tabla} VALUES ($1)", origen)
+        finally:
+            await conn.close()
+
+    router = await db.crear_router(PRIMARIO_DSN, replica_dsn or REPLICA_DSN, max_lag=max_lag, min_size=1, max_size=2)
+    try:
+        yield router, tabla
+    finally:
+        await router.close()
+        for dsn in (PRIMARIO_DSN, REPLICA_DSN):
+            conn = await asyncpg.connect(dsn)
+            try:
+                await conn.execute(f"DROP TABLE IF EXISTS {tabla}")
+            finally:
+                await conn.close()
+
+
+@requiere_postgres
+def test_pg_lecturas_en_replica_y_escrituras_en_primario():
+    async def escenario():
+        async with dos_bases() as (router, tabla):
+            async with router.acquire_lectura() as conn:
+                leida = await conn.fetchval(f"SELECT origen FROM {tabla}")
+            async with router.acquire() as conn:
+                escrita = await conn.fetchval(f"SELECT origen FROM {tabla}")
+            return leida, escrita
+
+    assert asyncio.run(escenario()) == ("replica", "primario")
+
+
+@requiere_postgres
+def test_pg_replica_es_de_solo_lectura():
+    async def escenario():
+        async with dos_bases() as (router, tabla):
+            async with router.acquire_lectura() as conn:
+                await conn.execute(f"INSERT INTO {tabla} VALUES ('x')")
+
+    with pytest.raises(asyncpg.ReadOnlySQLTransactionError):
+        asyncio.run(escenario())
+
+
+@requiere_postgres
+def test_pg_lag_sobre_el_limite_vuelve_al_primario():
+    async def escenario():
+        # LAG_SQL da 0 en un servidor que no es standby: con max_lag < 0 siempre está "atrasada"
+        async with dos_bases(max_lag=-1) as (router, tabla):
+            async with router.acquire_lectura() as conn:
+                return await conn.fetchval(f"SELECT origen FROM {tabla}"), router.lag
+
+    origen, lag = asyncio.run(escenario())
+    assert origen == "primario"
+    assert lag == 0
+
+
+@requiere_postgres
+def test_pg_replica_caida_vuelve_al_primario():
+    async def escenario():
+        # Puerto sin nadie escuchando: la réplica nunca conecta
+        async with dos_bases(replica_dsn="postgresql://127.0.0.1:1/nada") as (router, tabla):
+            async with router.acquire_lectura() as conn:
+                return await conn.fetchval(f"SELECT origen FROM {tabla}")
+
+    assert asyncio.run(escenario()) == "primario"
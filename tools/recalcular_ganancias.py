@@ -0,0 +1,341 @@
+"""Recalcula final_earned_usd de todos los posts con NumPy y lo concilia con la DB.
+
+Uso:
+  python -m tools.recalcular_ganancias                      # solo reporte, no toca nada
+  python -m tools.recalcular_ganancias --aplicar            # además corrige las diferencias
+  python -m tools.recalcular_ganancias --modelo stats       # reglas de /stats (payment_rates)
+  python -m tools.recalcular_ganancias --autoprueba 500000  # NumPy vs Decimal, sin DB
+
+Modelos (las reglas exactas están en common/ganancias.py):
+  ingest -> lo que guardan /metrics/ingest (TARIFA_INGEST_1K por cada 1k) y
+            el bounty_loop (bounty_rates: amount_usd cada per_views desde
+            starting_views, a 4 decimales) para posts en bounty con tarifa.
+  stats  -> lo que muestra /stats: por cada 1k con la tarifa del tag en
+            payment_rates si el post está en bounty, si no la STANDARD.
+
+Los posts se leen por tramos de id ya en columnas (array_agg), y todo el
+cálculo es aritmética entera en nano-USD (1e-9): las tarifas se escalan a
+micro-USD (deben tener <= 6 decimales) y el redondeo a 4 decimales del
+bounty es half-even exacto con divmod, igual que el Decimal de referencia.
+Las correcciones se aplican por lote con unnest y solo si views/starting_views
+no cambiaron desde la lectura (el ingest puede estar corriendo).
+
+Necesita numpy (en requirements.txt).
+"""
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import time
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    sys.exit("❌ Esta herramienta necesita numpy: pip install numpy")
+
+from common import ganancias
+from common.pagos import TABLAS_POSTS
+
+NANO = 10 ** 9
+MICRO = 10 ** 6
+BOUNTY_A_NANO = NANO // 10 ** 4   # unidades de 1e-4 -> 1e-9
+INT64_MAX = int(np.iinfo(np.int64).max)
+
+
+# ---------- Aritmética vectorizada ----------
+
+def a_micro(valor) -> int:
+    """Tarifa NUMERIC -> micro-USD exacto (falla si tiene más de 6 decimales)"""
+    escalado = Decimal(valor) * MICRO
+    if escalado != escalado.to_integral_value():
+        raise ValueError(f"La tarifa {valor} tiene más de 6 decimales; no se puede escalar exacto")
+    return int(escalado)
+
+
+def _riesgo(estimado):
+    """Filas cuyo resultado podría no entrar en int64 (cota en float, con margen)"""
+    return estimado > 2.0 ** 62
+
+
+def _con_desbordes(resultado, filas, calcular):
+    """Recalcula con int de Python las filas marcadas; el array pasa a object solo si hace falta"""
+    if not filas.any():
+        return resultado
+    resultado = resultado.astype(object)
+    for i in np.flatnonzero(filas):
+        resultado[i] = calcular(int(i))
+    return resultado
+
+
+def _half_even(n: int, d: int) -> int:
+    q, r = divmod(n, d)
+    return q + (2 * r > d or (2 * r == d and q % 2 == 1))
+
+
+def nano_por_mil(views, tarifa_micro):
+    """views / 1000 * tarifa, en nano-USD: views * tarifa_micro (exacto)"""
+    views = np.maximum(views, 0)
+    tarifa = np.broadcast_to(np.asarray(tarifa_micro, dtype=np.int64), views.shape)
+    grandes = _riesgo(views.astype(np.float64) * tarifa)
+    resultado = np.where(grandes, 0, views) * tarifa
+    return _con_desbordes(resultado, grandes, lambda i: int(views[i]) * int(tarifa[i]))
+
+
+def nano_bounty(views, starting, amount_micro, per_views):
+    """round_half_even(ganadas * amount / per, 4 decimales), en nano-USD"""
+    ganadas = np.maximum(views - starting, 0)
+    per = np.maximum(per_views, 1)
+    # n = ganadas * amount (micro-USD * vistas) y el resultado final ~ n * 1000 / per
+    grandes = _riesgo(ganadas.astype(np.float64) * amount_micro * np.maximum(1000.0 / per, 1.0))
+    n = np.where(grandes, 0, ganadas) * amount_micro
+    d = per * 100  # n / d queda en unidades de 1e-4 USD
+    q, r = np.divmod(n, d)
+    doble = 2 * r
+    q = q + ((doble > d) | ((doble == d) & (q % 2 == 1)))
+    resultado = q * BOUNTY_A_NANO
+    return _con_desbordes(
+        resultado, grandes,
+        lambda i: _half_even(int(ganadas[i]) * int(amount_micro[i]), int(d[i])) * BOUNTY_A_NANO
+    )
+
+
+def esperado_nano(cols, modelo, tarifa_ingest_micro, tarifa_std_micro):
+    """Ganancia esperada por fila (nano-USD) según el modelo"""
+    views, starting = cols["views"], cols["starting"]
+    if modelo == "ingest":
+        bounty = cols["is_bounty"] & (cols["amount_micro"] >= 0) & (cols["per_views"] > 0)
+        por_bounty = nano_bounty(views, starting, np.maximum(cols["amount_micro"], 0), cols["per_views"])
+        return np.where(bounty, por_bounty, nano_por_mil(views, tarifa_ingest_micro))
+    con_tag = cols["is_bounty"] & (cols["tag_rate_micro"] >= 0)
+    return nano_por_mil(views, np.where(con_tag, cols["tag_rate_micro"], tarifa_std_micro))
+
+
+def nano_a_decimal(nano) -> Decimal:
+    return Decimal(int(nano)).scaleb(-9)
+
+
+# ---------- Lectura por tramos en columnas ----------
+
+def consulta_tramo(tabla):
+    # Un solo round-trip por tramo: cada columna llega como un array
+    return f'''
+        SELECT array_agg(p.id ORDER BY p.id) AS id,
+               array_agg(COALESCE(p.views, 0)::bigint ORDER BY p.id) AS views,
+               array_agg(COALESCE(p.starting_views, 0)::bigint ORDER BY p.id) AS starting,
+               array_agg(COALESCE(p.is_bounty, FALSE) ORDER BY p.id) AS is_bounty,
+               array_agg(COALESCE(round(br.amount_usd * 1000000), -1)::bigint ORDER BY p.id) AS amount_micro,
+               array_agg(COALESCE(br.per_views, 0)::bigint ORDER BY p.id) AS per_views,
+               array_agg(COALESCE(round(pr.amount_per_1k * 1000000), -1)::bigint ORDER BY p.id) AS tag_rate_micro,
+               array_agg(round(COALESCE(p.final_earned_usd, 0) * 1000000000)::bigint ORDER BY p.id) AS guardado,
+               array_agg(round(COALESCE(p.settled_usd, 0) * 1000000000)::bigint ORDER BY p.id) AS liquidado
+        FROM (SELECT * FROM {tabla} WHERE id > $1 ORDER BY id LIMIT $2) p
+        LEFT JOIN bounty_rates br ON br.bounty_tag = p.bounty_tag
+        LEFT JOIN payment_rates pr ON pr.rate_key = upper(trim(p.bounty_tag))
+    '''
+
+
+async def tramos(conn, tabla, lote):
+    consulta = consulta_tramo(tabla)
+    ultimo = 0
+    while True:
+        fila = await conn.fetchrow(consulta, ultimo, lote)
+        if not fila["id"]:
+            return
+        cols = {
+            "id": np.array(fila["id"], dtype=np.int64),
+            "views": np.array(fila["views"], dtype=np.int64),
+            "starting": np.array(fila["starting"], dtype=np.int64),
+            "is_bounty": np.array(fila["is_bounty"], dtype=bool),
+            "amount_micro": np.array(fila["amount_micro"], dtype=np.int64),
+            "per_views": np.array(fila["per_views"], dtype=np.int64),
+            "tag_rate_micro": np.array(fila["tag_rate_micro"], dtype=np.int64),
+            "guardado": np.array(fila["guardado"], dtype=np.int64),
+            "liquidado": np.array(fila["liquidado"], dtype=np.int64),
+        }
+        yield cols
+        ultimo = int(cols["id"][-1])
+
+
+async def validar_tarifas(conn):
+    """Todas las tarifas tienen que poder escalarse exacto a micro-USD"""
+    for r in await conn.fetch("SELECT bounty_tag AS tag, amount_usd AS valor FROM bounty_rates WHERE amount_usd IS NOT NULL "
+                              "UNION ALL SELECT rate_key, amount_per_1k FROM payment_rates WHERE amount_per_1k IS NOT NULL"):
+        try:
+            a_micro(r["valor"])
+        except ValueError as e:
+            raise SystemExit(f"❌ {r['tag']}: {e}")
+
+
+async def aplicar_correcciones(conn, tabla, ids, views, starting, nanos):
+    # Solo si el post no cambió desde que lo leímos (el ingest puede haberlo tocado)
+    resultado = await conn.fetch(f'''
+        UPDATE {tabla} t
+        SET final_earned_usd = round(r.nano::numeric / 1000000000, 9)
+        FROM unnest($1::int[], $2::bigint[], $3::bigint[], $4::bigint[]) AS r(id, views, starting, nano)
+        WHERE t.id = r.id
+          AND COALESCE(t.views, 0) = r.views
+          AND COALESCE(t.starting_views, 0) = r.starting
+        RETURNING t.id
+    ''', ids, views, starting, nanos)
+    return len(resultado)
+
+
+async def conciliar(args):
+    import asyncpg
+
+    conn = await asyncpg.connect(os.getenv("DATABASE_URL"), ssl=os.getenv("DATABASE_SSL", "require"))
+    try:
+        await validar_tarifas(conn)
+        tarifa_ingest = a_micro(ganancias.TARIFA_INGEST_1K)
+        std = await conn.fetchval("SELECT amount_per_1k FROM payment_rates WHERE rate_key = 'STANDARD'")
+        tarifa_std = a_micro(std if std is not None else ganancias.TARIFA_STANDARD_DEFAULT)
+        tolerancia = int(Decimal(args.tolerancia) * NANO)
+
+        reporte = open(args.reporte, "w", newline="") if args.reporte else None
+        escritor = csv.writer(reporte) if reporte else None
+        if escritor:
+            escritor.writerow(["tabla", "id", "discord_id", "url", "views", "guardado_usd", "esperado_usd", "delta_usd", "bajo_liquidado"])
+
+        print(f"🧮 Conciliando con el modelo '{args.modelo}' (lotes de {args.lote:,}, tolerancia ${args.tolerancia})\n")
+        print(f"  {'tabla':<26} {'filas':>10} {'difieren':>9} {'Δ total USD':>14} {'bajo liq.':>9} {'corregidas':>10} {'filas/s':>10}")
+        total_difieren = 0
+        for plataforma in args.plataformas:
+            tabla, url_col = TABLAS_POSTS[plataforma]
+            inicio = time.perf_counter()
+            filas = difieren = bajo_liquidado = corregidas = 0
+            delta_total = 0
+
+            async for cols in tramos(conn, tabla, args.lote):
+                esperado = esperado_nano(cols, args.modelo, tarifa_ingest, tarifa_std)
+                delta = esperado - cols["guardado"]
+                malas = np.flatnonzero(np.abs(delta) > tolerancia)
+                filas += len(cols["id"])
+                if not len(malas):
+                    continue
+
+                difieren += len(malas)
+                delta_total += int(sum(int(x) for x in delta[malas]))
+                bajo = esperado[malas] < cols["liquidado"][malas]
+                bajo_liquidado += int(np.count_nonzero(bajo))
+                ids = [int(x) for x in cols["id"][malas]]
+
+                if escritor:
+                    info = {r["id"]: r for r in await conn.fetch(
+                        f"SELECT id, discord_id, {url_col} AS url FROM {tabla} WHERE id = ANY($1::int[])", ids
+                    )}
+                    for k, i in enumerate(malas):
+                        r = info.get(ids[k])
+                        escritor.writerow([
+                            tabla, ids[k], r["discord_id"] if r else "", r["url"] if r else "", int(cols["views"][i]),
+                            f"{nano_a_decimal(cols['guardado'][i]):f}", f"{nano_a_decimal(esperado[i]):f}",
+                            f"{nano_a_decimal(delta[i]):f}", bool(bajo[k]),
+                        ])
+
+                if args.aplicar:
+                    corregidas += await aplicar_correcciones(
+                        conn, tabla, ids,
+                        [int(x) for x in cols["views"][malas]], [int(x) for x in cols["starting"][malas]],
+                        [int(x) for x in esperado[malas]]
+                    )
+
+            segundos = time.perf_counter() - inicio
+            total_difieren += difieren
+            print(f"  {tabla:<26} {filas:>10,} {difieren:>9,} {nano_a_decimal(delta_total):>14.4f} "
+                  f"{bajo_liquidado:>9,} {corregidas:>10,} {filas / segundos if segundos else 0:>10,.0f}")
+
+        if reporte:
+            reporte.close()
+            print(f"\n📄 Reporte de diferencias: {args.reporte}")
+        if total_difieren and not args.aplicar:
+            print("ℹ️ Nada se modificó. Corre con --aplicar para corregir.")
+    finally:
+        await conn.close()
+
+
+# ---------- Autoprueba contra la referencia Decimal ----------
+
+def autoprueba(n, semilla):
+    """Corpus sintético (más casos borde) calculado con NumPy y con Decimal"""
+    rng = np.random.default_rng(semilla)
+    views = rng.integers(0, 50_000_000, n, dtype=np.int64)
+    starting = np.where(rng.random(n) < 0.7, rng.integers(0, 5_000_000, n), 0).astype(np.int64)
+    amount_micro = rng.integers(1, 100 * MICRO, n, dtype=np.int64)
+    amount_micro[: n // 4] = rng.choice([250_000, 500_000, 1_000_000, 2_500_000, 5_000_000], n // 4)
+    per_views = rng.choice([1, 3, 7, 100, 1000, 10_000, 100_000, 1_000_000], n).astype(np.int64)
+    is_bounty = rng.random(n) < 0.5
+    amount_micro[rng.random(n) < 0.1] = -1      # bounty sin tarifa -> cae al modelo por 1k
+    tag_rate = np.where(rng.random(n) < 0.6, rng.integers(1, 20 * MICRO, n), -1).astype(np.int64)
+
+    # Casos borde: empates exactos a 4 decimales, vistas bajo starting, desbordes de int64
+    # (views, starting, amount_micro, per_views, is_bounty)
+    bordes = [
+        (1, 0, 50, 1, True),                     # 0.00005  -> empate, queda 0.0000
+        (3, 0, 50, 1, True),                     # 0.00015  -> empate, sube a 0.0002
+        (5, 0, 100, 2, True),                    # 0.00025  -> empate, queda 0.0002
+        (7, 0, 100, 2, True),                    # 0.00035  -> empate, sube a 0.0004
+        (100, 500, 1_000_000, 10, True),         # views < starting -> 0
+        (2_000_000_000, 0, 99_999_999, 1, True), # resultado en nano-USD fuera de int64
+    ]
+    for k, (v, s, a, p, b) in enumerate(bordes):
+        views[k], starting[k], amount_micro[k], per_views[k], is_bounty[k] = v, s, a, p, b
+    views[len(bordes)] = INT64_MAX // 1000  # per-1k que desborda
+    tag_rate[len(bordes)] = 19 * MICRO
+    is_bounty[len(bordes)] = True
+
+    cols = {"views": views, "starting": starting, "is_bounty": is_bounty, "amount_micro": amount_micro,
+            "per_views": per_views, "tag_rate_micro": tag_rate}
+    tarifa_ingest = a_micro(ganancias.TARIFA_INGEST_1K)
+    tarifa_std = a_micro(ganancias.TARIFA_STANDARD_DEFAULT)
+
+    ok = True
+    for modelo in ("ingest", "stats"):
+        inicio = time.perf_counter()
+        vectorizado = esperado_nano(cols, modelo, tarifa_ingest, tarifa_std)
+        t_numpy = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        fallas = 0
+        for i in range(n):
+            v, s, b = int(views[i]), int(starting[i]), bool(is_bounty[i])
+            if modelo == "ingest":
+                if b and amount_micro[i] >= 0 and per_views[i] > 0:
+                    ref = ganancias.ganancia_bounty(v, s, Decimal(int(amount_micro[i])) / MICRO, int(per_views[i]))
+                else:
+                    ref = ganancias.ganancia_por_mil(v, ganancias.TARIFA_INGEST_1K)
+            else:
+                tarifa = Decimal(int(tag_rate[i])) / MICRO if b and tag_rate[i] >= 0 else ganancias.TARIFA_STANDARD_DEFAULT
+                ref = ganancias.ganancia_por_mil(v, tarifa)
+            if int(ref * NANO) != int(vectorizado[i]) or ref * NANO != int(ref * NANO):
+                fallas += 1
+                if fallas <= 5:
+                    print(f"  ❌ fila {i}: numpy={nano_a_decimal(vectorizado[i])} decimal={ref}")
+        t_decimal = time.perf_counter() - inicio
+
+        ok &= fallas == 0
+        print(f"  {modelo:<7} {n:>10,} filas · {'✅ idéntico' if not fallas else f'❌ {fallas} diferencias'} · "
+              f"numpy {t_numpy * 1000:8.1f} ms · Decimal {t_decimal * 1000:9.1f} ms · x{t_decimal / max(t_numpy, 1e-9):,.0f}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula y concilia final_earned_usd")
+    parser.add_argument("--modelo", choices=("ingest", "stats"), default="ingest")
+    parser.add_argument("--plataformas", nargs="+", choices=list(TABLAS_POSTS), default=list(TABLAS_POSTS))
+    parser.add_argument("--lote", type=int, default=50_000, help="Filas por tramo")
+    parser.add_argument("--tolerancia", default="0.000001", help="Diferencia en USD que se ignora")
+    parser.add_argument("--reporte", default="diferencias_ganancias.csv", help="CSV de diferencias ('' para no escribir)")
+    parser.add_argument("--aplicar", action="store_true", help="Escribe los valores recalculados")
+    parser.add_argument("--autoprueba", type=int, metavar="N", help="Solo valida NumPy vs Decimal con N filas sintéticas")
+    parser.add_argument("--semilla", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.autoprueba:
+        print(f"🧪 Autoprueba NumPy vs Decimal ({args.autoprueba:,} filas)\n")
+        sys.exit(0 if autoprueba(args.autoprueba, args.semilla) else 1)
+    asyncio.run(conciliar(args))
+
+
+if __name__ == "__main__":
+    main()